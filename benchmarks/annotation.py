@@ -0,0 +1,91 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+Compares the throughput of
+:py:func:`betrack.commands.annotatevideo.AnnotateVideo.draw_particles`, which
+draws cached sprites, with previous implementations that filtered the trajectories
+of a frame once for each particle, or rasterized the identity and the position of
+each particle on every frame, when drawing synthetic particles on full HD frames.
+
+Usage:
+  python benchmarks/annotation.py [<nframes>] [<nparticles>]
+"""
+
+from __future__ import print_function
+
+from sys   import argv
+from time  import time
+from numpy import zeros, uint8, isin
+from numpy.random import RandomState
+from cv2   import putText, circle, LINE_AA
+import pandas
+
+from betrack.commands.annotatevideo import AnnotateVideo
+
+
+SHAPE = (1080, 1920, 3)
+
+
+def make_frames(nframes, nparticles, seed=0):
+    rs = RandomState(seed)
+    frames = []
+    for t in range(0, nframes):
+        df             = pandas.DataFrame({'y': rs.uniform(0, SHAPE[0], nparticles),
+                                           'x': rs.uniform(0, SHAPE[1], nparticles)})
+        df['frame']    = t
+        df['particle'] = range(0, nparticles)
+        frames.append(df)
+    return frames
+
+
+def draw_by_filter(av, frame, df, particles):
+    if particles: df = df[df['particle'].isin(particles)]
+    for p in df['particle']:
+        pos = tuple(df[df['particle'] == p][['x','y']].astype(int).values[0])
+        putText(frame, str(p), (pos[0] + 3, pos[1] + 3), av.textfont,
+                av.textfontscale, av.particlecolor, av.linethickness,
+                lineType=LINE_AA, bottomLeftOrigin=True)
+        circle(frame, pos, av.particleradius, av.particlecolor,
+               thickness=-1, lineType=LINE_AA)
+
+
+def draw_by_text(av, frame, df, particles):
+    ids = df['particle'].values.astype(int)
+    pos = df[['x', 'y']].values.astype(int)
+    if particles:
+        keep     = isin(ids, particles)
+        ids, pos = ids[keep], pos[keep]
+    for p, (x, y) in zip(ids.tolist(), pos.tolist()):
+        putText(frame, str(p), (x + 3, y + 3), av.textfont,
+                av.textfontscale, av.particlecolor, av.linethickness,
+                lineType=LINE_AA, bottomLeftOrigin=True)
+        circle(frame, (x, y), av.particleradius, av.particlecolor,
+               thickness=-1, lineType=LINE_AA)
+
+
+def benchmark(draw, frames, particles):
+    image = zeros(SHAPE, dtype=uint8)
+    t0    = time()
+    for df in frames: draw(image, df, particles)
+    return len(frames) / (time() - t0)
+
+
+if __name__ == '__main__':
+    nframes    = int(argv[1]) if len(argv) > 1 else 20
+    nparticles = int(argv[2]) if len(argv) > 2 else 1000
+    frames     = make_frames(nframes, nparticles)
+    av         = AnnotateVideo({})
+    subset     = list(range(0, nparticles, 10))
+
+    print('Frames per second (', nframes, ' frames, ', nparticles,
+          ' particles per frame):', sep='')
+    print('{:>16} {:>14} {:>14}'.format('draw', 'all', 'subset'))
+    av.draw_particles(zeros(SHAPE, dtype=uint8), frames[0], [])   # Fill the cache
+    for name, draw in [('filter', lambda f, df, p: draw_by_filter(av, f, df, p)),
+                       ('text', lambda f, df, p: draw_by_text(av, f, df, p)),
+                       ('draw_particles', av.draw_particles)]:
+        r = [benchmark(draw, frames, []), benchmark(draw, frames, subset)]
+        print('{:>16} {:>14.1f} {:>14.1f}'.format(name, r[0], r[1]))
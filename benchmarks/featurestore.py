@@ -0,0 +1,80 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+Compares the throughput of the backends of :py:mod:`betrack.utils.featurestore`
+when writing, iterating over, and dumping synthetic features shaped like those
+returned by ``trackpy.locate``.
+
+Usage:
+  python benchmarks/featurestore.py [<nframes>] [<nfeatures>]
+"""
+
+from __future__ import print_function
+
+from sys      import argv
+from time     import time
+from tempfile import mkdtemp
+from shutil   import rmtree
+from os.path  import join
+from numpy.random import RandomState
+import pandas
+
+from betrack.utils.featurestore import STORES, EXTENSIONS, open_store, remove_store
+
+
+COLUMNS = ['y', 'x', 'mass', 'size', 'ecc', 'signal', 'raw_mass', 'ep']
+
+
+def make_frames(nframes, nfeatures, seed=0):
+    rs = RandomState(seed)
+    frames = []
+    for t in range(0, nframes):
+        df          = pandas.DataFrame(rs.uniform(0, 1000, (nfeatures, len(COLUMNS))),
+                                       columns=COLUMNS)
+        df['frame'] = t
+        frames.append(df)
+    return frames
+
+
+def benchmark(kind, frames, directory):
+    name  = join(directory, 'features' + EXTENSIONS[kind])
+    nrows = sum(len(df) for df in frames)
+    times = {}
+
+    t0 = time()
+    with open_store(name, kind, mode='w') as fs:
+        for df in frames: fs.put(df)
+    times['write'] = time() - t0
+
+    t0 = time()
+    with open_store(name, kind, mode='r') as fs:
+        for df in fs: pass
+    times['iterate'] = time() - t0
+
+    t0 = time()
+    with open_store(name, kind, mode='r') as fs:
+        fs.dump()
+    times['dump'] = time() - t0
+
+    remove_store(name)
+    return dict((k, nrows / v) for k, v in times.items())
+
+
+if __name__ == '__main__':
+    nframes   = int(argv[1]) if len(argv) > 1 else 1000
+    nfeatures = int(argv[2]) if len(argv) > 2 else 200
+    frames    = make_frames(nframes, nfeatures)
+    directory = mkdtemp()
+
+    print('Rows per second (', nframes, ' frames, ', nfeatures, ' features per frame):', sep='')
+    print('{:>10} {:>14} {:>14} {:>14}'.format('store', 'write', 'iterate', 'dump'))
+    try:
+        for kind in STORES:
+            r = benchmark(kind, frames, directory)
+            print('{:>10} {:>14.0f} {:>14.0f} {:>14.0f}'.format(kind, r['write'],
+                                                                r['iterate'], r['dump']))
+    finally:
+        rmtree(directory)
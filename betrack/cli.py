@@ -9,16 +9,25 @@ betrack
 Usage:
   betrack -h | --help
   betrack --version
-  betrack track-particles -c <file> | --configuration=<file>
+  betrack track-particles (-c <file> | --configuration=<file>) [--force] [--dry-run] [--resume]
+  betrack calibrate-particles -c <file> | --configuration=<file>
+  betrack link-particles (-c <file> | --configuration=<file>) [--resume]
+  betrack export-tracks -c <file> | --configuration=<file>
   betrack annotate-video
 
 Options:
   -h --help                            Show help screen.
   --version                            Show betrack version.
   -c <file> --configuration=<file>     Specify a yml configuration file.
+  --force                              Execute all stages even if up to date.
+  --dry-run                            Show the stages that would be executed.
+  --resume                             Resume interrupted jobs from their last checkpoint.
 
 Examples:
-  betrack track-particles
+  betrack track-particles -c config.yml
+  betrack calibrate-particles -c config.yml
+  betrack link-particles -c config.yml
+  betrack export-tracks -c config.yml
 
 Help:
   For help using this tool, please open an issue on the Github repository:
@@ -43,7 +52,9 @@ def main():
         if hasattr(betrack.commands, k.replace('-', '')) and v:
             module = getattr(betrack.commands, k.replace('-', ''))
             betrack.commands = getmembers(module, isclass)
-            command = [command[1] for command in betrack.commands if command[0] != 'BetrackCommand'][0]
+            command = [command[1] for command in betrack.commands
+                       if command[0] != 'BetrackCommand' and
+                       command[1].__module__ == module.__name__][0]
             command = command(options)
             errcode = command.run()
             exit(errcode)
@@ -4,4 +4,7 @@
 #------------------------------------------------------------------------------#
 
 from .trackparticles import *
+from .calibrateparticles import *
+from .linkparticles import *
 from .annotatevideo import *
+from .exporttracks import *
@@ -8,15 +8,102 @@ The `annotate-video` command.
 """
 
 
-from numpy import arange, array
+try:
+    from os import EX_CONFIG
+except ImportError:
+    EX_CONFIG = 78
+
+from sys   import exit
+from os    import remove
+from os.path import splitext, isfile
+from copy  import copy
+from multiprocessing import Pool, cpu_count
+from numpy import arange, array, argsort, diff, unique, append, isin
+from pandas import DataFrame
 from cv2   import (VideoWriter, VideoWriter_fourcc, putText, circle, rectangle,
                    flip, FONT_HERSHEY_SIMPLEX, LINE_AA)
 from tqdm  import tqdm
+try:
+    from cv2 import CAP_OPENCV_MJPEG
+except ImportError:
+    CAP_OPENCV_MJPEG = None
 
 from betrack.commands.command import BetrackCommand
 from betrack.utils.frames     import reverse_colors, crop
-from betrack.utils.message    import eprint
-from betrack.utils.parser     import (open_configuration, parse_str)
+from betrack.utils.avi        import concat_avi
+from betrack.utils.message    import eprint, wprint
+from betrack.utils.parser     import (open_configuration, parse_str, parse_int)
+from betrack.utils.pipeline   import run_pipeline
+from betrack.utils.sprites    import ParticleSprites
+
+
+def _frame_index(df):
+    """
+    Sorts the trajectories ``df`` by frame, if needed, and returns them together
+    with the frames they hold and the offset of the first row of each frame,
+    followed by the number of rows. The rows of the ``k``-th frame are therefore
+    the slice ``offsets[k]:offsets[k + 1]`` of the sorted trajectories.
+
+    :param df: the trajectories
+    :type df: ``pandas.DataFrame``
+    :returns: the sorted trajectories, their frames, and the offsets of the frames
+    :rtype: tuple
+    """
+
+    frames = df['frame'].values
+    if len(frames) > 1 and (diff(frames) < 0).any():
+        df     = df.iloc[argsort(frames, kind='mergesort')]
+        frames = df['frame'].values
+    keys, offsets = unique(frames, return_index=True)
+    return df, keys, append(offsets, len(frames))
+
+
+def _iter_frames(chunks, start, stop):
+    """
+    Splits chunks of trajectories sorted by frame into the trajectories of each
+    frame in the interval ``[start, stop)``. Each chunk is indexed once by
+    :py:func:`~betrack.commands.annotatevideo._frame_index`, so that the
+    trajectories of a frame are a slice of their chunk. Frames without
+    trajectories are given an empty ``DataFrame``.
+
+    :param chunks: an iterator of ``pandas.DataFrame`` sorted by frame
+    :param int start: the first frame
+    :param int stop: the frame following the last one
+    :returns: a generator of ``pandas.DataFrame``, one for each frame
+    :rtype: generator
+    """
+
+    i       = start
+    columns = ['y', 'x', 'frame', 'particle']
+    for chunk in chunks:
+        columns = chunk.columns
+        if len(chunk) == 0: continue
+        chunk, keys, offsets = _frame_index(chunk)
+        for fn, a, b in zip(keys, offsets[:-1], offsets[1:]):
+            fn = int(fn)
+            if fn < start or fn >= stop: continue
+            for j in range(i, fn): yield DataFrame(columns=columns)
+            yield chunk.iloc[a:b]
+            i = fn + 1
+    for j in range(i, stop): yield DataFrame(columns=columns)
+
+
+def _render_segment(args):
+    """
+    Renders a segment of an annotated video in a worker process, loading the
+    frames of the video again.
+
+    :param tuple args: the annotator, the job of the segment, the segment file,
+                       the tracked region, the margins, and the shape of the frames
+    """
+
+    annotator, job, filename, region, margins, oshape = args
+    job.load_frames()
+    job.pframes = reverse_colors(job.frames)
+    annotator.render(job, filename, region, margins, oshape, progress=False)
+    job.frames  = None
+    job.pframes = None
+
 
 class AnnotateVideo(BetrackCommand):
     """Say hello, world!"""
@@ -33,6 +120,8 @@ class AnnotateVideo(BetrackCommand):
         self.drawframenumber = False  # Draw or not the frame number
         self.framenumberpos  = 0      # Position where to draw frame number [-4:4]
         self.flipframes      = ''     # Flip frames vert. 'x', horiz. 'y', or both 'xy'/'yx'
+        self.nthreads        = cpu_count()  # Number of threads drawing frames
+        self.nsegments       = 1      # Number of segments rendered in parallel processes
 
         self.linethickness   = 2
         self.textfont        = FONT_HERSHEY_SIMPLEX
@@ -40,6 +129,7 @@ class AnnotateVideo(BetrackCommand):
         self.regioncolor     = (120, 245, 65)
         self.particlecolor   = (25, 100, 255)
         self.particleradius  = 3
+        self.sprites         = None   # Cached sprites of the particles
 
         
     def configure_annotator(self, filename):
@@ -50,38 +140,71 @@ class AnnotateVideo(BetrackCommand):
             config = open_configuration(filename)            
         except IOError:
             eprint('File not found:', filename)
-            sys.exit()
+            exit(EX_CONFIG)
             
         try:
-            self.flipframes = parse_str(config, 'av-flipframes')
+            self.flipframes = parse_str(config, 'av-flipframes').decode()
             if not self.flipframes in ['x', 'y', 'xy', 'yx']:
-                raise ValueError('<tp-flipframes> must be either \'x\'' + 
+                raise ValueError('<av-flipframes> must be either \'x\'' + 
                                  ', \'y\', \'xy\', \'yx\'')        
         except ValueError as err:
-            eprint('Invalid attribute: ', err[0], '.', sep='')
-            sys.exit()
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+        except KeyError: pass
+
+        try:
+            self.nthreads = parse_int(config, 'av-nthreads')
+            if self.nthreads <= 0:
+                raise ValueError('<av-nthreads> must be positive')
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+        except KeyError: pass
+
+        try:
+            self.nsegments = parse_int(config, 'av-nsegments')
+            if self.nsegments <= 0:
+                raise ValueError('<av-nsegments> must be positive')
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
         except KeyError: pass
 
                 
     def draw_particles(self, frame, df, particles):
         """
+        Draws the position and the identity of the particles in ``df`` on
+        ``frame``. Positions and identities are taken once as arrays. If
+        ``particles`` is not empty, only the listed particles are drawn. Each
+        particle is drawn from its sprite, cached by
+        :py:func:`~betrack.commands.annotatevideo.AnnotateVideo.particle_sprites`.
         """
 
-        # Subset df for selected particles..
-        if particles: df = df[df['particle'] in particles]
+        # Get positions and ids, subset selected particles..
+        ids = df['particle'].values.astype(int)
+        pos = df[['x', 'y']].values.astype(int)
+        if particles:
+            keep     = isin(ids, list(particles))
+            ids, pos = ids[keep], pos[keep]
 
-        for p in df['particle']:
-            # Get particle position..
-            pos = tuple(df[df['particle'] == p][['x','y']].astype(int).values[0])
-        
-            # Add particle id..
-            putText(frame, str(p), (pos[0] + 3, pos[1] + 3), self.textfont,
-                    self.textfontscale, self.particlecolor, self.linethickness,
-                    lineType=LINE_AA, bottomLeftOrigin=True)
-        
-            # Add particle position..
-            circle(frame, pos, self.particleradius, self.particlecolor,
-                   thickness=-1, lineType=LINE_AA)
+        # Add particle ids and positions..
+        self.particle_sprites().draw(frame, ids.tolist(), pos.tolist())
+
+
+    def particle_sprites(self):
+        """
+        Returns the cache of the sprites of the particles, created again whenever
+        the font, the color, the thickness of lines, or the radius of particles
+        change.
+
+        :rtype: :py:class:`~betrack.utils.sprites.ParticleSprites`
+        """
+
+        style = (self.textfont, self.textfontscale, tuple(self.particlecolor),
+                 self.linethickness, self.particleradius)
+        if self.sprites is None or self.sprites.style() != style:
+            self.sprites = ParticleSprites(*style)
+        return self.sprites
 
     def draw_region(self, frame, region):
         """
@@ -91,13 +214,10 @@ class AnnotateVideo(BetrackCommand):
         rectangle(frame, tl, br, self.regioncolor, self.linethickness,
                   lineType=LINE_AA)
 
-    def draw_frame_number(self, frame, fnum, region):
+    def resolve_frame_number_position(self):
         """
-        0 -> auto mode
-        1 -> top-left outside tracked region (-1 inside)
-        2 -> top-right outside tracked region (-2 inside)
-        3 -> bottom-left outside tracked region (-3 inside)
-        4 -> bottom-right outside tracked region (-4 inside)
+        Resolves the automatic position of the frame number and moves it inside
+        the tracked region if this is not drawn.
         """
 
         if self.framenumberpos == 0:
@@ -107,6 +227,17 @@ class AnnotateVideo(BetrackCommand):
         if self.drawregion == False and self.framenumberpos > 0:
             self.framenumberpos = -self.framenumberpos
 
+
+    def draw_frame_number(self, frame, fnum, region):
+        """
+        0 -> auto mode
+        1 -> top-left outside tracked region (-1 inside)
+        2 -> top-right outside tracked region (-2 inside)
+        3 -> bottom-left outside tracked region (-3 inside)
+        4 -> bottom-right outside tracked region (-4 inside)
+        """
+
+        self.resolve_frame_number_position()
         offset = int(round((region[3] - region[2]) * 0.01))
         if   self.framenumberpos == 1:
             pos = (region[0], region[3] + offset)
@@ -130,14 +261,159 @@ class AnnotateVideo(BetrackCommand):
                    lineType=LINE_AA, bottomLeftOrigin=True)
 
         
+    def annotate_frame(self, job, f, df, i, region, margins):
+        """
+        Draws the particles ``df``, the tracked ``region``, and the number ``i``
+        on frame ``f`` of ``job``, then crops it to ``margins``, if any, and flips it.
+
+        :returns: the annotated frame
+        :rtype: ``numpy.ndarray``
+        """
+
+        # Draw particles..
+        self.draw_particles(f, df, job.drawparticles)
+
+        # Draw tracked region..
+        if self.drawregion: self.draw_region(f, region)
+
+        # Draw frame number..
+        if self.drawframenumber: self.draw_frame_number(f, i, region)
+
+        # Crop frame..
+        if margins is not None: f = crop(f, margins)
+
+        # Flip frame..
+        if   self.flipframes == 'x': flip(f, flipCode=0, dst=f)
+        elif self.flipframes == 'y': flip(f, flipCode=1, dst=f)
+        elif self.flipframes == 'xy' or self.flipframes == 'yx':
+            flip(f, flipCode=-1, dst=f)
+        return f
+
+
+    def render(self, job, filename, region, margins, oshape, progress=True):
+        """
+        Writes the frames of the period of ``job`` annotated with its trajectories
+        to the video ``filename``. Frames flow through three stages connected by
+        bounded queues: a thread decodes each frame together with its
+        trajectories, ``av-nthreads`` threads annotate them, and a thread writes
+        them to the video in order. Progress is reported for each stage, if
+        ``progress`` is set.
+
+        :param job: the job whose trajectories need to be exported as a video
+        :type job: :py:class:`~betrack.utils.job.Job`
+        :param str filename: the annotated video
+        :param list region: the tracked region
+        :param list margins: the margins of the annotated frames, if cropped
+        :param tuple oshape: the width and the height of the annotated frames
+        :param bool progress: whether to report progress
+        """
+
+        # The MJPEG encoder of OpenCV encodes each frame independently of the others..
+        codec    = VideoWriter_fourcc('M', 'J', 'P', 'G')
+        if CAP_OPENCV_MJPEG is not None:
+            writer = VideoWriter(filename, CAP_OPENCV_MJPEG, codec, job.framerate, oshape)
+        else:
+            writer = VideoWriter(filename, codec, job.framerate, oshape)
+        chunks   = job.iter_trajectories(job.period[0], job.period[1])
+        tracks   = _iter_frames(chunks, job.period[0], job.period[1])
+
+        # Settle what drawing threads share before starting them..
+        if self.drawframenumber: self.resolve_frame_number_position()
+        self.particle_sprites()
+
+        # Decode, annotate, and write frames in a pipeline..
+        d        = '\033[01m' + '...Exporting video'
+        bars     = None
+        if progress:
+            bars = [tqdm(desc=d + ' (' + s + '):', unit=' frame', total=job.nframes, position=p)
+                    for s, p in zip(['decode', 'draw', 'encode'], range(0, 3))]
+        decode   = lambda i: (i, array(job.pframes[i]), next(tracks))
+        annotate = lambda args: self.annotate_frame(job, args[1], args[2], args[0], region,
+                                                    margins)
+        try:
+            run_pipeline(arange(job.period[0], job.period[1]), decode, annotate, writer.write,
+                         nworkers=self.nthreads, progress=bars)
+        finally:
+            if bars is not None:
+                for b in bars: b.close()
+
+            # Close writer..
+            writer.release()
+
+
+    def render_segments(self, job, region, margins, oshape):
+        """
+        Exports the trajectories of ``job`` as an annotated video rendered in
+        ``av-nsegments`` segments of consecutive frames, each one by a separate
+        process. Frames encoded as Motion JPEG are independent, so that the
+        segments are concatenated without encoding them again by
+        :py:func:`~betrack.utils.avi.concat_avi`, giving the same video written
+        by :py:func:`~betrack.commands.annotatevideo.AnnotateVideo.render`.
+
+        :param job: the job whose trajectories need to be exported as a video
+        :type job: :py:class:`~betrack.utils.job.Job`
+        :param list region: the tracked region
+        :param list margins: the margins of the annotated frames, if cropped
+        :param tuple oshape: the width and the height of the annotated frames
+        :raises ValueError: if the annotated video exceeds the size of AVI 1.0 files
+        """
+
+        # Split the period in segments..
+        nsegments = min(self.nsegments, job.nframes)
+        bounds    = [job.period[0] + k * job.nframes // nsegments for k in range(0, nsegments + 1)]
+        root, ext = splitext(job.avitracked)
+        files     = [root + '-' + str(k).zfill(3) + ext for k in range(0, nsegments)]
+
+        # Workers draw with their own sprites and share the threads..
+        annotator          = copy(self)
+        annotator.sprites  = None
+        annotator.nthreads = max(1, self.nthreads // nsegments)
+        tasks = []
+        for a, b, filename in zip(bounds[:-1], bounds[1:], files):
+            segment            = copy(job)
+            segment.frames     = None
+            segment.pframes    = None
+            segment.period     = [a, b]
+            segment.periodtype = 'frame'
+            segment.nframes    = b - a
+            if job.dflink is not None:
+                frames         = job.dflink['frame'].values
+                segment.dflink = job.dflink[(frames >= a) & (frames < b)]
+            tasks.append((annotator, segment, filename, region, margins, oshape))
+
+        # Render segments and concatenate them..
+        d    = '\033[01m' + '...Exporting video'
+        pool = Pool(nsegments)
+        try:
+            for r in tqdm(pool.imap_unordered(_render_segment, tasks), desc=d,
+                          unit=' segment', total=nsegments): pass
+            concat_avi(files, job.avitracked)
+        finally:
+            pool.close()
+            pool.join()
+            for f in files:
+                if isfile(f): remove(f)
+
+
     def annotator(self, job):
         """
+        Exports the trajectories of ``job`` as an annotated video. The video is
+        rendered by :py:func:`~betrack.commands.annotatevideo.AnnotateVideo.render`
+        or, if ``av-nsegments`` is greater than one, in segments rendered in
+        parallel by
+        :py:func:`~betrack.commands.annotatevideo.AnnotateVideo.render_segments`.
+        Segmented videos are rendered again at once if they exceed the size of
+        AVI 1.0 files. Frames are encoded by the MJPEG encoder of ``OpenCV``, if
+        available, whose output does not depend on the previous frames, so that
+        segments can be joined as they are.
+
+        :param job: the job whose trajectories need to be exported as a video
+        :type job: :py:class:`~betrack.utils.job.Job`
         """
 
         # Init annotator..
         job.pframes = reverse_colors(job.frames)
-        codec       = VideoWriter_fourcc('M', 'J', 'P', 'G')
-        fps         = job.framerate
+        source      = copy(job)
         oshape      = job.frameshape[0:2][::-1]
         oldmargins  = job.margins
 
@@ -155,40 +431,20 @@ class AnnotateVideo(BetrackCommand):
                 self.drawregion = False
                 # Frame number should be inside in this case!
         else: self.drawregion = False
-        writer = VideoWriter(job.avitracked, codec, fps, oshape)
-
-        # Loop over frames, annotate, crop and save each of them..
-        d       = '\033[01m' + '...Exporting video:'
-        ut      = ' frame'
-        for i in tqdm(arange(job.period[0], job.period[1]), desc=d, unit=ut, total=job.nframes):
-            
-            # Get frame, subset tracks..
-            f  = array(job.pframes[i])
-            df = job.dflink[job.dflink['frame'] == i]
-
-            # Draw particles..
-            self.draw_particles(f, df, job.drawparticles)
+        margins = job.margins if job.valid_margins() else None
 
-            # Draw tracked region..
-            if self.drawregion: self.draw_region(f, oldmargins)
-
-            # Draw frame number..
-            if self.drawframenumber: self.draw_frame_number(f, i, oldmargins)
-
-            # Crop frame..
-            if job.valid_margins(): f = crop(f, job.margins)
-
-            # Flip frame..
-            if   self.flipframes == 'x': flip(f, flipCode=0, dst=f)
-            elif self.flipframes == 'y': flip(f, flipCode=1, dst=f)
-            elif self.flipframes == 'xy' or self.flipframes == 'yx':
-                flip(f, flipCode=-1, dst=f)
-
-            # Write frame to file..
-            writer.write(f)
-            
-        # Close writer..
-        writer.release()
+        # Trajectories are read with the margins of the tracked region..
+        if self.nsegments > 1 and CAP_OPENCV_MJPEG is None:
+            wprint('...Video segments require the MJPEG encoder of OpenCV, ' +
+                   'rendering video at once.')
+        elif self.nsegments > 1 and job.nframes > 1:
+            try:
+                self.render_segments(source, oldmargins, margins, oshape)
+                return
+            except ValueError as err:
+                wprint('...Unable to concatenate video segments (', str(err),
+                       '), rendering it at once.', sep='')
+        self.render(source, job.avitracked, oldmargins, margins, oshape)
 
         
     def run(self):
@@ -0,0 +1,362 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+The module :py:mod:`~betrack.commands.calibrateparticles` implements the
+``calibrate-particles`` command of *betrack* through the class
+:py:class:`~betrack.commands.calibrateparticles.CalibrateParticles`. The command
+helps to tune the parameters of the particle tracker by evaluating a grid of
+parameter combinations on a short sample of each video. The frames of the sample
+are decoded and preprocessed only once and the combinations are evaluated in
+parallel.
+"""
+
+try:
+    from os import EX_OK, EX_CONFIG
+except ImportError:
+    EX_OK     = 0
+    EX_CONFIG = 78
+
+from os              import remove
+from os.path         import isfile
+from sys             import exit
+from time            import time
+from multiprocessing import Pool, cpu_count
+from numpy           import load
+from tqdm            import tqdm
+import pandas
+import trackpy
+import yaml
+
+from betrack.commands.command        import BetrackCommand
+from betrack.commands.trackparticles import TrackParticles, LINK_KEYS
+from betrack.utils.message           import mprint, wprint, eprint
+from betrack.utils.parser            import (open_configuration, parse_int, parse_str,
+                                             expand_sweep)
+from betrack.utils.frames            import cache_frames
+from betrack.utils.job               import configure_jobs
+
+
+# Attributes of the particle tracker that accept a list of values..
+SWEEP_KEYS = ['tp-locate-diameter', 'tp-locate-minmass', 'tp-locate-maxsize',
+              'tp-locate-separation', 'tp-locate-noisesize', 'tp-locate-smoothingsize',
+              'tp-locate-threshold', 'tp-locate-percentile', 'tp-locate-topn'] + LINK_KEYS
+
+# Frames shared with the worker processes..
+_frames = None
+
+
+def _init_worker(source):
+    """
+    Initializes a worker process with the cached frames. If ``source`` is the
+    name of a ``.npy`` file, the frames are memory-mapped in read-only mode.
+
+    :param source: the cached frames or the name of the file storing them
+    :type source: ``numpy.ndarray`` or str
+    """
+
+    global _frames
+    if isinstance(source, str): _frames = load(source, mmap_mode='r')
+    else:                       _frames = source
+
+
+def _locate(args):
+    """
+    Locates the features in all cached frames using the parameters of a tracker.
+
+    :param tuple args: the tracker and the index of the first cached frame
+    :returns: the located features and the time spent locating them
+    :rtype: tuple
+    """
+
+    tracker, start = args
+    t0       = time()
+    features = []
+    for i in range(0, len(_frames)):
+        f          = tracker.locate(_frames[i])
+        f['frame'] = start + i
+        features.append(tracker.compact(f))
+
+    return pandas.concat(features, ignore_index=True), time() - t0
+
+
+def _link(args):
+    """
+    Links and filters a set of located features using the parameters of a tracker
+    and returns statistics on the resulting trajectories.
+
+    :param tuple args: the tracker, the located features and the time spent
+                       locating them
+    :returns: statistics on features and trajectories
+    :rtype: dict
+    """
+
+    tracker, features, tlocate = args
+    stats = dict(nfeatures=float(len(features)) / len(_frames), ntracks=0,
+                 meanlength=0.0, locatetime=tlocate, linktime=0.0)
+    if len(features) == 0: return stats
+
+    t0     = time()
+    linked = pandas.concat(tracker.link(f for _, f in features.groupby('frame')))
+    linked = tracker.filter(linked)
+    stats['linktime'] = time() - t0
+
+    if len(linked) > 0:
+        lengths             = linked.groupby('particle').size()
+        stats['ntracks']    = len(lengths)
+        stats['meanlength'] = lengths.mean()
+    return stats
+
+
+class CalibrateParticles(BetrackCommand):
+    """
+    The class :py:class:`~betrack.commands.calibrateparticles.CalibrateParticles`
+    implements the ``calibrate-particles`` command of *betrack*. It accepts the same
+    attributes of the ``track-particles`` command but the locate, link, and filter
+    attributes can be given as lists of values. Each combination of values is
+    evaluated on a sample of frames and the results are reported as a table
+    together with the YAML configuration of the best combination.
+    """
+
+    def __init__(self, options, *args, **kwargs):
+        """
+        Constructor for the class
+        :py:class:`~betrack.commands.calibrateparticles.CalibrateParticles`.
+
+        :param dict options: list of options passed by command line
+        :param list \*args: variable length argument list
+        :param list \*\*kwargs: arbitrary keyworded arguments
+        """
+
+        super(CalibrateParticles, self).__init__(options, *args, **kwargs)
+
+        self.jobs       = []            # List of jobs to process
+        self.config     = {}            # Configuration attributes
+        self.variants   = []            # Swept values of each combination
+        self.trackers   = []            # Particle tracker of each combination
+        self.nframes    = 100           # Number of frames in the sample
+        self.cache      = 'memory'      # Frames cache: 'memory' or 'memmap'
+        self.nprocesses = cpu_count()   # Number of worker processes
+
+
+    def configure_calibrator(self, filename):
+        """
+        Configures the calibrator according to the configuration file given by
+        ``filename``. A particle tracker is configured for each combination of
+        the swept attributes. If an attribute is missing or invalid, this function
+        prints an error message and halts the execution of *betrack*.
+
+        :param str filename: the name of the configuration file
+        """
+
+        try:
+            config = open_configuration(filename)
+        except IOError:
+            eprint('File not found:', filename)
+            exit(EX_CONFIG)
+
+        try:
+            self.nframes = parse_int(config, 'cp-nframes')
+            if self.nframes <= 1:
+                raise ValueError('<cp-nframes> must be greater than one')
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+        except KeyError: pass
+
+        try:
+            self.cache = parse_str(config, 'cp-cache').decode()
+            if not self.cache in ['memory', 'memmap']:
+                raise ValueError('<cp-cache> must be either \'memory\' or \'memmap\'')
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+        except KeyError: pass
+
+        try:
+            self.nprocesses = parse_int(config, 'cp-nprocesses')
+            if self.nprocesses <= 0:
+                raise ValueError('<cp-nprocesses> must be positive')
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+        except KeyError: pass
+
+        # Expand and parse the combinations of attributes..
+        try:
+            self.variants = expand_sweep(config, SWEEP_KEYS)
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+
+        self.config   = config
+        self.trackers = []
+        for v in self.variants:
+            vconfig = dict(config)
+            vconfig.update(v)
+            tracker = TrackParticles(self.options)
+            tracker.parse_tracker(vconfig)
+            self.trackers.append(tracker)
+
+        # Parse jobs..
+        self.jobs = configure_jobs(config['jobs'])
+        if len(self.jobs) == 0:
+            eprint('No job specified!')
+            exit(EX_CONFIG)
+
+
+    def calibrate(self, job, source, start):
+        """
+        Evaluates all combinations of parameters on the cached frames of ``job``.
+        Features are located only once for each distinct combination of the locate
+        attributes, then linking and filtering are performed for each combination.
+        Both steps are distributed over a pool of worker processes.
+
+        :param job: the job being calibrated
+        :type job: :py:class:`~betrack.utils.job.Job`
+        :param source: the cached frames or the name of the file storing them
+        :type source: ``numpy.ndarray`` or str
+        :param int start: the index of the first cached frame
+        :returns: a table with the swept values and the statistics of each combination
+        :rtype: ``pandas.DataFrame``
+        """
+
+        # Group combinations sharing the same locate attributes..
+        groups = {}
+        for v, i in zip(self.variants, range(0, len(self.variants))):
+            key = tuple(sorted((k, e) for k, e in v.items() if k.startswith('tp-locate-')))
+            groups.setdefault(key, []).append(i)
+        groups = list(groups.values())
+
+        nproc = min(self.nprocesses, len(self.variants))
+        if nproc > 1: pool = Pool(nproc, initializer=_init_worker, initargs=(source,))
+        else:
+            pool = None
+            _init_worker(source)
+        imap = pool.imap if pool is not None else map
+
+        try:
+            # Locate features..
+            d        = '\033[01m' + '...Locating features'
+            ut       = ' set'
+            tasks    = [(self.trackers[g[0]], start) for g in groups]
+            located  = list(tqdm(imap(_locate, tasks), desc=d, unit=ut, total=len(tasks)))
+
+            # Link and filter trajectories..
+            d        = '\033[01m' + '...Linking trajectories'
+            ut       = ' combination'
+            tasks    = [None] * len(self.variants)
+            for g, l in zip(groups, located):
+                for i in g: tasks[i] = (self.trackers[i], l[0], l[1])
+            stats    = list(tqdm(imap(_link, tasks), desc=d, unit=ut, total=len(tasks)))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        table = pandas.DataFrame(self.variants, index=range(1, len(self.variants) + 1))
+        stats = pandas.DataFrame(stats, index=table.index)
+        return pandas.concat([table, stats[['nfeatures', 'ntracks', 'meanlength',
+                                            'locatetime', 'linktime']]], axis=1)
+
+
+    def best_configuration(self, table):
+        """
+        Returns the attributes of the best combination of parameters in ``table``.
+        The best combination is the one with the longest mean trajectory length;
+        ties are broken in favor of the combination with fewer trajectories.
+
+        :param table: the table returned by
+                      :py:func:`~betrack.commands.calibrateparticles.CalibrateParticles.calibrate`
+        :type table: ``pandas.DataFrame``
+        :returns: the locate, link, and filter attributes of the best combination
+        :rtype: dict
+        """
+
+        best   = table.sort_values(['meanlength', 'ntracks'],
+                                   ascending=[False, True]).index[0]
+        config = dict((k, self.config[k]) for k in SWEEP_KEYS if k in self.config)
+        config.update(self.variants[best - 1])
+        return config
+
+
+    def run(self):
+        """
+        This method implements the ``calibrate-particles`` command of *betrack*. It
+        is automatically called when the corresponding command is passed through
+        the command line interface.
+
+        For each job, this method decodes and preprocesses the first ``cp-nframes``
+        frames of the selected period, evaluates all combinations of parameters,
+        and exports a table of results and the YAML configuration of the best
+        combination.
+
+        :returns: ``os.EX_OK`` on success or ``os.EX_CONFIG`` otherwise
+        :rtype: int
+        """
+
+        trackpy.quiet()
+
+        # Parse options and get list of jobs..
+        mprint('Reading configuration file.. ')
+        self.configure_calibrator(self.options['--configuration'])
+        njobs = len(self.jobs)
+        mprint('Found', njobs, 'valid jobs and', len(self.variants), 'combinations.')
+
+        # Loop over jobs..
+        completed = 0
+        for job, i in zip(self.jobs, range(1, njobs + 1)):
+            mprint('Working on job ', i, ':', sep='')
+            mprint(job.str(ind='...'))
+
+            # Open video..
+            try:
+                job.load_frames()
+            except IOError:
+                wprint('...Unable to load video. Skipping job.')
+                continue
+            except IndexError:
+                wprint('...Selected period is out of range for the video. Skipping job.')
+                continue
+
+            # Preprocess video..
+            try:
+                job.preprocess_video(invert=self.trackers[0].locate_featuresdark)
+            except ValueError as err:
+                wprint('Preprocessing video: ', str(err), '. Skipping job.', sep='')
+                continue
+
+            # Cache sample of frames..
+            start = job.period[0]
+            stop  = min(job.period[1], start + self.nframes)
+            mprint('...Caching frames (', self.cache, '):', sep='', end='\r')
+            if self.cache == 'memmap':
+                cache  = cache_frames(job.pframes, start, stop, filename=job.npycache)
+                source = job.npycache
+            else:
+                cache  = cache_frames(job.pframes, start, stop)
+                source = cache
+            mprint('...Caching frames (', self.cache, '): ', stop - start, ' frames', sep='')
+
+            # Evaluate combinations..
+            table = self.calibrate(job, source, start)
+            del cache, source
+            if isfile(job.npycache): remove(job.npycache)
+
+            # Export results..
+            table.to_csv(job.csvcalibration)
+            best = yaml.safe_dump(self.best_configuration(table), default_flow_style=False)
+            with open(job.ymlcalibration, 'w') as f: f.write(best)
+            mprint(table.to_string())
+            mprint('...Best combination:')
+            mprint(best)
+
+            job.release_memory()
+            completed += 1
+
+        mprint('Calibration completed, ', completed, '/', njobs,
+               ' jobs successfully completed!', sep='')
+        if completed > 0: return EX_OK
+        else:             return EX_CONFIG
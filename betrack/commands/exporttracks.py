@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+The module :py:mod:`~betrack.commands.exporttracks` implements the
+``export-tracks`` command of *betrack* through the class
+:py:class:`~betrack.commands.exporttracks.ExportTracks`. The command converts
+trajectories previously exported by the ``track-particles`` or
+``link-particles`` commands to another format, without tracking them again.
+"""
+
+try:
+    from os import EX_OK, EX_CONFIG
+except ImportError:
+    EX_OK     = 0
+    EX_CONFIG = 78
+
+from os.path import isfile
+from sys     import stdout, exit
+from copy    import copy
+import json
+
+from betrack.commands.trackparticles import TrackParticles
+from betrack.utils.message           import mprint, wprint, eprint
+from betrack.utils.parser            import parse_str
+from betrack.utils.readers           import read_tracks, read_shards
+from betrack.utils.writers           import FORMATS, TEXT_FORMATS
+from betrack.utils.compression       import COMPRESSIONS
+
+
+class ExportTracks(TrackParticles):
+    """
+    The class :py:class:`~betrack.commands.exporttracks.ExportTracks` implements
+    the ``export-tracks`` command of *betrack*. It accepts the same configuration
+    file of the ``track-particles`` command and exports the trajectories of each
+    job in the format given by attribute ``tp-exportas``, reading them in chunks
+    from the file previously exported in the format given by attribute
+    ``et-importas`` or, if this is not set, by the metadata of the exported
+    trajectories.
+    """
+
+    def __init__(self, options, *args, **kwargs):
+        """
+        Constructor for the class :py:class:`~betrack.commands.exporttracks.ExportTracks`.
+
+        :param dict options: list of options passed by command line
+        :param list \*args: variable length argument list
+        :param list \*\*kwargs: arbitrary keyworded arguments
+        """
+
+        super(ExportTracks, self).__init__(options, *args, **kwargs)
+
+        self.importas = None      # Format of the exported trajectories to convert
+
+
+    def parse_tracker(self, config):
+        """
+        Configures the export parameters as in
+        :py:func:`~betrack.commands.trackparticles.TrackParticles.parse_export`
+        and the format of the trajectories to convert. Trajectories are not
+        tracked again, so that locate, link, and filter attributes are neither
+        required nor parsed.
+
+        :param dict config: the configuration attributes
+        """
+
+        self.parse_export(config)
+
+        try:
+            self.importas = parse_str(config, 'et-importas').decode()
+            if not self.importas in FORMATS:
+                raise ValueError('<et-importas> must be either \'hdf\', \'csv\', ' +
+                                 '\'json\', \'ndjson\', \'npy\', \'parquet\', ' +
+                                 'or \'feather\'')
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+        except KeyError: pass
+
+
+    def find_tracks(self, job, metadata=None):
+        """
+        Returns the file of the previously exported trajectories of ``job``. The
+        format of the file is given by attribute ``et-importas``, if set.
+        Otherwise, the first existing file is returned, in the format given by
+        ``metadata``, if any, or in any format other than the target one. Files in
+        text formats may be compressed. Trajectories exported in shards are found
+        through their manifest.
+
+        :param job: the job whose trajectories need to be converted
+        :type job: :py:class:`~betrack.utils.job.Job`
+        :param dict metadata: the metadata of the exported trajectories, if any
+        :returns: the name and the format of the file, or of the manifest of its
+                  shards, or ``None`` if not found
+        :rtype: tuple
+        """
+
+        formats = [f for f in FORMATS if f != self.exportas]
+        if metadata is not None:
+            formats = [metadata['exportas']] + [f for f in formats if f != metadata['exportas']]
+        if self.importas is not None: formats = [self.importas]
+
+        source = copy(job)
+        for kind in formats:
+            compressions = [None]
+            if kind in TEXT_FORMATS: compressions += sorted(COMPRESSIONS)
+            if metadata is not None and metadata['exportas'] == kind:
+                compressions = [metadata['compression']] + compressions
+            for compression in compressions:
+                source.compression = compression
+                for filename in [source.tracks_file(kind), source.shards_file(kind)]:
+                    if isfile(filename) and filename != job.tracks_file(self.exportas):
+                        return filename, kind
+        return None
+
+
+    def run(self):
+        """
+        This method implements the ``export-tracks`` command of *betrack*. It is
+        automatically called when the corresponding command is passed through the
+        command line interface.
+
+        This method processes in a batch a sequence of jobs whose trajectories
+        have already been exported. For each job, it reads the exported
+        trajectories in chunks and exports them in the format given by attribute
+        ``tp-exportas``, together with their summary and metadata. The crop
+        margins, the selected period, and the shape of the frames are restored
+        from the metadata of the exported trajectories, if any, or otherwise read
+        from the video.
+
+        :returns: ``os.EX_OK`` on success or ``os.EX_CONFIG`` otherwise
+        :rtype: int
+        """
+
+        # Parse options and get list of jobs..
+        mprint('Reading configuration file.. ')
+        self.configure_tracker(self.options['--configuration'])
+        njobs = len(self.jobs)
+        mprint('Found', njobs, 'valid jobs.')
+
+        # Loop over jobs..
+        completed = 0
+        for job, i in zip(self.jobs, range(1, njobs + 1)):
+            mprint('Working on job ', i, ':', sep='')
+            mprint(job.str(ind='...'))
+
+            # Restore the metadata of the exported trajectories..
+            job.tempfiles = []
+            metadata      = None
+            if isfile(job.jsonmeta):
+                with open(job.jsonmeta, 'r') as f: metadata = json.load(f)
+                job.load_tracks_metadata(metadata)
+            else:
+                try:
+                    job.load_frames()
+                except (IOError, IndexError):
+                    wprint('...Unable to load video, exported metadata are incomplete.')
+
+            # Find the exported trajectories..
+            found = self.find_tracks(job, metadata)
+            if found is None:
+                wprint('...Exported trajectories to convert not found. Skipping job.')
+                job.release_memory()
+                continue
+            filename, kind = found
+            if filename == job.shards_file(kind): reader = lambda: read_shards(filename)
+            else:                                 reader = lambda: read_tracks(filename, kind)
+
+            # Export trajectories..
+            mprint('...Exporting trajectories (', kind, ' to ', self.exportas, '):',
+                   sep='', end='\r')
+            stdout.flush()
+            self.export_trajectories(job, source=reader)
+            mprint('...Exporting trajectories (', kind, ' to ', self.exportas, '): Done',
+                   sep='')
+            self.report_export(job)
+
+            # Clean up..
+            job.release_memory()
+            completed += 1
+
+        # Summarize completed jobs..
+        mprint('Batch process completed, ', completed, '/', njobs,
+               ' jobs successfully completed!', sep='')
+        if completed > 0: return EX_OK
+        else:             return EX_CONFIG
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+The module :py:mod:`~betrack.commands.linkparticles` implements the
+``link-particles`` command of *betrack* through the class
+:py:class:`~betrack.commands.linkparticles.LinkParticles`. The command links,
+filters, and exports trajectories starting from the features previously located
+by the ``track-particles`` command with attribute ``tp-keep-features`` set,
+without decoding the video again.
+"""
+
+try:
+    from os import EX_OK, EX_CONFIG
+except ImportError:
+    EX_OK     = 0
+    EX_CONFIG = 78
+
+from os.path import isfile
+from sys     import stdout, exit
+import trackpy
+
+from betrack.commands.trackparticles import TrackParticles
+from betrack.utils.message           import mprint, wprint, eprint
+from betrack.utils.stages            import load_manifest, save_manifest
+from betrack.utils.featurestore      import open_store, store_exists
+
+
+class LinkParticles(TrackParticles):
+    """
+    The class :py:class:`~betrack.commands.linkparticles.LinkParticles` implements
+    the ``link-particles`` command of *betrack*. It accepts the same configuration
+    file of the ``track-particles`` command and reuses its link, filter, and
+    export functionalities.
+    """
+
+    def __init__(self, options, *args, **kwargs):
+        """
+        Constructor for the class :py:class:`~betrack.commands.linkparticles.LinkParticles`.
+
+        :param dict options: list of options passed by command line
+        :param list \*args: variable length argument list
+        :param list \*\*kwargs: arbitrary keyworded arguments
+        """
+
+        super(LinkParticles, self).__init__(options, *args, **kwargs)
+
+
+    def parse_tracker(self, config):
+        """
+        Configures the particle tracker as in
+        :py:func:`~betrack.commands.trackparticles.TrackParticles.parse_tracker`.
+        Features kept in memory by the ``track-particles`` command do not outlive
+        it, so that the ``'memory'`` backend is rejected.
+
+        :param dict config: the dictionary of configuration attributes
+        """
+
+        super(LinkParticles, self).parse_tracker(config)
+
+        if self.featurestore == 'memory':
+            eprint('Invalid attribute: <tp-feature-store> \'memory\' is not ' +
+                   'supported by the link-particles command.')
+            exit(EX_CONFIG)
+
+
+    def load_features(self, job):
+        """
+        Prepares ``job`` to be linked from the features stored in
+        :py:attr:`betrack.utils.job.Job.h5storage`. The period and the shape of the
+        frames of the job are restored from the metadata of the features and the
+        features are protected from being deleted when the job is released, while
+        the intermediate linked trajectories are not. As the stages following the
+        location of features are executed again, they are removed from the manifest
+        of the job, if any.
+
+        :param job: the job whose features need to be loaded
+        :type job: :py:class:`~betrack.utils.job.Job`
+        :raises IOError: if the located features are not found
+        :raises ValueError: if the features are kept in memory, if they have no
+                            metadata, or if their metadata do not match the
+                            configuration of the job
+        """
+
+        if self.featurestore == 'memory':
+            raise ValueError('located features kept in memory cannot be linked again')
+        if not store_exists(job.h5storage):
+            raise IOError('located features not found')
+
+        with open_store(job.h5storage, self.featurestore, mode='r') as sf:
+            metadata = sf.get_attr('betrack')
+        if metadata is None:
+            raise ValueError('located features are incomplete or have no metadata')
+
+        job.load_metadata(metadata)
+        job.tempfiles = [job.h5linked, job.h5filtered]
+
+        # Invalidate the cached stages following the located features..
+        if isfile(job.jsonmanifest):
+            manifest = load_manifest(job.jsonmanifest)
+            save_manifest(job.jsonmanifest, dict((k, v) for k, v in manifest.items()
+                                                 if k == 'locate'))
+
+
+    def run(self):
+        """
+        This method implements the ``link-particles`` command of *betrack*. It is
+        automatically called when the corresponding command is passed through the
+        command line interface.
+
+        This method processes in a batch a sequence of jobs whose features have
+        already been located. For each job, it links and filters trajectories and
+        exports the results as a data file.
+
+        :returns: ``os.EX_OK`` on success or ``os.EX_CONFIG`` otherwise
+        :rtype: int
+        """
+
+        trackpy.quiet()
+
+        # Parse options and get list of jobs..
+        mprint('Reading configuration file.. ')
+        self.configure_tracker(self.options['--configuration'])
+        njobs = len(self.jobs)
+        mprint('Found', njobs, 'valid jobs.')
+
+        # Loop over jobs..
+        completed = 0
+        for job, i in zip(self.jobs, range(1, njobs + 1)):
+            mprint('Working on job ', i, ':', sep='')
+            mprint(job.str(ind='...'))
+
+            # Load located features..
+            try:
+                self.load_features(job)
+                mprint('...Number of frames: ', job.nframes)
+            except IOError:
+                wprint('...Located features not found (', job.h5storage,
+                       '). Skipping job.', sep='')
+                continue
+            except ValueError as err:
+                wprint('...Invalid located features: ', str(err), '. Skipping job.', sep='')
+                continue
+
+            # Link, filter, and export each variant of a sweep..
+            if len(self.sweep) > 0:
+                self.sweep_trajectories(job)
+            else:
+                # Link trajectories..
+                self.link_trajectories(job)
+
+                # Filter trajectories..
+                if self.filtering():
+                    mprint('...Filtering trajectories:', end='\r')
+                    stdout.flush()
+                    self.filter_trajectories(job)
+                    mprint('...Filtering trajectories: Done')
+
+                # Export trajectories..
+                mprint('...Exporting trajectories (', self.exportas, '):', sep='', end='\r')
+                stdout.flush()
+                self.export_trajectories(job)
+                mprint('...Exporting trajectories (', self.exportas, '): Done', sep='')
+                self.report_export(job)
+
+            # Clean up..
+            job.release_memory()
+            completed += 1
+
+        # Summarize completed jobs..
+        mprint('Batch process completed, ', completed, '/', njobs,
+               ' jobs successfully completed!', sep='')
+        if completed > 0: return EX_OK
+        else:             return EX_CONFIG
@@ -24,17 +24,55 @@ import warnings
 import pandas
 warnings.filterwarnings('ignore', category=pandas.io.pytables.PerformanceWarning)
 
-from os      import remove    
-from os.path import isfile
-from tqdm    import tqdm
-from sys     import exit, stdout
+from os              import remove    
+from os.path         import isfile
+from tqdm            import tqdm
+from sys             import exit, stdout
+from multiprocessing import Pool, cpu_count
 import trackpy
 
+from betrack                 import __version__ as VERSION
 from betrack.commands.command import BetrackCommand
 from betrack.utils.message    import mprint, wprint, eprint
 from betrack.utils.parser     import (open_configuration, parse_bool, parse_int,
-                                      parse_float, parse_int_or_float, parse_str)
+                                      parse_float, parse_int_or_float, parse_str,
+                                      expand_sweep)
 from betrack.utils.job        import configure_jobs 
+from betrack.utils.stages     import (Stage, video_signature, plan_stages,
+                                      load_manifest, save_manifest)
+from betrack.utils.checkpoint import ResumableLinker, save_checkpoint, load_checkpoint
+from betrack.utils.featurestore import STORES, open_store, store_exists
+from betrack.utils.filtering    import StubFilter, filter_store
+from betrack.utils.writers      import (FORMATS, ARROW_FORMATS, ARROW_COMPRESSIONS,
+                                        PROGRESSIVE_FORMATS, ProgressiveWriter, pyarrow)
+from betrack.utils.compression  import COMPRESSIONS, compression_available, open_output
+
+
+# Optional columns of the located features..
+LOCATE_COLUMNS = ['mass', 'size', 'ecc', 'signal', 'raw_mass', 'ep']
+
+# Link and filter attributes that accept a list of values..
+LINK_KEYS = ['tp-link-searchrange', 'tp-link-memory', 'tp-link-predict',
+             'tp-link-adaptivestop', 'tp-link-adaptivestep', 'tp-filter-st-threshold',
+             'tp-filter-cl-quantile', 'tp-filter-cl-threshold']
+
+
+def _process_variant(args):
+    """
+    Links, filters, and exports the trajectories of a variant of a job whose
+    features have already been located.
+
+    :param tuple args: the particle tracker and the job variant
+    :returns: the suffix of the variant and the number of exported rows
+    :rtype: tuple
+    """
+
+    tracker, job = args
+    tracker.link_trajectories(job)
+    if tracker.filtering(): tracker.filter_trajectories(job)
+    nrows = tracker.export_trajectories(job, nprocesses=1)
+    job.release_memory()
+    return job.suffix, nrows
 
 
 class TrackParticles(BetrackCommand):
@@ -59,6 +97,26 @@ class TrackParticles(BetrackCommand):
         
         self.jobs                      = []      # List of jobs to process
         self.exportas                  = 'csv'
+        self.exportsummary             = True    # Export a summary of each trajectory or not
+        self.exportprecision           = None    # Decimal digits of floats in CSV and NDJSON files
+        self.exportrowgroup            = 1000    # Frames per row group of Parquet files
+        self.exporthdfnodes            = None    # Frames per table of HDF5 files
+        self.exportshards              = None    # Frames per exported file
+        self.exportprogressive         = None    # Frames between progressive writes
+        self.exportcompression         = None    # Compression of exported files
+        self.variants                  = []      # Swept link and filter values
+        self.sweep                     = []      # Particle tracker of each variant
+        self.nprocesses                = cpu_count()
+        self.progress                  = True    # Show progress bars or not
+        self.keepfeatures              = False   # Keep the located features or not
+        self.featurestore              = 'hdf'   # Backend of the feature stores
+        self.outofcore                 = False   # Stream trajectories from disk or not
+        self.chunksize                 = 1000    # Frames per chunk out of core
+        self.config                    = {}      # Configuration attributes
+        self.cache                     = False   # Skip stages that are up to date or not
+        self.cachedigest               = False   # Hash the content of videos or not
+        self.checkpoint                = 1000    # Frames between checkpoints, 0 to disable
+        self.resume                    = self.options.get('--resume', False)
 
         self.locate_featuresdark       = False   # True if features in the video are dark
         self.locate_diameter           = None
@@ -71,6 +129,8 @@ class TrackParticles(BetrackCommand):
         self.locate_percentile         = 64.0
         self.locate_topn               = None
         self.locate_preprocess         = True
+        self.locate_compact            = False   # Downcast features to 32 bits or not
+        self.locate_columns            = None    # Optional columns to keep, None means all
 
         self.link_searchrange          = None
         self.link_memory               = 0
@@ -100,15 +160,116 @@ class TrackParticles(BetrackCommand):
             exit(EX_CONFIG)
 
         # Parse tracker configuration..
+        self.config = config
         try:
-            self.exportas = parse_str(config, 'tp-exportas')
-            if not self.exportas in ['hdf', 'csv', 'json']:
-                raise ValueError('<tp-exportas> must be either \'hdf\', \'csv\', or \'json\'')
+            self.variants = expand_sweep(config, LINK_KEYS)
         except ValueError as err:
             eprint('Invalid attribute: ', str(err), '.', sep='')
             exit(EX_CONFIG)
-        except KeyError: pass
+            
+        vconfig = dict(config)
+        vconfig.update(self.variants[0])
+        self.parse_tracker(vconfig)
+
+        # Configure a tracker for each variant of a sweep..
+        self.sweep = []
+        if len(self.variants) > 1:
+            for v in self.variants:
+                vconfig = dict(config)
+                vconfig.update(v)
+                tracker = TrackParticles(self.options)
+                tracker.parse_tracker(vconfig)
+                tracker.progress = False
+                self.sweep.append(tracker)
+        else: self.variants = []
                 
+        # Parse jobs..
+        self.jobs = configure_jobs(config['jobs'])
+        if len(self.jobs) == 0:
+            eprint('No job specified!')
+            exit(EX_CONFIG)                
+        for job in self.jobs:
+            job.set_feature_store(self.featurestore)
+            if self.outofcore: job.chunksize = self.chunksize
+            job.compression = self.exportcompression
+            # Cached artifacts are kept, unless in memory..
+            if self.cache and self.featurestore != 'memory': job.tempfiles = []
+            elif self.keepfeatures: job.tempfiles.remove(job.h5storage)
+
+
+    def parse_tracker(self, config):
+        """
+        Configures the locate, link, filter, and export parameters of the particle
+        tracker according to the attributes of the dictionary ``config``, the
+        latter by means of
+        :py:func:`~betrack.commands.trackparticles.TrackParticles.parse_export`. If a 
+        required attribute is missing or if the value of an attribute is invalid,
+        this function prints an error message and halts the execution of *betrack*.
+
+        :param dict config: the dictionary of configuration attributes
+        """
+        
+        self.parse_export(config)
+
+        try:
+            self.cache = parse_bool(config, 'tp-cache')
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+        except KeyError: pass
+
+        try:
+            self.cachedigest = parse_bool(config, 'tp-cache-digest')
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+        except KeyError: pass
+
+        try:
+            self.checkpoint = parse_int(config, 'tp-checkpoint')
+            if self.checkpoint < 0:
+                raise ValueError('<tp-checkpoint> must be non-negative')
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+        except KeyError: pass
+
+        try:
+            self.featurestore = parse_str(config, 'tp-feature-store').decode()
+            if not self.featurestore in STORES:
+                raise ValueError('<tp-feature-store> must be either \'hdf\', ' +
+                                 '\'memory\', or \'columnar\'')
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+        except KeyError: pass
+
+        try:
+            self.outofcore = parse_bool(config, 'tp-out-of-core')
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+        except KeyError: pass
+
+        try:
+            self.chunksize = parse_int(config, 'tp-chunk-size')
+            if self.chunksize <= 0:
+                raise ValueError('<tp-chunk-size> must be positive')
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+        except KeyError: pass
+
+        try:
+            self.keepfeatures = parse_bool(config, 'tp-keep-features')
+            if self.keepfeatures and self.featurestore == 'memory':
+                raise ValueError('<tp-keep-features> requires <tp-feature-store> ' +
+                                 'to be either \'hdf\' or \'columnar\'')
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+        except KeyError: pass
+
         try:
             self.locate_diameter = parse_int(config, 'tp-locate-diameter')
             if self.locate_diameter % 2 == 0:
@@ -206,6 +367,33 @@ class TrackParticles(BetrackCommand):
             exit(EX_CONFIG)
         except KeyError: pass
 
+        try:
+            self.locate_compact = parse_bool(config, 'tp-locate-compact')
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+        except KeyError: pass
+
+        try:
+            val = config.get('tp-locate-columns')
+            n   = len(val) if type(val) == list else 1
+            if n == 0: self.locate_columns = []
+            else:
+                # Parse a copy, as lists are encoded in place..
+                src = dict(config)
+                if type(val) == list: src['tp-locate-columns'] = list(val)
+                self.locate_columns = parse_str(src, 'tp-locate-columns', nentries=n)
+                if n == 1 and type(val) != list: self.locate_columns = [self.locate_columns]
+                self.locate_columns = [c.decode() for c in self.locate_columns]
+            for c in self.locate_columns:
+                if not c in LOCATE_COLUMNS:
+                    raise ValueError('<tp-locate-columns> must be a list of ' +
+                                     ', '.join('\'' + c + '\'' for c in LOCATE_COLUMNS))
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+        except KeyError: pass
+
         try:
             self.link_searchrange = parse_int_or_float(config, 'tp-link-searchrange')
             if self.link_searchrange <= 0:
@@ -278,67 +466,377 @@ class TrackParticles(BetrackCommand):
             eprint('Invalid attribute: ', str(err), '.', sep='')
             exit(EX_CONFIG)
         except KeyError: pass
-                
-        # Parse jobs..
-        self.jobs = configure_jobs(config['jobs'])
-        if len(self.jobs) == 0:
-            eprint('No job specified!')
-            exit(EX_CONFIG)                
 
+        if (self.locate_columns is not None and not 'size' in self.locate_columns and
+            (self.filter_clusters_quantile is not None or
+             self.filter_clusters_threshold is not None)):
+            eprint('Invalid attribute: <tp-filter-cl-*> requires column \'size\' ' +
+                   'in <tp-locate-columns>.')
+            exit(EX_CONFIG)
+
+
+    def parse_export(self, config):
+        """
+        Configures the export parameters of the particle tracker, that is, the
+        ``tp-export*`` attributes and the number of worker processes, according to
+        the attributes of the dictionary ``config``. If the value of an attribute
+        is invalid, this function prints an error message and halts the execution
+        of *betrack*.
+
+        :param dict config: the dictionary of configuration attributes
+        """
+
+        try:
+            self.nprocesses = parse_int(config, 'tp-nprocesses')
+            if self.nprocesses <= 0:
+                raise ValueError('<tp-nprocesses> must be positive')
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+        except KeyError: pass
+
+        try:
+            self.exportas = parse_str(config, 'tp-exportas').decode()
+            if not self.exportas in FORMATS:
+                raise ValueError('<tp-exportas> must be either \'hdf\', \'csv\', ' +
+                                 '\'json\', \'ndjson\', \'npy\', \'parquet\', ' +
+                                 'or \'feather\'')
+            if self.exportas in ARROW_FORMATS and pyarrow is None:
+                raise ValueError('<tp-exportas> \'' + self.exportas + '\' requires pyarrow')
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+        except KeyError: pass
+
+        try:
+            self.exportsummary = parse_bool(config, 'tp-export-summary')
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+        except KeyError: pass
+
+        try:
+            self.exportrowgroup = parse_int(config, 'tp-export-rowgroup')
+            if self.exportrowgroup <= 0:
+                raise ValueError('<tp-export-rowgroup> must be positive')
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+        except KeyError: pass
+
+        try:
+            self.exporthdfnodes = parse_int(config, 'tp-export-hdf-nodes')
+            if self.exporthdfnodes <= 0:
+                raise ValueError('<tp-export-hdf-nodes> must be positive')
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+        except KeyError: pass
+
+        try:
+            self.exportshards = parse_int(config, 'tp-export-shards')
+            if self.exportshards <= 0:
+                raise ValueError('<tp-export-shards> must be positive')
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+        except KeyError: pass
+
+        try:
+            self.exportprogressive = parse_int(config, 'tp-export-progressive')
+            if self.exportprogressive <= 0:
+                raise ValueError('<tp-export-progressive> must be positive')
+            if not self.exportas in PROGRESSIVE_FORMATS:
+                raise ValueError('<tp-export-progressive> requires <tp-exportas> ' +
+                                 'to be either \'csv\' or \'ndjson\'')
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+        except KeyError: pass
+
+        try:
+            self.exportcompression = parse_str(config, 'tp-export-compression').decode()
+            if not self.exportcompression in COMPRESSIONS:
+                raise ValueError('<tp-export-compression> must be either \'gzip\', ' +
+                                 '\'zstd\', or \'lz4\'')
+            if not compression_available(self.exportcompression):
+                raise ValueError('<tp-export-compression> \'' + self.exportcompression +
+                                 '\' requires package ' + ('zstandard' if
+                                 self.exportcompression == 'zstd' else 'lz4'))
+            if self.exportas == 'npy':
+                raise ValueError('<tp-export-compression> is not supported by \'npy\'')
+            if (self.exportas in ARROW_FORMATS and
+                not self.exportcompression in ARROW_COMPRESSIONS[self.exportas]):
+                raise ValueError('<tp-export-compression> \'' + self.exportcompression +
+                                 '\' is not supported by \'' + self.exportas + '\'')
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+        except KeyError: pass
+
+        try:
+            self.exportprecision = parse_int(config, 'tp-export-precision')
+            if self.exportprecision < 0:
+                raise ValueError('<tp-export-precision> must be non-negative')
+        except ValueError as err:
+            eprint('Invalid attribute: ', str(err), '.', sep='')
+            exit(EX_CONFIG)
+        except KeyError: pass
+
+
+    def locate(self, frame):
+        """
+        Locates the features of a single frame based on the current configuration
+        of the particle tracker.
+
+        :param frame: the preprocessed frame
+        :type frame: ``pims.frame.Frame`` or ``numpy.ndarray``
+        :returns: the located features
+        :rtype: ``pandas.DataFrame``
+        """
+
+        return trackpy.locate(frame, diameter=self.locate_diameter,
+                              minmass=self.locate_minmass,
+                              maxsize=self.locate_maxsize,
+                              separation=self.locate_separation,
+                              noise_size=self.locate_noisesize,
+                              smoothing_size=self.locate_smoothingsize,
+                              percentile=self.locate_percentile,
+                              topn=self.locate_topn,
+                              preprocess=self.locate_preprocess,
+                              threshold=self.locate_threshold)
+
+
+    def compact(self, df):
+        """
+        Drops the optional columns of a ``DataFrame`` of features that are not
+        listed in ``tp-locate-columns`` and, if ``tp-locate-compact`` is set,
+        downcasts floating-point columns to ``float32`` and columns ``frame`` and
+        ``particle`` to ``int32``.
+
+        :param df: located features or linked trajectories
+        :type df: ``pandas.DataFrame``
+        :returns: the compacted features
+        :rtype: ``pandas.DataFrame``
+        """
+
+        if self.locate_columns is not None:
+            df = df[[c for c in df.columns
+                     if not c in LOCATE_COLUMNS or c in self.locate_columns]]
+        if self.locate_compact:
+            df = df.astype(dict((c, 'int32' if c in ['frame', 'particle'] else 'float32')
+                                for c in df.columns))
+        return df
+
+    
+    def link(self, features):
+        """
+        Returns a generator that links an iterable of per-frame features based on
+        the current configuration of the particle tracker.
+
+        :param features: the located features, one ``DataFrame`` per frame
+        :type features: iterable
+        :returns: a generator of linked features, one ``DataFrame`` per frame
+        :rtype: generator
+        """
+
+        linker = self.linker()
+        return (self.compact(linker.link(f)) for f in features)
+
+
+    def linker(self):
+        """
+        Returns a new linker configured according to the current configuration of
+        the particle tracker. The state of the linker can be saved in a checkpoint.
+
+        :returns: the linker
+        :rtype: :py:class:`~betrack.utils.checkpoint.ResumableLinker`
+        """
+
+        return ResumableLinker(self.link_searchrange, memory=self.link_memory,
+                               predict=self.link_predict,
+                               adaptive_stop=self.link_adaptivestop,
+                               adaptive_step=self.link_adaptivestep)
+
+    
+    def filter(self, df):
+        """
+        Filters a ``DataFrame`` of linked trajectories by length and/or by clusters
+        based on the current configuration of the particle tracker.
+
+        :param df: the linked trajectories
+        :type df: ``pandas.DataFrame``
+        :returns: the filtered trajectories
+        :rtype: ``pandas.DataFrame``
+        """
+
+        if len(df) == 0: return df
+
+        # Filter out trajectories with few points..
+        if self.filter_stubs_threshold is not None:
+            df = trackpy.filter_stubs(df, threshold=self.filter_stubs_threshold)
 
+        # Filter out trajectories with a mean particle size above a quantile..
+        if (self.filter_clusters_quantile is not None or
+            self.filter_clusters_threshold is not None):
+            df = trackpy.filter_clusters(df, quantile=self.filter_clusters_quantile,
+                                         threshold=self.filter_clusters_threshold)
+
+        return df
+
+    
+    def filtering(self):
+        """
+        Returns whether the current configuration of the particle tracker
+        filters trajectories or not.
+
+        :returns: whether trajectories are filtered or not
+        :rtype: bool
+        """
+
+        return (self.filter_stubs_threshold is not None or
+                self.filter_clusters_quantile is not None or
+                self.filter_clusters_threshold is not None)
+
+    
+    def features_metadata(self, job):
+        """
+        Returns the metadata stored together with the features located for ``job``.
+        These include the metadata of the job, the version of *betrack*, and the
+        parameters used to locate the features.
+
+        :param job: the job whose features are located
+        :type job: :py:class:`~betrack.utils.job.Job`
+        :returns: the metadata of the located features
+        :rtype: dict
+        """
+
+        metadata = job.metadata()
+        metadata['version'] = VERSION
+        metadata['locate']  = {'tp-locate-featuresdark':  self.locate_featuresdark,
+                               'tp-locate-diameter':      self.locate_diameter,
+                               'tp-locate-minmass':       self.locate_minmass,
+                               'tp-locate-maxsize':       self.locate_maxsize,
+                               'tp-locate-separation':    self.locate_separation,
+                               'tp-locate-noisesize':     self.locate_noisesize,
+                               'tp-locate-smoothingsize': self.locate_smoothingsize,
+                               'tp-locate-threshold':     self.locate_threshold,
+                               'tp-locate-percentile':    self.locate_percentile,
+                               'tp-locate-topn':          self.locate_topn,
+                               'tp-locate-preprocess':    self.locate_preprocess,
+                               'tp-locate-compact':       self.locate_compact,
+                               'tp-locate-columns':       self.locate_columns}
+        return metadata
+
+    
     def locate_features(self, job):
         """
         Loops over each frame of the video defined by ``job`` and locates features
         based on the current configuration of the particle tracker. This function
-        stores the results of its execution in a temporary HDF file defined by
-        :py:attr:`betrack.utils.job.Job.h5storage`.
+        stores the results of its execution in the feature store defined by
+        :py:attr:`betrack.utils.job.Job.h5storage`, with the backend selected by
+        ``tp-feature-store``. The store holds the features of each frame with at
+        least one feature and, as attribute ``betrack``, the metadata returned by
+        :py:func:`~betrack.commands.trackparticles.TrackParticles.features_metadata`.
+        The store is deleted when the job is released unless ``tp-keep-features``
+        is set. Every ``tp-checkpoint`` frames, the store is flushed to disk and the
+        last located frame is stored as attribute ``betrack_checkpoint``. If option
+        ``--resume`` is passed, locating continues from the frame following the last
+        checkpoint.
         
         :param job: the job whose features need to be located
         :type job: :py:class:`~betrack.utils.job.Job`
         """
 
         # Initalize storage file..        
-        if isfile(job.h5storage): remove(job.h5storage)
-        
+        metadata = self.features_metadata(job)
+        start    = self.resume_features(job, metadata) if self.resume else job.period[0]
+        mode     = 'w' if start == job.period[0] else 'a'
+        if isfile(job.ckptlinked): remove(job.ckptlinked)
 
         # Locate features in all frames..
         d  = '\033[01m' + '...Locating features'
         ut = ' frame'
-        pf = [dict(features=0)]
 
-        with trackpy.PandasHDFStoreBig(job.h5storage) as sf, tqdm(range(job.period[0], job.period[1]), desc=d, unit=ut, total=job.nframes) as t:
+        with open_store(job.h5storage, self.featurestore, mode=mode) as sf, tqdm(range(start, job.period[1]), desc=d, unit=ut, total=job.nframes, initial=start - job.period[0]) as t:
             for fn in t:
-                features = trackpy.locate(job.pframes[fn], diameter=self.locate_diameter,
-                                          minmass=self.locate_minmass,
-                                          maxsize=self.locate_maxsize,
-                                          separation=self.locate_separation,
-                                          noise_size=self.locate_noisesize,
-                                          smoothing_size=self.locate_smoothingsize,
-                                          percentile=self.locate_percentile,
-                                          topn=self.locate_topn,
-                                          preprocess=self.locate_preprocess,
-                                          threshold=self.locate_threshold)
+                features = self.locate(job.pframes[fn])
                 
                 if hasattr(job.pframes[fn], 'frame_no') and job.pframes[fn].frame_no is not None:
                     frame_no = job.pframes[fn].frame_no
                 else:
                     frame_no          = fn
                     features['frame'] = fn
+                features = self.compact(features)
                     
                 t.set_postfix(nfeatures=len(features))
-                if len(features) == 0:
-                    continue                
-                sf.put(features)        
+                if len(features) > 0: sf.put(features)
+
+                # Save checkpoint..
+                if self.checkpoint > 0 and (fn + 1 - job.period[0]) % self.checkpoint == 0:
+                    sf.set_attr('betrack_checkpoint', dict(frame=fn, metadata=metadata))
+                    sf.flush()
+            sf.set_attr('betrack', metadata)
+            sf.del_attr('betrack_checkpoint')
+
+
+    def resume_features(self, job, metadata):
+        """
+        Returns the frame from which locating the features of ``job`` can be
+        resumed. Features can be resumed only if they have been located with the
+        same metadata, as returned by
+        :py:func:`~betrack.commands.trackparticles.TrackParticles.features_metadata`.
+
+        :param job: the job whose features need to be located
+        :type job: :py:class:`~betrack.utils.job.Job`
+        :param dict metadata: the metadata of the features to be located
+        :returns: the frame following the last checkpoint, the end of the period if
+                  all features are located, or the beginning of the period if
+                  locating cannot be resumed
+        :rtype: int
+        """
+
+        if not store_exists(job.h5storage): return job.period[0]
+        try:
+            with open_store(job.h5storage, self.featurestore, mode='r') as sf:
+                completed  = sf.get_attr('betrack')
+                checkpoint = sf.get_attr('betrack_checkpoint')
+        except Exception:
+            return job.period[0]
+
+        if completed == metadata:
+            return job.period[1]
+        if checkpoint is not None and checkpoint['metadata'] == metadata:
+            return checkpoint['frame'] + 1
+        return job.period[0]
 
         
     def link_trajectories(self, job):
         """
         Loops over each frame of the video defined by ``job`` and links features
         based on the current configuration of the particle tracker. This function
-        stores the results of its execution in a temporary HDF file defined by
-        :py:attr:`betrack.utils.job.Job.h5storage` overwriting the results of the
-        execution of 
-        :py:func:`~betrack.commands.trackparticles.TrackParticles.locate_features`.
+        reads the located features from the feature store defined by
+        :py:attr:`betrack.utils.job.Job.h5storage`, without modifying it, and
+        stores the results of its execution in a temporary feature store defined by
+        :py:attr:`betrack.utils.job.Job.h5linked`. Features can therefore be
+        linked several times with different parameters. Every ``tp-checkpoint``
+        frames, the linked file is flushed to disk and the state of the linker is
+        saved to :py:attr:`betrack.utils.job.Job.ckptlinked`. If option ``--resume``
+        is passed and the checkpoint was saved for the same located features, as
+        given by :py:func:`~betrack.commands.trackparticles.TrackParticles.features_metadata`,
+        and the same link and ``tp-filter-st-*`` attributes, linking continues from
+        the frame following the checkpoint. Checkpoints are not saved for features
+        kept in memory, which do not outlive the process. If attribute
+        ``tp-filter-st-threshold`` is set, short trajectories are dropped by a
+        :py:class:`~betrack.utils.filtering.StubFilter` as soon as they can no
+        longer be extended and never reach the linked store. If attribute
+        ``tp-export-progressive`` is set, linked frames are also appended to the
+        exported trajectories by a :py:class:`~betrack.utils.writers.ProgressiveWriter`
+        as soon as they are final, and the file is flushed every
+        ``tp-export-progressive`` frames; the file is later exported again at once
+        by :py:func:`~betrack.commands.trackparticles.TrackParticles.export_trajectories`.
+        Linked trajectories are then loaded in memory or, if attribute ``tp-out-of-core``
+        is set, only referenced by :py:attr:`betrack.utils.job.Job.trajectories`.
 
         .. note:: This function must be called after a call to
                   :py:func:`~betrack.commands.trackparticles.TrackParticles.locate_features`.
@@ -347,28 +845,93 @@ class TrackParticles(BetrackCommand):
         :type job: :py:class:`~betrack.utils.job.Job`
         """
         
-        with trackpy.PandasHDFStoreBig(job.h5storage) as sf:
-            d  = '\033[01m' + '...Linking trajectories'
-            ut = ' frame'
-            if self.link_predict: tp = trackpy.predict.NearestVelocityPredict()
-            else: tp = trackpy
-            for linked in tqdm(tp.link_df_iter(sf,
-                                               search_range=self.link_searchrange,
-                                               memory=self.link_memory,
-                                               adaptive_stop=self.link_adaptivestop,
-                                               adaptive_step=self.link_adaptivestep),
-                               desc=d, unit=ut, total=job.nframes):
-                sf.put(linked)
-            job.dflink = sf.dump()
+        parameters = {'locate':                 self.features_metadata(job),
+                      'tp-link-searchrange':    self.link_searchrange,
+                      'tp-link-memory':         self.link_memory,
+                      'tp-link-predict':        self.link_predict,
+                      'tp-link-adaptivestop':   self.link_adaptivestop,
+                      'tp-link-adaptivestep':   self.link_adaptivestep,
+                      'tp-filter-st-threshold': self.filter_stubs_threshold}
+        checkpoint = load_checkpoint(job.ckptlinked) if self.resume else None
+        if (checkpoint is None or checkpoint['parameters'] != parameters or
+            not store_exists(job.h5linked)):
+            # A stale checkpoint would not match the linked store once rewritten..
+            if isfile(job.ckptlinked): remove(job.ckptlinked)
+            stubs      = None
+            if self.filter_stubs_threshold is not None:
+                stubs  = StubFilter(self.filter_stubs_threshold, memory=self.link_memory)
+            checkpoint = dict(frame=None, linker=self.linker(), stubs=stubs,
+                              parameters=parameters)
+        linker = checkpoint['linker']
+        stubs  = checkpoint['stubs']
+        mode   = 'w' if checkpoint['frame'] is None else 'a'
+        
+        with open_store(job.h5storage, self.featurestore, mode='r') as sf, open_store(job.h5linked, self.featurestore, mode=mode) as sl:
+            d      = '\033[01m' + '...Linking trajectories'
+            ut     = ' frame'
+            frames = [fn for fn in sf.frames
+                      if checkpoint['frame'] is None or fn > checkpoint['frame']]
+            nlinked = len(sf.frames) - len(frames)
+            linked  = []
+            if checkpoint['frame'] is not None:
+                held   = [] if stubs is None else stubs.held_frames()
+                linked = (sl.get(fn) for fn in sl.frames
+                          if fn <= checkpoint['frame'] and not fn in held)
+            writer  = self.progressive_writer(job, linked)
+            for fn in tqdm(frames, desc=d, unit=ut, total=job.nframes,
+                           initial=nlinked, disable=not self.progress):
+                df     = self.compact(linker.link(sf.get(fn)))
+                linked = [df] if stubs is None else stubs.push(df)
+                for df in linked: sl.put(df)
+                if writer is not None: writer.push(linked, fn)
+                nlinked += 1
+
+                # Save checkpoint..
+                if (self.checkpoint > 0 and nlinked % self.checkpoint == 0 and
+                    self.featurestore != 'memory'):
+                    sl.flush()
+                    checkpoint['frame'] = fn
+                    save_checkpoint(job.ckptlinked, checkpoint)
+            linked = [] if stubs is None else stubs.flush()
+            for df in linked: sl.put(df)
+            if writer is not None: writer.close(linked)
+        if isfile(job.ckptlinked): remove(job.ckptlinked)
+        job.load_trajectories(job.h5linked)
                 
                 
         
+    def progressive_writer(self, job, linked):
+        """
+        Returns a writer appending the frames of ``job`` to its exported
+        trajectories while they are linked, if attribute ``tp-export-progressive``
+        is set. The frames already ``linked`` before resuming, if any, are written first.
+
+        :param job: the job whose features are being linked
+        :type job: :py:class:`~betrack.utils.job.Job`
+        :param linked: the frames already linked
+        :type linked: iterable
+        :returns: the writer, or ``None`` if frames are not written while linked
+        :rtype: :py:class:`~betrack.utils.writers.ProgressiveWriter`
+        """
+
+        if self.exportprogressive is None: return None
+        offset = [job.margins[0], job.margins[2]] if job.valid_margins() else None
+        f      = open_output(job.tracks_file(self.exportas), job.compression)
+        writer = ProgressiveWriter(f, self.exportas, memory=self.link_memory,
+                                   nframes=self.exportprogressive,
+                                   precision=self.exportprecision, offset=offset)
+        writer.write(linked)
+        return writer
+
+
     def filter_trajectories(self, job):
         """
         Filters the trajectories of the video defined by ``job`` based on the current 
         configuration of the particle tracker. This function can filter trajectories
         by length in terms of minimum number of frames and/or by clusters in terms of
-        minimum feature size.
+        minimum feature size. Out of core, trajectories are filtered by streaming
+        over their store with :py:func:`~betrack.utils.filtering.filter_store` and
+        are stored in :py:attr:`betrack.utils.job.Job.h5filtered`.
 
         .. note:: This function must be called after a call to
                   :py:func:`~betrack.commands.trackparticles.TrackParticles.link_trajectories`.
@@ -377,18 +940,260 @@ class TrackParticles(BetrackCommand):
         :type job: :py:class:`~betrack.utils.job.Job`
         """
 
-        # Filter out trajectories with few points..
-        if self.filter_stubs_threshold is not None:
-            job.dflink = trackpy.filter_stubs(job.dflink,
-                                              threshold=self.filter_stubs_threshold)
+        if job.dflink is not None:
+            job.dflink = self.filter(job.dflink)
+            return
+
+        filter_store(job.trajectories, job.h5filtered, kind=self.featurestore,
+                     stubs_threshold=self.filter_stubs_threshold,
+                     clusters_quantile=self.filter_clusters_quantile,
+                     clusters_threshold=self.filter_clusters_threshold)
+        job.trajectories = job.h5filtered
+
+        
+    def sweep_trajectories(self, job):
+        """
+        Links, filters, and exports the trajectories of ``job`` once for each
+        variant of the link and filter attributes. All variants read the features
+        located by a single call to
+        :py:func:`~betrack.commands.trackparticles.TrackParticles.locate_features`
+        and are processed in parallel by a pool of worker processes, or one after
+        the other if features are kept in memory, as worker processes cannot read
+        the feature stores of this process. The output files of each variant are
+        identified by the suffix ``-v<n>`` and the swept values of each variant are
+        exported in :py:attr:`betrack.utils.job.Job.csvsweep`.
+
+        .. note:: This function must be called after a call to
+                  :py:func:`~betrack.commands.trackparticles.TrackParticles.locate_features`.
+
+        :param job: the job whose trajectories need to be swept
+        :type job: :py:class:`~betrack.utils.job.Job`
+        """
+
+        width = len(str(len(self.sweep)))
+        tasks = [(t, job.variant('-v' + str(i).zfill(width)))
+                 for t, i in zip(self.sweep, range(1, len(self.sweep) + 1))]
+
+        # Export swept values..
+        table = pandas.DataFrame(self.variants, index=[j.suffix[1:] for t, j in tasks])
+        table.to_csv(job.csvsweep)
+        
+        # Process variants..
+        d     = '\033[01m' + '...Sweeping trajectories'
+        ut    = ' variant'
+        nproc = min(self.nprocesses, len(tasks))
+        if self.featurestore == 'memory': nproc = 1
+        if nproc > 1:
+            pool = Pool(nproc)
+            try:
+                for r in tqdm(pool.imap_unordered(_process_variant, tasks), desc=d,
+                              unit=ut, total=len(tasks)): pass
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for r in tqdm(map(_process_variant, tasks), desc=d, unit=ut,
+                          total=len(tasks)): pass
+
+        
+    def stages(self):
+        """
+        Returns the stages of the processing of a job in topological order. Each
+        stage depends on the configuration attributes with the given prefixes and
+        on the artifacts of its input stages: 
+        ``locate`` (``tp-locate-*`` and ``tp-feature-store``) produces :py:attr:`betrack.utils.job.Job.h5storage`,
+        ``link`` (``tp-link-*``, ``tp-filter-st-*``, and ``tp-feature-store``) produces :py:attr:`betrack.utils.job.Job.h5linked`,
+        ``filter`` (``tp-filter-*``) produces :py:attr:`betrack.utils.job.Job.h5filtered`,
+        ``export`` (``tp-export*``) produces the exported trajectories or the
+        manifest of their shards, and 
+        ``annotate`` (``av-*``) produces :py:attr:`betrack.utils.job.Job.avitracked`.
+        The ``filter`` stage is planned only if trajectories are filtered, otherwise
+        the ``export`` and ``annotate`` stages read the linked trajectories.
+        Decoding the video is not a stage on its own as frames are decoded lazily
+        by the ``locate`` and ``annotate`` stages. When sweeping link and filter
+        attributes, the ``locate`` stage is followed by a ``sweep`` stage
+        (``tp-link-*``, ``tp-filter-*``, and ``tp-export*``, including the swept
+        values) that produces :py:attr:`betrack.utils.job.Job.csvsweep`.
+
+        :returns: the list of stages
+        :rtype: list
+        """
+
+        stages = [Stage('locate', ['tp-locate-', 'tp-feature-store'], [],
+                        lambda job: job.h5storage),
+                  Stage('link', ['tp-link-', 'tp-filter-st-', 'tp-feature-store'], ['locate'],
+                        lambda job: job.h5linked)]
+        if self.filtering():
+            stages.append(Stage('filter', ['tp-filter-'], ['link'], lambda job: job.h5filtered))
+        source  = stages[-1].name
+        stages += [Stage('export', ['tp-export'], [source], self.exported_file),
+                   Stage('annotate', ['av-'], [source], lambda job: job.avitracked)]
+        if len(self.sweep) > 0:
+            return [stages[0], Stage('sweep', ['tp-link-', 'tp-filter-', 'tp-export'],
+                                     ['locate'], lambda job: job.csvsweep)]
+        return stages
+
+
+    def exported_file(self, job):
+        """
+        Returns the artifact of the ``export`` stage of ``job``, that is, the
+        manifest of the shards of the exported trajectories if they are exported in
+        shards, and the file of the exported trajectories otherwise.
+
+        :param job: the job to be processed
+        :type job: :py:class:`~betrack.utils.job.Job`
+        :returns: the name of the file
+        :rtype: str
+        """
+
+        if self.exportshards is not None: return job.shards_file(self.exportas)
+        return job.tracks_file(self.exportas)
+
+
+    def plan(self, job):
+        """
+        Determines which stages of ``job`` need to be executed. If caching is
+        disabled by attribute ``tp-cache`` or if option ``--force`` is passed, all
+        stages are executed. Otherwise only stages that are invalidated by a
+        change of the video, of the job, or of the configuration attributes they
+        depend on, or whose artifacts are missing, are executed.
+
+        :param job: the job to be processed
+        :type job: :py:class:`~betrack.utils.job.Job`
+        :returns: the plan returned by :py:func:`~betrack.utils.stages.plan_stages`
+        :rtype: list
+        """
+
+        force     = self.options.get('--force', False) or not self.cache
+        signature = video_signature(job.video, digest=self.cachedigest)
+        manifest  = load_manifest(job.jsonmanifest) if self.cache else {}
+        return plan_stages(self.stages(), signature, job, self.config, manifest,
+                           force=force)
+
+
+    def process_job(self, job, plan):
+        """
+        Executes the stages of ``job`` selected by ``plan``. The artifacts of stages
+        that are up to date are read from disk when needed by the following stages.
+        If caching is enabled, the digest of each executed stage is saved to
+        :py:attr:`betrack.utils.job.Job.jsonmanifest` as soon as the stage completes.
+
+        .. note:: This function must be called after a call to
+                  :py:func:`~betrack.utils.job.Job.preprocess_video`.
+
+        :param job: the job to be processed
+        :type job: :py:class:`~betrack.utils.job.Job`
+        :param list plan: the plan returned by
+                          :py:func:`~betrack.commands.trackparticles.TrackParticles.plan`
+        """
+
+        torun    = [stage.name for stage, digest, reason in plan if reason is not None]
+        digests  = dict((stage.name, digest) for stage, digest, reason in plan)
+        manifest = load_manifest(job.jsonmanifest) if self.cache else {}
+
+        def completed(stage):
+            if not self.cache: return
+            manifest[stage] = digests[stage]
+            save_manifest(job.jsonmanifest, manifest)
+
+        # Locate features..
+        if 'locate' in torun:
+            self.locate_features(job)
+            completed('locate')
+
+        # Link, filter, and export each variant of a sweep..
+        if len(self.sweep) > 0:
+            if 'sweep' in torun:
+                self.sweep_trajectories(job)
+                completed('sweep')
+            return
+
+        # Link trajectories..
+        if 'link' in torun:
+            self.link_trajectories(job)
+            completed('link')
+
+        # Filter trajectories..
+        if 'filter' in torun:
+            if job.dflink is None and job.trajectories is None:
+                job.load_trajectories(job.h5linked)
+            mprint('...Filtering trajectories:', end='\r')
+            stdout.flush()
+            self.filter_trajectories(job)
+            mprint('...Filtering trajectories: Done')            
+            if self.cache and job.trajectories != job.h5filtered:
+                job.store_trajectories(job.h5filtered)
+            completed('filter')
+        elif ('export' in torun or 'annotate' in torun) and \
+             ('link' not in torun or (job.dflink is None and job.trajectories is None)):
+            job.load_trajectories(job.h5filtered if self.filtering() else job.h5linked)
+
+        # Export trajectories..
+        if 'export' in torun:
+            mprint('...Exporting trajectories (', self.exportas, '):', sep='', end='\r')
+            stdout.flush()
+            self.export_trajectories(job)
+            mprint('...Exporting trajectories (', self.exportas, '): Done', sep='')
+            self.report_export(job)
+            completed('export')
+        elif 'annotate' in torun:
+            job.translate_trajectories()
+
+        # Export annotated video..
+        if 'annotate' in torun:
+            self.export_video(job)
+            completed('annotate')
+
+        
+    def report_export(self, job):
+        """
+        Prints the compression ratio and the throughput of the last export of
+        ``job``, if compressed.
+
+        :param job: the job whose trajectories were exported
+        :type job: :py:class:`~betrack.utils.job.Job`
+        """
+
+        if job.compression is None or job.exportstats is None: return
+        rawbytes, nbytes, seconds = job.exportstats
+        mb = 1024.0 * 1024.0
+        mprint('...Compressed trajectories (', job.compression, '): ',
+               '{:.1f} MB to {:.1f} MB, ratio {:.2f}, {:.1f} MB/s'.format(
+               rawbytes / mb, nbytes / mb, rawbytes / float(max(nbytes, 1)),
+               rawbytes / mb / max(seconds, 1e-6)), sep='')
+
+        
+    def export_trajectories(self, job, nprocesses=None, source=None):
+        """
+        Exports the trajectories of ``job`` and their summary, if enabled by attribute
+        ``tp-export-summary``, in the format given by attribute ``tp-exportas``.
+        CSV and NDJSON files are formatted by ``tp-nprocesses`` worker processes, unless
+        ``nprocesses`` is given, with floats rounded to ``tp-export-precision``
+        decimal digits, and compressed with ``tp-export-compression``, if given.
+        Parquet files have a row group for each range of
+        ``tp-export-rowgroup`` frames and HDF5 files a table for each range of
+        ``tp-export-hdf-nodes`` frames, if given. If ``tp-export-shards`` is
+        given, trajectories are split in a file for each range of
+        ``tp-export-shards`` frames, listed in a manifest.
+
+        :param job: the job whose trajectories need to be exported
+        :type job: :py:class:`~betrack.utils.job.Job`
+        :param int nprocesses: the number of worker processes, if not ``tp-nprocesses``
+        :param source: a function returning an iterator over already exported
+                       trajectories to export again, if any
+        :type source: callable
+        :returns: the number of exported rows
+        :rtype: int
+        """
+
+        if nprocesses is None: nprocesses = self.nprocesses
+        return job.export_trajectories(self.exportas, summary=self.exportsummary,
+                                       precision=self.exportprecision,
+                                       nprocesses=nprocesses,
+                                       rowgroup=self.exportrowgroup,
+                                       hdfnodes=self.exporthdfnodes,
+                                       shards=self.exportshards, source=source)
 
-        # Filter out trajectories with a mean particle size above a quantile..
-        if (self.filter_clusters_quantile is not None or
-            self.filter_clusters_threshold is not None):
-            job.dflink = trackpy.filter_clusters(job.dflink,
-                                                 quantile=self.filter_clusters_quantile,
-                                                 threshold=self.filter_clusters_threshold)
-            
         
     def export_video(self, job):
         """
@@ -429,7 +1234,10 @@ class TrackParticles(BetrackCommand):
         This method processes in a batch a sequence of videos with the aim to
         track the position and identity of particles. It preprocesses each video, locates
         features, links and filters their trajectories, and exports the results both
-        as a data file and as an annotated video. 
+        as a data file and as an annotated video. Stages that are up to date with 
+        respect to a previous execution are skipped unless option ``--force`` is
+        passed. With option ``--dry-run``, the stages that would be executed are
+        only printed.
 
         :returns: ``os.EX_OK`` on success or ``os.EX_CONFIG`` otherwise
         :rtype: int
@@ -448,6 +1256,23 @@ class TrackParticles(BetrackCommand):
         for job, i in zip(self.jobs, range(1, njobs + 1)):
             mprint('Working on job ', i, ':', sep='')
             mprint(job.str(ind='...'))
+
+            # Plan stages..
+            try:
+                plan = self.plan(job)
+            except (IOError, OSError):
+                wprint('...Unable to load video. Skipping job.')
+                continue
+            if self.options.get('--dry-run', False):
+                for stage, digest, reason in plan:
+                    if reason is None: mprint('...Stage ', stage.name, ': skip (up to date)', sep='')
+                    else:              mprint('...Stage ', stage.name, ': run (', reason, ')', sep='')
+                completed += 1
+                continue
+            if all(reason is None for stage, digest, reason in plan):
+                mprint('...All stages are up to date. Skipping job.')
+                completed += 1
+                continue
             
             # Open video..
             try:
@@ -469,29 +1294,8 @@ class TrackParticles(BetrackCommand):
                 continue            
             mprint('...Preprocessing video: Done')
 
-            # Locate features..
-            self.locate_features(job)
-
-            # Link trajectories..
-            self.link_trajectories(job)
-
-            # Filter trajectories..
-            if (self.filter_stubs_threshold is not None or
-                self.filter_clusters_quantile is not None or
-                self.filter_clusters_threshold is not None):
-                mprint('...Filtering trajectories:', end='\r')
-                stdout.flush()
-                self.filter_trajectories(job)
-                mprint('...Filtering trajectories: Done')            
-
-            # Export trajectories..
-            mprint('...Exporting trajectories (', self.exportas, '):', sep='', end='\r')
-            stdout.flush()
-            job.export_trajectories(self.exportas)
-            mprint('...Exporting trajectories (', self.exportas, '): Done', sep='')
-
-            # Export annotated video..
-            self.export_video(job)
+            # Locate, link, filter, and export..
+            self.process_job(job, plan)
 
             # Clean up..
             mprint('...Release job resources:', end='\r')
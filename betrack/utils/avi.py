@@ -0,0 +1,143 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+The module :py:mod:`~betrack.utils.avi` concatenates AVI files without decoding
+their frames. Frames of a video encoded as Motion JPEG (MJPG) are independent
+images, so that the frame chunks of consecutive segments of a video can be
+copied one after another. The function :py:func:`~betrack.utils.avi.concat_avi`
+joins segments written with the same settings by ``cv2.VideoWriter`` in a file
+identical to the one written at once for the whole video, as long as the encoder
+does not carry state from a frame to the next, as the MJPEG encoder of
+``OpenCV``, selected by ``cv2.CAP_OPENCV_MJPEG``. Only AVI 1.0 files, of at most
+1 GiB, are supported; writers switch to the OpenDML extensions for larger files.
+"""
+
+
+from struct import pack, unpack_from
+
+
+# Size of the first RIFF list after which writers switch to OpenDML..
+AVI_MAX_RIFF_SIZE = 1024 * 1024 * 1024
+
+
+def _chunks(data, start, stop):
+    """
+    Returns the identifier, the offset, and the size of the payload of each
+    chunk or list found in ``data[start:stop]``.
+    """
+
+    chunks = []
+    while start + 8 <= stop:
+        cid, size = data[start:start + 4], unpack_from('<I', data, start + 4)[0]
+        chunks.append((cid, start + 8, size))
+        start += 8 + size + (size & 1)
+    return chunks
+
+
+def read_avi(filename):
+    """
+    Reads the AVI file ``filename`` and locates the chunks needed to join it to
+    other files.
+
+    :param str filename: the AVI file
+    :returns: the content of the file and the offsets of its main header, of the
+              header of its video stream, of its OpenDML header, if any, of its
+              ``movi`` list, and of its index
+    :rtype: dict
+    :raises ValueError: if the file is not an AVI 1.0 file with an index
+    """
+
+    with open(filename, 'rb') as f: data = f.read()
+    if data[0:4] != b'RIFF' or data[8:12] != b'AVI ':
+        raise ValueError('not an AVI file: ' + filename)
+    riff = _chunks(data, 0, len(data))
+    if len(riff) != 1: raise ValueError('OpenDML files are not supported: ' + filename)
+
+    avi     = {'data': data, 'avih': None, 'strh': None, 'dmlh': None}
+    pending = [(12, 8 + riff[0][2])]
+    while len(pending) > 0:
+        start, stop = pending.pop()
+        for cid, offset, size in _chunks(data, start, stop):
+            if cid == b'LIST':
+                kind = data[offset:offset + 4]
+                if kind == b'movi': avi['movi'] = (offset, size)
+                else:               pending.append((offset + 4, offset + size))
+            elif cid == b'avih': avi['avih'] = offset
+            elif cid == b'dmlh': avi['dmlh'] = offset
+            elif cid == b'strh' and data[offset:offset + 4] == b'vids' and avi['strh'] is None:
+                avi['strh'] = offset
+            elif cid == b'idx1' and start == 12: avi['idx1'] = (offset, size)
+    if not 'movi' in avi or not 'idx1' in avi or avi['avih'] is None or avi['strh'] is None:
+        raise ValueError('not an indexed AVI file: ' + filename)
+    return avi
+
+
+def concat_avi(filenames, filename):
+    """
+    Concatenates the AVI files ``filenames`` in the AVI file ``filename`` by
+    copying their chunks. The headers of the first file are copied as well,
+    updating the number of frames, the suggested size of the buffers, and the
+    size of the lists. The index of each file is appended to the index of the
+    previous ones, shifting its offsets.
+
+    .. note:: Files must hold a single video stream written with the same
+              settings, as the segments of a video written by ``cv2.VideoWriter``.
+
+    :param list filenames: the AVI files to concatenate, in order
+    :param str filename: the concatenated AVI file
+    :returns: the number of frames of the concatenated file
+    :rtype: int
+    :raises ValueError: if a file is not an indexed AVI 1.0 file or if the
+                        concatenated file would exceed the size of AVI 1.0 files
+    """
+
+    segments  = [read_avi(f) for f in filenames]
+    first     = segments[0]
+    movi      = first['movi'][0]
+    header    = bytearray(first['data'][0:movi + 4])
+    absolute  = None
+    index     = []
+    nframes   = 0
+    buffers   = [0, 0]
+    position  = 4
+    for s in segments:
+        d            = s['data']
+        offset, size = s['movi']
+
+        # Offsets of the index are relative to the 'movi' identifier or to the file..
+        entries  = [unpack_from('<4sIII', d, s['idx1'][0] + e)
+                    for e in range(0, s['idx1'][1] - 15, 16)]
+        base     = offset if len(entries) > 0 and entries[0][2] >= offset else 0
+        if absolute is None and len(entries) > 0: absolute = base > 0
+        for c, flags, o, n in entries:
+            r = o - base + position - 4
+            if movi + r - 8 > AVI_MAX_RIFF_SIZE:
+                raise ValueError('concatenated file exceeds the size of AVI 1.0 files')
+            index.append(pack('<4sIII', c, flags, r + (movi if absolute else 0), n))
+
+        nframes     += unpack_from('<I', d, s['strh'] + 32)[0]
+        buffers[0]   = max(buffers[0], unpack_from('<I', d, s['avih'] + 28)[0])
+        buffers[1]   = max(buffers[1], unpack_from('<I', d, s['strh'] + 36)[0])
+        s['content'] = d[offset + 4:offset + size]
+        position    += size - 4
+
+    # Update headers..
+    total = len(header) + position - 4 + 8 + 16 * len(index)
+    header[4:8] = pack('<I', total - 8)
+    header[movi - 4:movi] = pack('<I', position)
+    header[first['avih'] + 16:first['avih'] + 20] = pack('<I', nframes)
+    header[first['avih'] + 28:first['avih'] + 32] = pack('<I', buffers[0])
+    header[first['strh'] + 32:first['strh'] + 36] = pack('<I', nframes)
+    header[first['strh'] + 36:first['strh'] + 40] = pack('<I', buffers[1])
+    if first['dmlh'] is not None:
+        header[first['dmlh']:first['dmlh'] + 4] = pack('<I', nframes)
+
+    with open(filename, 'wb') as f:
+        f.write(header)
+        for s in segments: f.write(s['content'])
+        f.write(b'idx1' + pack('<I', 16 * len(index)))
+        for e in index: f.write(e)
+    return nframes
@@ -0,0 +1,153 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+The module :py:mod:`~betrack.utils.checkpoint` allows long stages of a job to be
+interrupted and resumed. The class
+:py:class:`~betrack.utils.checkpoint.ResumableLinker` links features frame by
+frame like ``trackpy.link_df_iter`` but its state can be pickled at any frame,
+while the functions :py:func:`~betrack.utils.checkpoint.save_checkpoint` and
+:py:func:`~betrack.utils.checkpoint.load_checkpoint` write and read checkpoints
+atomically.
+"""
+
+
+try:
+    from os import replace
+except ImportError:
+    from os import rename as replace
+
+from numpy   import empty
+import pickle
+import trackpy
+from trackpy.linking.linking import Linker, TrackUnstored
+from trackpy.linking.utils   import Point
+
+
+def _identity(x):
+    """
+    Identity transformation of coordinates. Unlike the default transformation of
+    ``trackpy``, this function can be pickled.
+    """
+
+    return x
+
+
+class ResumableLinker(object):
+    """
+    The class :py:class:`~betrack.utils.checkpoint.ResumableLinker` links the
+    features of a video one frame at a time with the Crocker-Grier algorithm of
+    ``trackpy``. Its state, including the counters used by ``trackpy`` to label
+    trajectories, can be pickled and restored to continue linking from the last
+    linked frame.
+    """
+
+    def __init__(self, search_range, memory=0, predict=False, adaptive_stop=None,
+                 adaptive_step=0.95, pos_columns=['y', 'x'], t_column='frame'):
+        """
+        Constructor for the class :py:class:`~betrack.utils.checkpoint.ResumableLinker`.
+
+        :param search_range: the maximum distance features can move between frames
+        :type search_range: float or int
+        :param int memory: the maximum number of frames a feature can vanish
+        :param bool predict: whether to predict the motion of features or not
+        :param float adaptive_stop: the lower bound of the adaptive search range
+        :param float adaptive_step: the reduction factor of the adaptive search range
+        :param list pos_columns: the names of the position columns
+        :param str t_column: the name of the frame column
+        """
+
+        self.pos_columns = pos_columns
+        self.t_column    = t_column
+        self.predictor   = None
+        if predict:
+            self.predictor          = trackpy.predict.NearestVelocityPredict(pos_columns=pos_columns)
+            self.predictor.t_column = t_column
+        self.linker      = Linker(search_range, memory=memory, to_eucl=_identity,
+                                  predictor=None if self.predictor is None else self.predictor.predict,
+                                  adaptive_stop=adaptive_stop, adaptive_step=adaptive_step)
+        self.initialized = False
+
+
+    def link(self, df):
+        """
+        Links the features of a new frame to the trajectories of the previous ones.
+
+        :param df: the features of a frame
+        :type df: ``pandas.DataFrame``
+        :returns: a copy of ``df`` with the additional column ``particle``
+        :rtype: ``pandas.DataFrame``
+        """
+
+        if len(df) == 0:
+            t, coords = None, empty((0, len(self.pos_columns)))
+        else:
+            t, coords = df[self.t_column].iloc[0], df[self.pos_columns].values
+
+        if self.initialized:
+            self.linker.next_level(coords, t)
+        else:
+            self.linker.init_level(coords, t)
+            self.initialized = True
+
+        linked             = df.copy()
+        linked['particle'] = self.linker.particle_ids
+        if self.predictor is not None: self.predictor.observe(linked)
+        return linked
+
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['counters'] = [_get_counter(TrackUnstored), _get_counter(Point)]
+        return state
+
+
+    def __setstate__(self, state):
+        counters = state.pop('counters')
+        self.__dict__.update(state)
+        TrackUnstored.reset_counter(counters[0])
+        Point.reset_counter(counters[1])
+
+
+def _get_counter(cls):
+    """
+    Returns the next value of the counter of a ``trackpy`` class without
+    consuming it.
+    """
+
+    c = next(cls.counter)
+    cls.reset_counter(c)
+    return c
+
+
+def save_checkpoint(filename, checkpoint):
+    """
+    Saves a checkpoint to a file. The checkpoint is first written to a temporary
+    file which then replaces ``filename``, so that an interruption never leaves
+    an incomplete checkpoint behind.
+
+    :param str filename: the name of the checkpoint file
+    :param checkpoint: any picklable object
+    """
+
+    tmpname = filename + '.tmp'
+    with open(tmpname, 'wb') as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+    replace(tmpname, filename)
+
+
+def load_checkpoint(filename):
+    """
+    Loads a checkpoint from a file.
+
+    :param str filename: the name of the checkpoint file
+    :returns: the checkpoint or ``None`` if the file does not exist or is not valid
+    """
+
+    try:
+        with open(filename, 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        return None
@@ -0,0 +1,223 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+The module :py:mod:`~betrack.utils.compression` compresses exported files while
+they are written. The class :py:class:`~betrack.utils.compression.CompressedFile`
+splits the written text in blocks, compresses each block in a pool of background
+threads, as compressors release the interpreter lock, and writes the compressed
+blocks in order. Each block is a complete gzip member, zstd frame, or lz4 frame,
+and the concatenation of these is a valid compressed file that can be read by
+the usual tools and, except for lz4, by ``pandas``. The compressors of zstd and
+lz4 require the optional packages ``zstandard`` and ``lz4``. The function
+:py:func:`~betrack.utils.compression.open_input` reads these files back as text.
+"""
+
+
+from collections     import deque
+from multiprocessing.pool import ThreadPool
+from time            import time
+from io              import TextIOWrapper
+import gzip
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+
+# Supported compressions and extension of compressed files..
+COMPRESSIONS = {'gzip': '.gz', 'zstd': '.zst', 'lz4': '.lz4'}
+
+
+def compression_available(compression):
+    """
+    Returns ``True`` if the optional package required by ``compression`` is installed.
+
+    :param str compression: either ``'gzip'``, ``'zstd'``, or ``'lz4'``
+    :rtype: bool
+    """
+
+    return ((compression == 'gzip') or (compression == 'zstd' and zstandard is not None) or
+            (compression == 'lz4' and lz4 is not None))
+
+
+def compress(args):
+    """
+    Compresses a block of bytes as a complete gzip member, zstd frame, or lz4 frame.
+
+    :param tuple args: the block and the compression
+    :returns: the compressed block
+    :rtype: bytes
+    """
+
+    data, compression = args
+    if compression == 'gzip':
+        c = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return c.compress(data) + c.flush()
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return lz4.frame.compress(data)
+
+
+class CompressedFile(object):
+    """
+    The class :py:class:`~betrack.utils.compression.CompressedFile` is a file
+    opened for writing text that is compressed by ``nthreads`` background threads
+    in blocks of ``blocksize`` bytes. At most ``2 * nthreads`` blocks are
+    compressed at any time, so that memory does not grow with the size of the
+    file. The number of bytes written before and after compression and the time
+    elapsed since the file was opened are available once the file is closed.
+    """
+
+    def __init__(self, filename, compression, nthreads=1, blocksize=4 * 1024 * 1024):
+        """
+        Constructor for the class :py:class:`~betrack.utils.compression.CompressedFile`.
+
+        :param str filename: the name of the file
+        :param str compression: either ``'gzip'``, ``'zstd'``, or ``'lz4'``
+        :param int nthreads: the number of compressing threads
+        :param int blocksize: the number of bytes compressed at once
+        """
+
+        self.compression = compression
+        self.nthreads    = max(1, nthreads)
+        self.blocksize   = blocksize
+        self.rawbytes    = 0        # Number of bytes written
+        self.bytes       = 0        # Number of compressed bytes
+        self.seconds     = 0.0      # Time elapsed until the file is closed
+        self.file        = open(filename, 'wb')
+        self.pool        = ThreadPool(self.nthreads)
+        self.buffer      = []
+        self.buffered    = 0
+        self.pending     = deque()
+        self.start       = time()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+    def write(self, text):
+        """
+        Writes ``text`` to the file.
+
+        :param str text: the text to write
+        """
+
+        data = text.encode('utf-8')
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= self.blocksize: self._submit()
+
+
+    def _submit(self):
+        """
+        Compresses the buffered bytes in the background.
+        """
+
+        if self.buffered == 0: return
+        data = b''.join(self.buffer)
+        self.rawbytes += len(data)
+        self.buffer    = []
+        self.buffered  = 0
+        self.pending.append(self.pool.apply_async(compress, ((data, self.compression),)))
+        while len(self.pending) >= 2 * self.nthreads: self._write()
+
+
+    def _write(self):
+        """
+        Writes the oldest compressed block to the file.
+        """
+
+        data        = self.pending.popleft().get()
+        self.bytes += len(data)
+        self.file.write(data)
+
+
+    def flush(self):
+        """
+        Compresses the buffered bytes and writes all compressed blocks to the file,
+        so that the file can be read up to the last written text.
+        """
+
+        self._submit()
+        while len(self.pending) > 0: self._write()
+        self.file.flush()
+
+
+    def close(self):
+        """
+        Compresses the remaining bytes and closes the file.
+        """
+
+        if self.file.closed: return
+        try:
+            self._submit()
+            while len(self.pending) > 0: self._write()
+        finally:
+            self.pool.close()
+            self.pool.join()
+            self.file.close()
+            self.seconds = time() - self.start
+
+
+def file_compression(filename):
+    """
+    Returns the compression of ``filename`` given by its extension, if any.
+
+    :param str filename: the name of the file
+    :returns: either ``None``, ``'gzip'``, ``'zstd'``, or ``'lz4'``
+    :rtype: str
+    """
+
+    for compression, extension in COMPRESSIONS.items():
+        if filename.endswith(extension): return compression
+    return None
+
+
+def open_input(filename):
+    """
+    Opens a text file for reading, decompressing it if its extension is one of
+    ``COMPRESSIONS``.
+
+    :param str filename: the name of the file
+    :returns: the opened file
+    :raises ValueError: if the package required to decompress the file is not installed
+    """
+
+    compression = file_compression(filename)
+    if compression is None: return open(filename, 'r')
+    if not compression_available(compression):
+        raise ValueError('reading \'' + filename + '\' requires package ' +
+                         ('zstandard' if compression == 'zstd' else 'lz4'))
+    if compression == 'gzip': return TextIOWrapper(gzip.open(filename, 'rb'), encoding='utf-8')
+    if compression == 'lz4':  return TextIOWrapper(lz4.frame.open(filename, 'rb'), encoding='utf-8')
+    reader = zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'),
+                                                        read_across_frames=True,
+                                                        closefd=True)
+    return TextIOWrapper(reader, encoding='utf-8')
+
+
+def open_output(filename, compression=None, nthreads=1):
+    """
+    Opens a text file for writing, compressed with ``compression`` if given.
+
+    :param str filename: the name of the file
+    :param str compression: either ``None``, ``'gzip'``, ``'zstd'``, or ``'lz4'``
+    :param int nthreads: the number of compressing threads
+    :returns: the opened file
+    """
+
+    if compression is None: return open(filename, 'w')
+    return CompressedFile(filename, compression, nthreads=nthreads)
@@ -0,0 +1,421 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+The module :py:mod:`~betrack.utils.featurestore` defines the storage of the
+features located and linked by the ``track-particles`` command. Features are
+stored framewise through the interface defined by the class
+:py:class:`~betrack.utils.featurestore.FeatureStore`, which is implemented by three
+backends:
+
+* ``hdf``: :py:class:`~betrack.utils.featurestore.HDFFeatureStore`, a compressed
+  HDF5 file with one table per frame readable by ``trackpy.PandasHDFStoreBig``;
+* ``memory``: :py:class:`~betrack.utils.featurestore.MemoryFeatureStore`, a store
+  kept in the memory of the current process, suited for small jobs;
+* ``columnar``: :py:class:`~betrack.utils.featurestore.ColumnarFeatureStore`, a
+  directory with one binary file per column, read through memory maps, and an
+  index giving the rows of each frame.
+
+Stores are opened with :py:func:`~betrack.utils.featurestore.open_store`, and
+checked and removed with :py:func:`~betrack.utils.featurestore.store_exists` and
+:py:func:`~betrack.utils.featurestore.remove_store`.
+"""
+
+
+from os      import remove, makedirs
+from os.path import isfile, isdir, exists, join, getsize
+from shutil  import rmtree
+from numpy   import array, empty, memmap, dtype, int64, save, load, arange, repeat, diff
+import pickle
+import pandas
+import trackpy
+
+
+# Available backends and extension of the files storing features, or of the
+# names identifying stores kept in memory..
+STORES     = ['hdf', 'memory', 'columnar']
+EXTENSIONS = {'hdf': '.h5', 'memory': '.mem', 'columnar': '.cols'}
+
+# Stores held by the memory backend..
+_memory = {}
+
+
+class FeatureStore(object):
+    """
+    The class :py:class:`~betrack.utils.featurestore.FeatureStore` defines the
+    interface of a framewise store of features. Each frame is stored as a
+    ``DataFrame`` with a ``frame`` column. Besides features, a store holds named
+    attributes, such as the metadata of the located features.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __iter__(self):
+        for fn in self.frames:
+            yield self.get(fn)
+
+    @property
+    def frames(self):
+        """
+        Sorted list of the frames in the store.
+        """
+
+        raise NotImplementedError
+
+    def put(self, df):
+        """
+        Stores the features of a frame.
+
+        :param df: the features of a frame
+        :type df: ``pandas.DataFrame``
+        """
+
+        raise NotImplementedError
+
+    def get(self, frame):
+        """
+        Returns the features of a frame.
+
+        :param int frame: the frame number
+        :returns: the features of the frame
+        :rtype: ``pandas.DataFrame``
+        """
+
+        raise NotImplementedError
+
+    def dump(self):
+        """
+        Returns the features of all frames.
+
+        :returns: the features of all frames
+        :rtype: ``pandas.DataFrame``
+        """
+
+        frames = [self.get(fn) for fn in self.frames]
+        if len(frames) == 0: return pandas.DataFrame()
+        return pandas.concat(frames)
+
+    def get_attr(self, name, default=None):
+        """
+        Returns the attribute ``name`` of the store or ``default`` if not set.
+        """
+
+        raise NotImplementedError
+
+    def set_attr(self, name, value):
+        """
+        Sets the attribute ``name`` of the store.
+        """
+
+        raise NotImplementedError
+
+    def del_attr(self, name):
+        """
+        Deletes the attribute ``name`` of the store, if set.
+        """
+
+        raise NotImplementedError
+
+    def flush(self):
+        """
+        Writes the features and attributes stored so far to disk.
+        """
+
+        pass
+
+    def close(self):
+        """
+        Flushes and closes the store.
+        """
+
+        pass
+
+
+class HDFFeatureStore(FeatureStore):
+    """
+    The class :py:class:`~betrack.utils.featurestore.HDFFeatureStore` stores
+    features in an HDF5 file compressed with ``blosc``, with one table per frame
+    and an index of frames. Attributes are stored in the root node of the file.
+    """
+
+    def __init__(self, filename, mode='a', complevel=5, complib='blosc'):
+        """
+        Constructor for the class :py:class:`~betrack.utils.featurestore.HDFFeatureStore`.
+
+        :param str filename: the name of the HDF5 file
+        :param str mode: ``'r'`` to read, ``'a'`` to append, or ``'w'`` to overwrite
+        :param int complevel: the compression level, from 0 to 9
+        :param str complib: the compression library
+        """
+
+        if mode == 'w' and isfile(filename): remove(filename)
+        if mode == 'r' and not isfile(filename):
+            raise IOError('feature store not found: ' + filename)
+        self.store = trackpy.PandasHDFStoreBig(filename, mode='r' if mode == 'r' else 'a',
+                                               complevel=complevel, complib=complib)
+
+    @property
+    def frames(self):
+        return self.store.frames
+
+    def put(self, df):
+        self.store.put(df)
+
+    def get(self, frame):
+        return self.store.get(frame)
+
+    def dump(self):
+        if len(self.frames) == 0: return pandas.DataFrame()
+        return self.store.dump()
+
+    def get_attr(self, name, default=None):
+        return getattr(self.store.store.root._v_attrs, name, default)
+
+    def set_attr(self, name, value):
+        setattr(self.store.store.root._v_attrs, name, value)
+
+    def del_attr(self, name):
+        if name in self.store.store.root._v_attrs:
+            delattr(self.store.store.root._v_attrs, name)
+
+    def flush(self):
+        self.store.store.flush(fsync=True)
+
+    def close(self):
+        self.store.close()
+
+
+class MemoryFeatureStore(FeatureStore):
+    """
+    The class :py:class:`~betrack.utils.featurestore.MemoryFeatureStore` keeps
+    features in the memory of the current process. Stores are identified by file
+    name and survive until removed with
+    :py:func:`~betrack.utils.featurestore.remove_store`, but are never written to
+    disk.
+    """
+
+    def __init__(self, filename, mode='a'):
+        """
+        Constructor for the class :py:class:`~betrack.utils.featurestore.MemoryFeatureStore`.
+
+        :param str filename: the name identifying the store
+        :param str mode: ``'r'`` to read, ``'a'`` to append, or ``'w'`` to overwrite
+        """
+
+        if mode == 'r' and filename not in _memory:
+            raise IOError('feature store not found: ' + filename)
+        if mode == 'w' or filename not in _memory:
+            _memory[filename] = dict(frames={}, attrs={})
+        self.store = _memory[filename]
+
+    @property
+    def frames(self):
+        return sorted(self.store['frames'].keys())
+
+    def put(self, df):
+        if len(df) == 0: return
+        self.store['frames'][df['frame'].values[0]] = df.copy()
+
+    def get(self, frame):
+        return self.store['frames'][frame].copy()
+
+    def get_attr(self, name, default=None):
+        return self.store['attrs'].get(name, default)
+
+    def set_attr(self, name, value):
+        self.store['attrs'][name] = value
+
+    def del_attr(self, name):
+        self.store['attrs'].pop(name, None)
+
+
+class ColumnarFeatureStore(FeatureStore):
+    """
+    The class :py:class:`~betrack.utils.featurestore.ColumnarFeatureStore` stores
+    features in a directory holding one binary file per column, the file
+    ``index.npy`` giving for each frame its number and the offset of its last
+    row, and the file ``meta.pkl`` giving the name and type of each column and
+    the attributes of the store. Columns are read through memory maps and the
+    rows of a frame are found in constant time. Frames must be stored in
+    increasing order and the index is written only when the store is flushed or
+    closed; rows written after the last flush are discarded when the store is
+    opened again.
+    """
+
+    def __init__(self, filename, mode='a'):
+        """
+        Constructor for the class :py:class:`~betrack.utils.featurestore.ColumnarFeatureStore`.
+
+        :param str filename: the name of the directory
+        :param str mode: ``'r'`` to read, ``'a'`` to append, or ``'w'`` to overwrite
+        """
+
+        if mode == 'w' and exists(filename): remove_store(filename)
+        if mode == 'r' and not isdir(filename):
+            raise IOError('feature store not found: ' + filename)
+        if not isdir(filename): makedirs(filename)
+
+        self.filename = filename
+        self.mode     = mode
+        self.columns  = []      # List of (name, dtype) of each column
+        self.attrs    = {}
+        self.index    = {}      # Position of each frame in self.offsets
+        self.offsets  = [0]     # Offset of the first row of each frame
+        self.fnumbers = []      # Number of each frame
+        self.files    = None    # Column files open for writing
+        self.maps     = None    # Column memory maps
+
+        if isfile(join(filename, 'meta.pkl')):
+            with open(join(filename, 'meta.pkl'), 'rb') as f:
+                meta = pickle.load(f)
+            self.columns = meta['columns']
+            self.attrs   = meta['attrs']
+            index        = load(join(filename, 'index.npy'))
+            self.fnumbers = [int(fn) for fn in index[:, 0]]
+            self.offsets  = [0] + [int(o) for o in index[:, 1]]
+            self.index    = dict((fn, i) for i, fn in enumerate(self.fnumbers))
+
+        # Discard rows written after the last flush..
+        if mode != 'r':
+            for i in range(0, len(self.columns)):
+                size = self.offsets[-1] * dtype(self.columns[i][1]).itemsize
+                cf   = self._column_file(i)
+                if isfile(cf) and getsize(cf) > size:
+                    with open(cf, 'r+b') as f: f.truncate(size)
+
+    def _column_file(self, i):
+        return join(self.filename, str(i) + '.bin')
+
+    def _memmaps(self):
+        if self.maps is None:
+            if self.files is not None:
+                for f in self.files: f.flush()
+            nrows     = self.offsets[-1]
+            self.maps = [memmap(self._column_file(i), dtype=dt, mode='r', shape=(nrows,))
+                         if nrows > 0 else empty((0,), dtype=dt)
+                         for i, (name, dt) in enumerate(self.columns)]
+        return self.maps
+
+    @property
+    def frames(self):
+        return list(self.fnumbers)
+
+    def put(self, df):
+        if self.mode == 'r': raise IOError('feature store opened in read mode')
+        if len(df) == 0: return
+        frame = int(df['frame'].values[0])
+        if len(self.fnumbers) > 0 and frame <= self.fnumbers[-1]:
+            raise ValueError('frames must be stored in increasing order')
+
+        if len(self.columns) == 0:
+            self.columns = [(str(c), df[c].dtype.str) for c in df.columns]
+        elif sorted(str(c) for c in df.columns) != sorted(c for c, _ in self.columns):
+            raise ValueError('columns do not match those of the store')
+        if self.files is None:
+            self.files = [open(self._column_file(i), 'ab') for i in range(0, len(self.columns))]
+
+        for (name, dt), f in zip(self.columns, self.files):
+            f.write(df[name].values.astype(dt).tobytes())
+        self.index[frame] = len(self.fnumbers)
+        self.fnumbers.append(frame)
+        self.offsets.append(self.offsets[-1] + len(df))
+        self.maps = None
+
+    def get(self, frame):
+        i     = self.index[frame]
+        start = self.offsets[i]
+        stop  = self.offsets[i + 1]
+        maps  = self._memmaps()
+        return pandas.DataFrame(dict((name, array(m[start:stop]))
+                                     for (name, _), m in zip(self.columns, maps)),
+                                columns=[name for name, _ in self.columns])
+
+    def dump(self):
+        if len(self.fnumbers) == 0: return pandas.DataFrame()
+        maps  = self._memmaps()
+        # Index rows within each frame, as when concatenating frames..
+        index = arange(0, self.offsets[-1]) - repeat(self.offsets[:-1], diff(self.offsets))
+        return pandas.DataFrame(dict((name, array(m))
+                                     for (name, _), m in zip(self.columns, maps)),
+                                columns=[name for name, _ in self.columns], index=index)
+
+    def get_attr(self, name, default=None):
+        return self.attrs.get(name, default)
+
+    def set_attr(self, name, value):
+        self.attrs[name] = value
+
+    def del_attr(self, name):
+        self.attrs.pop(name, None)
+
+    def flush(self):
+        if self.mode == 'r': return
+        if self.files is not None:
+            for f in self.files: f.flush()
+        index = empty((len(self.fnumbers), 2), dtype=int64)
+        index[:, 0] = self.fnumbers
+        index[:, 1] = self.offsets[1:]
+        save(join(self.filename, 'index.npy'), index)
+        with open(join(self.filename, 'meta.pkl'), 'wb') as f:
+            pickle.dump(dict(columns=self.columns, attrs=self.attrs), f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+    def close(self):
+        self.flush()
+        if self.files is not None:
+            for f in self.files: f.close()
+        self.files = None
+        self.maps  = None
+
+
+def open_store(filename, kind='hdf', mode='a'):
+    """
+    Opens a feature store.
+
+    :param str filename: the name of the store
+    :param str kind: the backend of the store, one of :py:data:`STORES`
+    :param str mode: ``'r'`` to read, ``'a'`` to append, or ``'w'`` to overwrite
+    :returns: the feature store
+    :rtype: :py:class:`~betrack.utils.featurestore.FeatureStore`
+    :raises IOError: if ``mode`` is ``'r'`` and the store does not exist
+    :raises ValueError: if ``kind`` is not a valid backend
+    """
+
+    if kind == 'hdf':      return HDFFeatureStore(filename, mode=mode)
+    if kind == 'memory':   return MemoryFeatureStore(filename, mode=mode)
+    if kind == 'columnar': return ColumnarFeatureStore(filename, mode=mode)
+    raise ValueError('unknown feature store \'' + str(kind) + '\'')
+
+
+def store_exists(filename, kind=None):
+    """
+    Returns ``True`` if a feature store named ``filename`` exists with backend
+    ``kind`` or, if not given, with any backend. Stores of the memory backend,
+    whose names have extension ``.mem``, exist only in memory, regardless of the
+    files on disk.
+
+    :param str filename: the name of the store
+    :param str kind: the backend of the store, one of :py:data:`STORES`, if known
+    :rtype: bool
+    """
+
+    if kind is None and filename.endswith(EXTENSIONS['memory']): kind = 'memory'
+    if kind == 'memory': return filename in _memory
+    if kind is not None: return exists(filename)
+    return exists(filename) or filename in _memory
+
+
+def remove_store(filename):
+    """
+    Removes the feature store named ``filename``, with any backend, if it exists.
+    """
+
+    _memory.pop(filename, None)
+    if isdir(filename):    rmtree(filename)
+    elif isfile(filename): remove(filename)
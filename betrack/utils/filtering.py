@@ -0,0 +1,235 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+The module :py:mod:`~betrack.utils.filtering` filters trajectories held in a
+feature store without loading them in memory. The function
+:py:func:`~betrack.utils.filtering.filter_store` gives the same result of
+``trackpy.filter_stubs`` followed by ``trackpy.filter_clusters`` with a few passes
+over the store: the first computes the length and the total ``size`` of each
+trajectory, a second one collects the sizes needed to compute a quantile, if any,
+and the last one writes the surviving rows to a new store. Memory therefore grows
+with the number of trajectories rather than with the number of rows, except for
+the column of sizes held to compute an exact quantile.
+
+The class :py:class:`~betrack.utils.filtering.StubFilter` instead filters out short
+trajectories while features are linked, holding back each frame only until the
+trajectories it contains are either long enough or can no longer be extended.
+"""
+
+
+from collections import deque
+from numpy  import zeros, add, array, float64, int64
+import pandas
+
+from betrack.utils.featurestore import open_store
+
+
+def _accumulate(totals, ids, values):
+    """
+    Adds ``values`` to the entries ``ids`` of ``totals``, enlarging it if needed.
+
+    :param totals: the totals indexed by particle
+    :type totals: ``numpy.ndarray``
+    :param ids: the particle of each value
+    :type ids: ``numpy.ndarray``
+    :param values: the values to add
+    :returns: the updated totals
+    :rtype: ``numpy.ndarray``
+    """
+
+    if len(ids) == 0: return totals
+    n = int(ids.max()) + 1
+    if n > len(totals):
+        grown               = zeros(max(n, 2 * len(totals)), dtype=totals.dtype)
+        grown[:len(totals)] = totals
+        totals              = grown
+    add.at(totals, ids, values)
+    return totals
+
+
+def track_statistics(store):
+    """
+    Streams over the frames of ``store`` and computes the length and the total
+    ``size`` of each trajectory.
+
+    :param store: the store of the linked trajectories
+    :type store: :py:class:`~betrack.utils.featurestore.FeatureStore`
+    :returns: the number of rows and the sum of column ``size`` of each particle,
+              indexed by particle (the sums are ``None`` if column ``size`` is missing)
+    :rtype: tuple
+    """
+
+    lengths = zeros(0, dtype=int64)
+    sizes   = None
+    for df in store:
+        ids     = df['particle'].values.astype(int64)
+        lengths = _accumulate(lengths, ids, 1)
+        if 'size' in df.columns:
+            if sizes is None: sizes = zeros(0, dtype=float64)
+            sizes = _accumulate(sizes, ids, df['size'].values.astype(float64))
+    return lengths, sizes
+
+
+def filter_store(source, destination, kind='hdf', stubs_threshold=None,
+                 clusters_quantile=None, clusters_threshold=None):
+    """
+    Filters the trajectories of the feature store ``source`` and writes the
+    surviving rows to the feature store ``destination``. Trajectories with fewer
+    than ``stubs_threshold`` rows are filtered out first, then the trajectories
+    whose mean ``size`` is not below ``clusters_threshold`` or, if this is not
+    given, below the ``clusters_quantile`` of the sizes of the remaining rows.
+    As in ``trackpy``, the rows of each frame are indexed by frame.
+
+    :param str source: the name of the store of the linked trajectories
+    :param str destination: the name of the store of the filtered trajectories
+    :param str kind: the backend of both stores
+    :param int stubs_threshold: the minimum length of a trajectory, if any
+    :param float clusters_quantile: the quantile of the sizes above which to cut off, if any
+    :param float clusters_threshold: the size above which to cut off, if any
+    :returns: the number of rows written to ``destination``
+    :rtype: int
+    """
+
+    clusters = clusters_quantile is not None or clusters_threshold is not None
+
+    with open_store(source, kind, mode='r') as s:
+        # First pass, length and size of each trajectory..
+        lengths, sizes = track_statistics(s)
+        keep = lengths > 0
+        if stubs_threshold is not None: keep &= lengths >= stubs_threshold
+
+        if clusters:
+            if sizes is None:
+                raise ValueError('Filtering clusters requires column \'size\'')
+
+            # Second pass, sizes of the remaining rows..
+            threshold = clusters_threshold
+            if threshold is None:
+                values = [pandas.Series([], dtype=float64)]
+                values.extend(df['size'][keep[df['particle'].values.astype(int64)]]
+                              for df in s)
+                threshold = pandas.concat(values[1:] or values).quantile(clusters_quantile)
+            keep[keep] = sizes[keep] / lengths[keep] < threshold
+
+        # Last pass, surviving rows..
+        nrows = 0
+        with open_store(destination, kind, mode='w') as d:
+            for df in s:
+                df = df[keep[df['particle'].values.astype(int64)]]
+                if len(df) == 0: continue
+                d.put(df.set_index('frame', drop=False))
+                nrows += len(df)
+    return nrows
+
+
+class StubFilter(object):
+    """
+    The class :py:class:`~betrack.utils.filtering.StubFilter` filters out the
+    trajectories with fewer than ``threshold`` rows from a sequence of linked
+    frames, giving the same rows of ``trackpy.filter_stubs``. A trajectory not
+    linked for more than ``memory`` consecutive frames can no longer be extended
+    and is dropped if it is too short. Frames are returned as soon as each of
+    their trajectories is either long enough or dropped. The state of the filter
+    can be pickled together with the state of the linker.
+    """
+
+    def __init__(self, threshold, memory=0):
+        """
+        Constructor for the class :py:class:`~betrack.utils.filtering.StubFilter`.
+
+        :param int threshold: the minimum length of a trajectory
+        :param int memory: the maximum number of frames a trajectory can vanish
+        """
+
+        self.threshold = threshold
+        self.memory    = memory
+        self.level     = 0        # Number of frames pushed
+        self.lengths   = {}       # Length of each open trajectory
+        self.last      = {}       # Last frame of each open trajectory
+        self.decided   = {}       # Closed trajectories still pending, kept or not
+        self.closed    = {}       # Closed trajectories by last frame
+        self.recent    = deque(maxlen=memory + 2)
+        self.pending   = deque()
+
+
+    def close(self, p):
+        """
+        Closes the open trajectory ``p``.
+        """
+
+        last = self.last.pop(p)
+        keep = self.lengths.pop(p) >= self.threshold
+        if len(self.pending) > 0 and self.pending[0][0] <= last:
+            self.decided[p] = keep
+            self.closed.setdefault(last, []).append(p)
+
+
+    def ready(self):
+        """
+        Returns the filtered pending frames whose trajectories are all either long
+        enough or closed, skipping frames left without rows.
+        """
+
+        frames = []
+        while len(self.pending) > 0:
+            level, df = self.pending[0]
+            ids       = [int(p) for p in df['particle'].values]
+            if any(p in self.lengths and self.lengths[p] < self.threshold for p in ids):
+                break
+            self.pending.popleft()
+            df = df[array([self.decided.get(p, True) for p in ids], dtype=bool)]
+            for p in self.closed.pop(level, []): del self.decided[p]
+            if len(df) > 0: frames.append(df)
+        return frames
+
+
+    def push(self, df):
+        """
+        Adds a linked frame.
+
+        :param df: the linked features of the frame
+        :type df: ``pandas.DataFrame``
+        :returns: the filtered frames ready to be stored
+        :rtype: list
+        """
+
+        self.level += 1
+        ids = [int(p) for p in df['particle'].values]
+        for p in ids:
+            self.lengths[p] = self.lengths.get(p, 0) + 1
+            self.last[p]    = self.level
+        self.pending.append((self.level, df))
+        self.recent.append(ids)
+
+        # Close trajectories that can no longer be extended..
+        if len(self.recent) == self.recent.maxlen:
+            level = self.level - self.memory - 1
+            for p in self.recent[0]:
+                if self.last.get(p) == level: self.close(p)
+        return self.ready()
+
+
+    def held_frames(self):
+        """
+        Returns the frames pushed but not yet returned, skipping frames without rows.
+
+        :returns: the list of frames
+        :rtype: list
+        """
+
+        return [int(df['frame'].values[0]) for level, df in self.pending if len(df) > 0]
+
+
+    def flush(self):
+        """
+        Closes all trajectories after the last frame.
+
+        :returns: the remaining filtered frames
+        :rtype: list
+        """
+
+        for p in list(self.last.keys()): self.close(p)
+        return self.ready()
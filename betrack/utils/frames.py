@@ -12,15 +12,19 @@ These utilities include functions to convert color frames to gray scale,
 to crop frames, :py:func:`~betrack.utils.frames.crop`, 
 to invert the colors of frames, :py:func:`~betrack.utils.frames.invert_colors`, 
 and to reverse the order of the frames columns giving each color channe,
-:py:func:`~betrack.utils.frames.reverse_colors`.
+:py:func:`~betrack.utils.frames.reverse_colors`. Function
+:py:func:`~betrack.utils.frames.cache_frames` decodes a sequence of frames
+once and keeps them in memory or in a memory-mapped file.
 
-.. note:: All functions in this module implement lazy evaluation. When passed
+.. note:: All functions in this module, except
+          :py:func:`~betrack.utils.frames.cache_frames`, implement lazy evaluation. When passed
           a Slicerator, they will return a Pipeline of the results. 
           When passed any other objects, their behavior is unchanged.
 """
 
-from pims  import pipeline
-from numpy import iinfo
+from pims            import pipeline
+from numpy           import iinfo, array, empty
+from numpy.lib.format import open_memmap
 
 @pipeline
 def as_gray(frame):
@@ -76,3 +80,39 @@ def reverse_colors(frame):
     """
     
     return frame[:, :, ::-1]
+
+
+def cache_frames(frames, start, stop, filename=None):
+    """
+    Decodes the frames in the interval [``start``, ``stop``) and stores them
+    in a single array. Any lazy preprocessing step applied to ``frames`` is
+    evaluated once per frame. If ``filename`` is given, the array is
+    memory-mapped to a ``.npy`` file that can be reopened with
+    ``numpy.load(filename, mmap_mode='r')``.
+
+    :param frames: the sequence of frames to be cached
+    :type frames: ``pims.FramesSequence`` or ``slicerator.Pipeline``
+    :param int start: index of the first frame to be cached
+    :param int stop: index following the last frame to be cached
+    :param str filename: optional path of the memory-mapped file
+    :returns: the cached frames with shape ``(stop - start,) + frame.shape``
+    :rtype: ``numpy.ndarray`` or ``numpy.memmap``
+    :raises ValueError: if the interval is empty
+    """
+
+    if stop <= start:
+        raise ValueError('empty interval of frames')
+
+    first = array(frames[start])
+    shape = (stop - start,) + first.shape
+    if filename is None:
+        cache = empty(shape, dtype=first.dtype)
+    else:
+        cache = open_memmap(filename, mode='w+', dtype=first.dtype, shape=shape)
+
+    cache[0] = first
+    for i in range(start + 1, stop):
+        cache[i - start] = array(frames[i])
+    if filename is not None: cache.flush()
+
+    return cache
@@ -15,18 +15,29 @@ to initialize a list of jobs according to a configuration file.
 
 
 from os      import remove
-from os.path import dirname, realpath, isfile, splitext, basename, join
-from pandas  import HDFStore
+from os.path import dirname, realpath, isfile, splitext, basename, join, getsize
+from time    import time
+from bisect  import bisect_left
+from copy    import copy
+from pandas  import concat
 from pims    import Video
 from errno   import ENOENT
 
 from imageio.core import NeedDownloadError
 import imageio
+import json
 
 from betrack.utils.message import wprint
 from betrack.utils.parser  import (parse_file, parse_directory, parse_int, parse_float,
                                    parse_int_or_float)
 from betrack.utils.frames  import as_gray, crop, invert_colors
+from betrack.utils.featurestore import EXTENSIONS, open_store, remove_store
+from betrack.utils.summary      import TrackSummary
+from betrack.utils.writers      import (ARROW_FORMATS, TEXT_FORMATS, HDF_COMPLIBS,
+                                        write_csv, write_ndjson, write_hdf, write_npy,
+                                        npy_indexes, write_arrow, frame_ranges,
+                                        float_format)
+from betrack.utils.compression  import COMPRESSIONS, open_output
 
 class Job:
     """
@@ -61,13 +72,93 @@ class Job:
         self.periodtype    = periodtype   # Period type: 'frame', 'second', 'minute'
         self.dflink        = None         # Dataframe of the linked trajectories
         self.drawparticles = []           # List of particles to annotate, [] means all
+        self.suffix        = ''           # Suffix appended to the name of output files
+        self.featurestore  = 'hdf'        # Backend of the feature stores
+        self.chunksize     = None         # Frames per chunk out of core, None means in memory
+        self.trajectories  = None         # Store of the trajectories when out of core
+        self.compression   = None         # Compression of exported files, if any
+        self.exportstats   = None         # Bytes before and after compression, and seconds
         
         if self.outdir == '': self.outdir = dirname(realpath(self.video))            
-        self.h5storage  = join(self.outdir, splitext(basename(video))[0] + '-locate.h5')        
-        self.h5tracks   = join(self.outdir, splitext(basename(video))[0] + '-tracks.h5')     
-        self.csvtracks  = join(self.outdir, splitext(basename(video))[0] + '-tracks.csv')        
-        self.jsontracks = join(self.outdir, splitext(basename(video))[0] + '-tracks.json')
-        self.avitracked = join(self.outdir, splitext(basename(video))[0] + '-tracked.avi')       
+        self.npycache   = join(self.outdir, splitext(basename(video))[0] + '-cache.npy')
+        self.csvcalibration = join(self.outdir, splitext(basename(video))[0] + '-calibration.csv')
+        self.ymlcalibration = join(self.outdir, splitext(basename(video))[0] + '-calibration.yml')
+        self.csvsweep   = join(self.outdir, splitext(basename(video))[0] + '-sweep.csv')
+        self.set_output_files()
+        self.tempfiles  = [self.h5storage, self.h5linked,   # Deleted by release_memory
+                           self.h5filtered]
+
+
+    def set_output_files(self):
+        """
+        Sets the names of the files storing the linked trajectories and the
+        results of a job. The name of each file is given by the name of the video
+        followed by :py:attr:`~betrack.utils.job.Job.suffix`, except for the
+        located features that are shared by all variants of a job. The extension
+        of the feature stores depends on :py:attr:`~betrack.utils.job.Job.featurestore`.
+        """
+
+        name = splitext(basename(self.video))[0] + self.suffix
+        ext  = EXTENSIONS[self.featurestore]
+        self.h5storage  = join(self.outdir, splitext(basename(self.video))[0] + '-locate' + ext)
+        self.h5linked   = join(self.outdir, name + '-link' + ext)
+        self.ckptlinked = join(self.outdir, name + '-link.ckpt')
+        self.h5filtered = join(self.outdir, name + '-filter' + ext)
+        self.jsonmanifest = join(self.outdir, name + '-manifest.json')
+        self.h5tracks   = join(self.outdir, name + '-tracks.h5')     
+        self.csvtracks  = join(self.outdir, name + '-tracks.csv')        
+        self.jsontracks = join(self.outdir, name + '-tracks.json')
+        self.ndjsontracks = join(self.outdir, name + '-tracks.ndjson')
+        self.parquettracks = join(self.outdir, name + '-tracks.parquet')
+        self.feathertracks = join(self.outdir, name + '-tracks.feather')
+        self.npytracks  = join(self.outdir, name + '-tracks.npy')
+        self.h5summary  = join(self.outdir, name + '-summary.h5')
+        self.csvsummary = join(self.outdir, name + '-summary.csv')
+        self.jsonsummary = join(self.outdir, name + '-summary.json')
+        self.ndjsonsummary = join(self.outdir, name + '-summary.ndjson')
+        self.parquetsummary = join(self.outdir, name + '-summary.parquet')
+        self.feathersummary = join(self.outdir, name + '-summary.feather')
+        self.npysummary = join(self.outdir, name + '-summary.npy')
+        self.jsonmeta   = join(self.outdir, name + '-tracks-meta.json')
+        self.avitracked = join(self.outdir, name + '-tracked.avi')       
+
+
+    def variant(self, suffix):
+        """
+        Returns a copy of the job that shares the located features of this job
+        but whose output files are identified by ``suffix``. The copy does not
+        hold the video frames or the trajectories of this job and can be passed
+        to worker processes.
+
+        :param str suffix: the suffix appended to the name of the output files
+        :returns: a variant of the job
+        :rtype: Job
+        """
+
+        job           = copy(self)
+        job.frames    = None
+        job.pframes   = None
+        job.dflink    = None
+        job.suffix    = self.suffix + suffix
+        job.set_output_files()
+        job.trajectories = None
+        job.tempfiles = [job.h5linked, job.h5filtered]
+        return job
+
+
+    def set_feature_store(self, featurestore):
+        """
+        Sets the backend of the stores of the located, linked, and filtered
+        features and updates their names and the list of temporary files accordingly.
+
+        :param str featurestore: one of :py:data:`betrack.utils.featurestore.STORES`
+        """
+
+        old = [self.h5storage, self.h5linked, self.h5filtered]
+        self.featurestore = featurestore
+        self.set_output_files()
+        new = [self.h5storage, self.h5linked, self.h5filtered]
+        self.tempfiles = [new[old.index(f)] if f in old else f for f in self.tempfiles]
 
 
     def str(self, ind=''):
@@ -136,51 +227,528 @@ class Job:
         self.nframes = self.period[1] - self.period[0]
 
         
+    def metadata(self):
+        """
+        Returns the attributes of the job needed to interpret its located features
+        without loading the video, that is, the video file, the selected period,
+        the crop margins, and the shape and rate of the frames.
+
+        .. note:: This function must be called after a call to
+                  :py:func:`~betrack.utils.job.Job.load_frames`.
+
+        :returns: the metadata of the job
+        :rtype: dict
+        """
+
+        return dict(video=self.video, period=list(self.period), margins=self.margins,
+                    frameshape=tuple(self.frameshape), framerate=self.framerate)
+
+
+    def load_metadata(self, metadata):
+        """
+        Restores the selected period and the shape and rate of the frames of the
+        job from ``metadata`` without loading the video.
+
+        :param dict metadata: metadata returned by :py:func:`~betrack.utils.job.Job.metadata`
+        :raises ValueError: if the crop margins of the job differ from those in ``metadata``
+        """
+
+        if metadata['margins'] != self.margins:
+            raise ValueError('crop margins differ from those of the located features')
+
+        self.period     = list(metadata['period'])
+        self.periodtype = 'frame'
+        self.nframes    = self.period[1] - self.period[0]
+        self.frameshape = tuple(metadata['frameshape'])
+        self.framerate  = metadata['framerate']
+
+        
     def release_memory(self):
         """
         This function attempts to release the memory allocated by the original and
         processed video frames and by the tracked particles data structure. 
-        It also deletes the temporary storage file created by
-        :py:func:`~betrack.commands.trackparticles.TrackParticles.locate_features`.
+        It also deletes the temporary files listed in
+        :py:attr:`~betrack.utils.job.Job.tempfiles`, by default the storage files
+        created by
+        :py:func:`~betrack.commands.trackparticles.TrackParticles.locate_features`
+        and :py:func:`~betrack.commands.trackparticles.TrackParticles.link_trajectories`.
 
         .. note:: Memory is effectively released only if no additional aliases have
                   been created that point to the frames, to the processed frames, 
                   and/or to the trajectories of the video.       
         """
 
-        self.frames.close()
+        if self.frames is not None: self.frames.close()
         self.frames  = None
         self.pframes = None
         self.dflink  = None
-        if isfile(self.h5storage): remove(self.h5storage)
+        self.trajectories = None
+        for f in self.tempfiles: remove_store(f)
 
 
-    def export_trajectories(self, exportas):        
+    def tracks_file(self, exportas):
         """
-        Export a ``DataFrame`` of the linked trajectories to a file. Possible
-        output formats are ``'csv'``, ``'hdf'``, and ``'json'``.
+        Returns the name of the file storing the exported trajectories.
 
         :param str exportas: The format used to export the data
+        :returns: the name of the file, with the extension of
+                  :py:attr:`~betrack.utils.job.Job.compression` for text formats
+        :rtype: str
         """
 
-        # Convert trajectories to the size of the original video..
-        if self.valid_margins():
+        return self._compressed(exportas, {
+                'hdf': self.h5tracks, 'csv': self.csvtracks, 'json': self.jsontracks,
+                'ndjson': self.ndjsontracks, 'parquet': self.parquettracks,
+                'feather': self.feathertracks, 'npy': self.npytracks}[exportas])
+
+
+    def summary_file(self, exportas):
+        """
+        Returns the name of the file storing the summary of the trajectories.
+
+        :param str exportas: The format used to export the data
+        :returns: the name of the file, with the extension of
+                  :py:attr:`~betrack.utils.job.Job.compression` for text formats
+        :rtype: str
+        """
+
+        return self._compressed(exportas, {
+                'hdf': self.h5summary, 'csv': self.csvsummary, 'json': self.jsonsummary,
+                'ndjson': self.ndjsonsummary, 'parquet': self.parquetsummary,
+                'feather': self.feathersummary, 'npy': self.npysummary}[exportas])
+
+
+    def _compressed(self, exportas, filename):
+        """
+        Appends the extension of :py:attr:`~betrack.utils.job.Job.compression` to
+        ``filename`` if files in format ``exportas`` are compressed.
+
+        :param str exportas: The format used to export the data
+        :param str filename: the name of the uncompressed file
+        :returns: the name of the file
+        :rtype: str
+        """
+
+        if self.compression is None or not exportas in TEXT_FORMATS:
+            return filename
+        return filename + COMPRESSIONS[self.compression]
+
+    
+    def load_trajectories(self, filename):
+        """
+        Makes the trajectories in the feature store ``filename`` the current
+        trajectories of the job. In memory, they are loaded in
+        :py:attr:`~betrack.utils.job.Job.dflink`. Out of core, that is, if
+        :py:attr:`~betrack.utils.job.Job.chunksize` is set, they are only
+        referenced by :py:attr:`~betrack.utils.job.Job.trajectories`.
+
+        :param str filename: the name of the feature store
+        """
+
+        if self.chunksize is None:
+            with open_store(filename, self.featurestore, mode='r') as s:
+                self.dflink = s.dump()
+        else:
+            self.dflink       = None
+            self.trajectories = filename
+
+
+    def store_trajectories(self, filename):
+        """
+        Stores the current trajectories of the job framewise in the feature store
+        ``filename``. Out of core, trajectories are copied one frame at a time and
+        the new store becomes the current trajectories.
+
+        :param str filename: the name of the feature store
+        """
+
+        with open_store(filename, self.featurestore, mode='w') as d:
+            if self.dflink is not None:
+                for fn, df in self.dflink.groupby(self.dflink['frame'].values): d.put(df)
+            else:
+                with open_store(self.trajectories, self.featurestore, mode='r') as s:
+                    for df in s: d.put(df)
+        if self.dflink is None: self.trajectories = filename
+
+
+    def iter_trajectories(self, start=None, stop=None):
+        """
+        Iterates over the current trajectories of the job in chunks of consecutive
+        frames. In memory, :py:attr:`~betrack.utils.job.Job.dflink` is returned as a
+        single chunk. Out of core, chunks of
+        :py:attr:`~betrack.utils.job.Job.chunksize` frames are read from
+        :py:attr:`~betrack.utils.job.Job.trajectories` and their coordinates are
+        converted to the frames of the original video, as done in memory by
+        :py:func:`~betrack.utils.job.Job.translate_trajectories`. If given, only
+        the frames in ``[start, stop)`` are read out of core.
+
+        :param int start: the first frame to read, if any
+        :param int stop: the frame following the last one to read, if any
+        :returns: an iterator of trajectories sorted by frame
+        :rtype: iterator
+        """
+
+        if self.dflink is not None: return iter([self.dflink])
+        margins = list(self.margins) if self.valid_margins() else None
+        return self._iter_chunks(margins, start, stop)
+
+
+    def _iter_chunks(self, margins, start=None, stop=None):
+        """
+        Reads the trajectories of :py:attr:`~betrack.utils.job.Job.trajectories`
+        in chunks of :py:attr:`~betrack.utils.job.Job.chunksize` frames, seeking
+        the frames in ``[start, stop)``, if given, in the sorted frames of the store.
+
+        :param list margins: the crop margins added to the coordinates, if any
+        :param int start: the first frame to read, if any
+        :param int stop: the frame following the last one to read, if any
+        :returns: a generator of trajectories sorted by frame
+        :rtype: generator
+        """
+
+        with open_store(self.trajectories, self.featurestore, mode='r') as s:
+            frames = s.frames
+            if len(frames) == 0: yield s.dump()
+            a      = 0 if start is None else bisect_left(frames, start)
+            b      = len(frames) if stop is None else bisect_left(frames, stop)
+            frames = frames[a:b]
+            for i in range(0, len(frames), self.chunksize):
+                chunk = concat([s.get(fn) for fn in frames[i:i + self.chunksize]])
+                if margins is not None:
+                    chunk.y += margins[2]
+                    chunk.x += margins[0]
+                yield chunk
+
+
+    def translate_trajectories(self):
+        """
+        Converts the coordinates of the linked trajectories from the cropped
+        frames to the frames of the original video. Out of core, coordinates are
+        converted while iterating with
+        :py:func:`~betrack.utils.job.Job.iter_trajectories`.
+        """
+
+        if self.dflink is not None and self.valid_margins():
             self.dflink.y += self.margins[2]
             self.dflink.x += self.margins[0]
 
+
+    def export_trajectories(self, exportas, summary=False, precision=None, nprocesses=1,
+                            rowgroup=1000, hdfnodes=None, shards=None, source=None):
+        """
+        Export a ``DataFrame`` of the linked trajectories to a file. Possible
+        output formats are ``'csv'``, ``'hdf'``, ``'json'``, ``'ndjson'``,
+        ``'parquet'``, ``'feather'``, and ``'npy'``. Trajectories are written one
+        chunk at a time, as returned by
+        :py:func:`~betrack.utils.job.Job.iter_trajectories`. As the JSON document
+        is organized by column, out of core each column requires a pass over
+        the trajectories. If ``summary`` is ``True``, a summary of each trajectory
+        is computed by a :py:class:`~betrack.utils.summary.TrackSummary` while
+        exporting and written in the same format to the file returned by
+        :py:func:`~betrack.utils.job.Job.summary_file`. CSV files are written by
+        :py:func:`~betrack.utils.writers.write_csv` with floats rounded to
+        ``precision`` decimal digits, if given, by ``nprocesses`` worker processes.
+        NDJSON files are written in the same way by
+        :py:func:`~betrack.utils.writers.write_ndjson` in a single pass, with one
+        record per row.
+        HDF5 files are written by :py:func:`~betrack.utils.writers.write_hdf` to
+        a compressed table indexed by frame and by particle or, if ``hdfnodes`` is
+        given, to a table ``dflink/f<first frame>`` for each range of ``hdfnodes``
+        frames. Parquet and Feather files are written by
+        :py:func:`~betrack.utils.writers.write_arrow` with a row group for each
+        range of ``rowgroup`` frames. NumPy files are written by
+        :py:func:`~betrack.utils.writers.write_npy` together with their indexes by
+        frame and by particle.
+
+        If ``shards`` is given, the trajectories are split in files holding
+        ``shards`` frames each, named as returned by
+        :py:func:`~betrack.utils.job.Job.shard_file`, and a manifest listing the
+        name, the range of frames, and the number of rows of each file is saved
+        to the file returned by :py:func:`~betrack.utils.job.Job.shards_file`. Shards are written one at
+        a time and a single summary is computed over all of them. Trajectories and
+        shards previously exported in the same format are removed first.
+
+        If :py:attr:`~betrack.utils.job.Job.compression` is set, CSV, JSON, and
+        NDJSON files are compressed while written by ``nprocesses`` background
+        threads, while HDF5, Parquet, and Feather files use the same compression
+        internally. The size of the trajectories before compression (the size of
+        the text or the size in memory), the size of the exported file, and the
+        time taken are saved in :py:attr:`~betrack.utils.job.Job.exportstats`.
+
+        The metadata returned by :py:func:`~betrack.utils.job.Job.tracks_metadata`
+        are saved to :py:attr:`~betrack.utils.job.Job.jsonmeta`. Trajectories
+        already exported can be exported again in another format by passing a
+        function returning an iterator over their rows as ``source``.
+
+        :param str exportas: The format used to export the data
+        :param bool summary: whether to export the summary of the trajectories or not
+        :param int precision: the number of decimal digits of floats in CSV and NDJSON files
+        :param int nprocesses: the number of processes formatting CSV and NDJSON files
+        :param int rowgroup: the number of frames of each row group of Parquet files
+        :param int hdfnodes: the number of frames of each table of HDF5 files, if any
+        :param int shards: the number of frames of each exported file, if any
+        :param source: a function returning an iterator over the trajectories to
+                       export, already converted to the size of the original video,
+                       instead of :py:func:`~betrack.utils.job.Job.iter_trajectories`
+        :type source: callable
+        :returns: the number of exported rows
+        :rtype: int
+        """
+
+        # Convert trajectories to the size of the original video..
+        if source is None:
+            self.translate_trajectories()
+            source = self.iter_trajectories
+
         # Save trajectories..
+        start    = time()
+        tracks   = TrackSummary()
+        first    = 0 if self.period is None else self.period[0]
+        options  = dict(precision=precision, nprocesses=nprocesses, rowgroup=rowgroup,
+                        hdfnodes=hdfnodes, first=first)
+        def summarized(chunks):
+            for chunk in chunks:
+                if summary: tracks.update(chunk)
+                yield chunk
+        self.remove_tracks(exportas)
+        if shards is None:
+            expectedrows = None if self.dflink is None else len(self.dflink)
+            nrows, rawbytes, nbytes = self._write_tracks(self.tracks_file(exportas), exportas,
+                                                         source, summarized,
+                                                         expectedrows=expectedrows, **options)
+        else:
+            # Write each range of frames to its own file..
+            nrows, rawbytes, nbytes, manifest = 0, 0, 0, []
+            for df in frame_ranges(source(), shards, first):
+                k        = (int(df['frame'].values[0]) - first) // shards
+                filename = self.shard_file(exportas, k)
+                n, r, b  = self._write_tracks(filename, exportas, lambda: iter([df]),
+                                              summarized, **options)
+                manifest.append(dict(file=basename(filename), start=first + k * shards,
+                                     stop=first + (k + 1) * shards, nrows=n))
+                nrows, rawbytes, nbytes = nrows + n, rawbytes + r, nbytes + b
+            with open(self.shards_file(exportas), 'w') as f:
+                json.dump(dict(exportas=exportas, compression=self.compression,
+                               nframes=shards, shards=manifest), f, indent=2, sort_keys=True)
+        self.exportstats = (rawbytes, nbytes, time() - start)
+
+        # Save summary..
+        if summary:
+            complib  = HDF_COMPLIBS.get(self.compression, 'blosc:zstd')
+            table    = tracks.table()
+            filename = self.summary_file(exportas)
+            if isfile(filename): remove(filename)
+            if exportas == 'hdf':
+                table.to_hdf(filename, key='summary', format='table', data_columns=True,
+                             complevel=5, complib=complib)
+            elif exportas == 'npy':
+                write_npy(filename, [table.reset_index()])
+            elif exportas in ARROW_FORMATS:
+                kwargs = {} if self.compression is None else {'compression': self.compression}
+                if exportas == 'parquet':
+                    table.reset_index().to_parquet(filename, index=False, **kwargs)
+                else:
+                    table.reset_index().to_feather(filename, **kwargs)
+            else:
+                with open_output(filename, self.compression) as f:
+                    if exportas == 'csv':
+                        f.write(table.to_csv(None, float_format=float_format(precision)))
+                    elif exportas == 'json':
+                        f.write(table.to_json())
+                    elif exportas == 'ndjson':
+                        write_ndjson(f, [table.reset_index()], precision=precision)
+
+        # Save metadata..
+        with open(self.jsonmeta, 'w') as f:
+            json.dump(self.tracks_metadata(exportas, nrows, shards), f, indent=2, sort_keys=True)
+        return nrows
+
+
+    def _write_tracks(self, filename, exportas, source, summarized, precision=None,
+                      nprocesses=1, rowgroup=1000, hdfnodes=None, first=0,
+                      expectedrows=None):
+        """
+        Writes the trajectories returned by ``source`` to ``filename`` in format
+        ``exportas``, passing them once through ``summarized``, as done by
+        :py:func:`~betrack.utils.job.Job.export_trajectories`.
+
+        :returns: the number of rows, the number of bytes before compression,
+                  and the number of bytes of the file
+        :rtype: tuple
+        """
+
+        rawbytes = [0]
+        def measured(chunks):
+            for chunk in chunks:
+                rawbytes[0] += int(chunk.memory_usage(index=False).sum())
+                yield chunk
         if exportas == 'hdf':
-            if isfile(self.h5tracks): remove(self.h5tracks)
-            hdf = HDFStore(self.h5tracks)
-            hdf.put('dflink', self.dflink, format='table', data_columns=True)
-            hdf.close()
-        elif exportas == 'csv':
-            if isfile(self.csvtracks): remove(self.csvtracks)
-            self.dflink.to_csv(self.csvtracks)
-        elif exportas == 'json':
-            if isfile(self.jsontracks): remove(self.jsontracks)
-            df = self.dflink.index = range(0, self.dflink.shape[0])
-            self.dflink.to_json(self.jsontracks)
+            complib = HDF_COMPLIBS.get(self.compression, 'blosc:zstd')
+            nrows = write_hdf(filename, measured(summarized(source())),
+                              complib=complib, nframes=hdfnodes, start=first,
+                              expectedrows=expectedrows)
+        elif exportas == 'npy':
+            nrows = write_npy(filename, measured(summarized(source())))
+        elif exportas in ARROW_FORMATS:
+            nrows = write_arrow(filename, measured(summarized(source())),
+                                kind=exportas, nframes=rowgroup, start=first,
+                                compression=self.compression)
+        else:
+            f = open_output(filename, self.compression, nthreads=nprocesses)
+            with f:
+                if exportas == 'csv':
+                    nrows = write_csv(f, summarized(source()),
+                                      precision=precision, nprocesses=nprocesses)
+                elif exportas == 'ndjson':
+                    nrows = write_ndjson(f, summarized(source()),
+                                         precision=precision, nprocesses=nprocesses)
+                elif exportas == 'json':
+                    nrows = self._write_json(f, source, summarized)
+            if self.compression is not None: rawbytes[0] = f.rawbytes
+            else:                            rawbytes[0] = getsize(filename)
+        return nrows, rawbytes[0], getsize(filename)
+
+
+    def shard_file(self, exportas, k):
+        """
+        Returns the name of the file storing the ``k``-th range of frames of the
+        trajectories exported in shards, that is, the name returned by
+        :py:func:`~betrack.utils.job.Job.tracks_file` followed by ``k`` with
+        three digits, as in ``<video>-tracks-000.parquet``.
+
+        :param str exportas: The format used to export the data
+        :param int k: the index of the range of frames
+        :returns: the name of the file
+        :rtype: str
+        """
+
+        name, ext = self._split_tracks_file(exportas)
+        return self._compressed(exportas, name + '-' + str(k).zfill(3) + ext)
+
+
+    def shards_file(self, exportas):
+        """
+        Returns the name of the manifest of the trajectories exported in shards
+        in format ``exportas``, as in ``<video>-tracks-parquet-shards.json``.
+
+        :param str exportas: The format used to export the data
+        :returns: the name of the file
+        :rtype: str
+        """
+
+        name, ext = self._split_tracks_file(exportas)
+        return name + '-' + ext[1:] + '-shards.json'
+
+
+    def _split_tracks_file(self, exportas):
+        """
+        Splits the name of the file storing the trajectories exported in format
+        ``exportas`` in its root and its extension, without that of the compression.
+
+        :param str exportas: The format used to export the data
+        :returns: the root and the extension of the file
+        :rtype: tuple
+        """
+
+        filename  = self.tracks_file(exportas)
+        extension = self._compressed(exportas, '')
+        return splitext(filename[:len(filename) - len(extension)])
+
+
+    def remove_tracks(self, exportas):
+        """
+        Removes the trajectories previously exported in format ``exportas``, with
+        the index files of NumPy files, and their shards, if any.
+
+        :param str exportas: The format used to export the data
+        """
+
+        filenames = [self.tracks_file(exportas)]
+        manifest  = self.shards_file(exportas)
+        if isfile(manifest):
+            with open(manifest, 'r') as f:
+                filenames += [join(self.outdir, s['file']) for s in json.load(f)['shards']]
+            remove(manifest)
+        if exportas == 'npy':
+            filenames += [index for f in filenames for index in npy_indexes(f)]
+        for filename in filenames:
+            if isfile(filename): remove(filename)
+
+
+    def tracks_metadata(self, exportas, nrows, shards=None):
+        """
+        Returns the metadata of the trajectories exported in format ``exportas``,
+        that is, the metadata returned by :py:func:`~betrack.utils.job.Job.metadata`
+        with the shape of the frames, if known, the format and the compression of
+        the file, the number of rows, the number of frames of each shard, if
+        any, and the offset added to the coordinates of
+        the cropped frames to convert them to the original video.
+
+        :param str exportas: The format used to export the data
+        :param int nrows: the number of exported rows
+        :param int shards: the number of frames of each exported file, if any
+        :returns: the metadata of the exported trajectories
+        :rtype: dict
+        """
+
+        translated = self.frameshape is not None and self.valid_margins()
+        return dict(video=self.video, margins=self.margins,
+                    framerate=None if self.framerate is None else float(self.framerate),
+                    period=None if self.period is None else [int(p) for p in self.period],
+                    frameshape=None if self.frameshape is None else
+                               [int(n) for n in self.frameshape],
+                    exportas=exportas, compression=self.compression, nrows=nrows,
+                    shards=shards,
+                    offset=[self.margins[0], self.margins[2]] if translated else [0, 0])
+
+
+    def load_tracks_metadata(self, metadata):
+        """
+        Restores the crop margins, the selected period, and the shape and rate of
+        the frames of the job from the ``metadata`` of exported trajectories,
+        without loading the video.
+
+        :param dict metadata: metadata returned by
+                              :py:func:`~betrack.utils.job.Job.tracks_metadata`
+        """
+
+        self.margins    = metadata['margins']
+        self.framerate  = metadata['framerate']
+        if metadata['period'] is not None:
+            self.period     = list(metadata['period'])
+            self.periodtype = 'frame'
+            self.nframes    = self.period[1] - self.period[0]
+        if metadata['frameshape'] is not None:
+            self.frameshape = tuple(metadata['frameshape'])
+
+
+    def _write_json(self, f, source, summarized):
+        """
+        Writes the trajectories returned by ``source`` to the opened file ``f`` as
+        a JSON document organized by column, with one pass over the trajectories
+        for each column. Only the first pass is summarized.
+        """
+
+        nrows   = 0
+        columns = []
+        for chunk in source():
+            columns = list(chunk.columns)
+            break
+        f.write('{')
+        for col, j in zip(columns, range(0, len(columns))):
+            f.write((',' if j > 0 else '') + json.dumps(col) + ':{')
+            nrows  = 0
+            chunks = source()
+            if j == 0: chunks = summarized(chunks)
+            for chunk in chunks:
+                values = chunk[col].copy()
+                values.index = range(nrows, nrows + len(chunk))
+                values = values.to_json()[1:-1]
+                if len(values) > 0: f.write((',' if nrows > 0 else '') + values)
+                nrows += len(chunk)
+            f.write('}')
+        f.write('}')
+        return nrows
     
 
     def valid_margins(self):
@@ -191,10 +759,10 @@ class Job:
 
         :returns: whether the margins are valid or not
         :rtype: bool
-        :raise TypeError: if the video frames are not loaded
+        :raise TypeError: if the shape of the video frames is not known
         """
 
-        if self.frames is None:
+        if self.frameshape is None:
             raise TypeError('video not loaded')        
         
         if type(self.margins) is list:
@@ -289,3 +289,28 @@ def parse_str(src, key, nentries=1):
     else:
         raise KeyError('attribute not found!', key)            
 
+
+def expand_sweep(src, keys):
+    """
+    Expands the dictionary ``src`` into a list of parameter variants. Each
+    attribute in ``keys`` whose value in ``src`` is a list is treated as a set
+    of alternative values and the variants are given by the Cartesian product
+    of all such lists. Attributes in ``keys`` that are missing from ``src`` or
+    that have a scalar value are not swept.
+
+    :param dict src: the source dictionary
+    :param list keys: the keys of the attributes that can be swept
+    :returns: a list of dictionaries mapping each swept key to one of its values
+    :rtype: list
+    :raises ValueError: if a swept attribute is an empty list
+    """
+
+    variants = [{}]
+    for key in keys:
+        val = src.get(key)
+        if type(val) != list: continue
+        if len(val) == 0:
+            raise ValueError('attribute ' + key + ' is an empty list')
+        variants = [dict(v, **{key: e}) for v in variants for e in val]
+
+    return variants
@@ -0,0 +1,125 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+The module :py:mod:`~betrack.utils.pipeline` processes a sequence of items, such
+as the frames of a video, in three stages running concurrently. The function
+:py:func:`~betrack.utils.pipeline.run_pipeline` decodes the items in a thread,
+processes them in a pool of worker threads, and encodes them in order in a last
+thread. Stages are connected by bounded queues and at most a bounded number of
+items is held at any time, so that memory does not grow with the number of
+items. Threads are effective as long as the stages release the interpreter lock,
+as video decoders, ``OpenCV``, and ``numpy`` do for most of their work.
+"""
+
+
+from threading import Thread, BoundedSemaphore
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+
+# Marks the end of the items in a queue..
+_END = object()
+
+
+def run_pipeline(items, decode, process, encode, nworkers=1, maxsize=None,
+                 progress=None):
+    """
+    Applies ``decode``, ``process``, and ``encode`` to each of ``items``, in this
+    order. Items are decoded one at a time by a decoder thread, processed by
+    ``nworkers`` worker threads, and encoded one at a time by an encoder thread
+    in the order of ``items``. At most ``maxsize`` items, by default twice the
+    number of workers, are decoded but not yet encoded. The first exception
+    raised by a stage stops decoding and is raised again once all threads are
+    done.
+
+    :param items: the items to process
+    :type items: iterable
+    :param callable decode: the function called on each item by the decoder thread
+    :param callable process: the function called on each decoded item by the workers
+    :param callable encode: the function called on each processed item by the encoder thread
+    :param int nworkers: the number of worker threads
+    :param int maxsize: the maximum number of items in the pipeline
+    :param list progress: three progress bars updated once an item is decoded,
+                          processed, and encoded, respectively, if given
+    :returns: the number of encoded items
+    :rtype: int
+    """
+
+    nworkers  = max(1, nworkers)
+    maxsize   = max(nworkers + 1, 2 * nworkers if maxsize is None else maxsize)
+    decoded   = Queue(maxsize)
+    processed = Queue(maxsize)
+    slots     = BoundedSemaphore(maxsize)
+    errors    = []
+    encoded   = [0]
+
+    def advance(stage):
+        if progress is not None: progress[stage].update(1)
+
+    def decoder():
+        try:
+            for k, item in enumerate(items):
+                slots.acquire()
+                if len(errors) > 0:
+                    slots.release()
+                    break
+                try:
+                    decoded.put((k, decode(item)))
+                except Exception as err:
+                    errors.append(err)
+                    slots.release()
+                    break
+                advance(0)
+        except Exception as err:
+            errors.append(err)
+        finally:
+            for w in range(0, nworkers): decoded.put(_END)
+
+    def worker():
+        while True:
+            task = decoded.get()
+            if task is _END: break
+            k, value = task
+            try:
+                # Items are forwarded even after an error, so that slots are released..
+                if len(errors) == 0: value = process(value)
+            except Exception as err:
+                errors.append(err)
+            processed.put((k, value))
+            advance(1)
+        processed.put(_END)
+
+    def encoder():
+        pending   = {}
+        following = 0
+        running   = nworkers
+        while running > 0:
+            task = processed.get()
+            if task is _END:
+                running -= 1
+                continue
+            pending[task[0]] = task[1]
+            while following in pending:
+                value = pending.pop(following)
+                try:
+                    if len(errors) == 0:
+                        encode(value)
+                        encoded[0] += 1
+                except Exception as err:
+                    errors.append(err)
+                following += 1
+                slots.release()
+                advance(2)
+
+    threads = ([Thread(target=decoder)] + [Thread(target=worker) for w in range(0, nworkers)] +
+               [Thread(target=encoder)])
+    for t in threads: t.daemon = True
+    for t in threads: t.start()
+    for t in threads: t.join()
+    if len(errors) > 0: raise errors[0]
+    return encoded[0]
@@ -0,0 +1,133 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+The module :py:mod:`~betrack.utils.readers` reads back trajectories exported by
+:py:func:`~betrack.utils.job.Job.export_trajectories` in any of the supported
+formats. The function :py:func:`~betrack.utils.readers.read_tracks` returns the
+rows of a file one chunk at a time, so that exported trajectories can be
+converted to another format without holding them in memory, except for JSON
+documents that are organized by column and must be read at once. The function
+:py:func:`~betrack.utils.readers.read_shards` reads trajectories exported in
+shards as if they were a single file.
+"""
+
+
+from os.path import dirname, join
+from numpy   import load
+import pandas
+import json
+
+from betrack.utils.compression import open_input
+from betrack.utils.writers     import pyarrow
+
+
+def read_tracks(filename, kind, nrows=100000):
+    """
+    Iterates over the rows of the exported trajectories ``filename`` in chunks of
+    at most ``nrows`` rows. Files in CSV, JSON, and NDJSON formats can be
+    compressed, as given by their extension. The index of the rows is read from
+    CSV, JSON, and HDF5 files, while rows read from other formats are numbered
+    from zero.
+
+    :param str filename: the name of the file
+    :param str kind: the format of the file
+    :param int nrows: the maximum number of rows of each chunk
+    :returns: an iterator of ``pandas.DataFrame``
+    :rtype: iterator
+    :raises ImportError: if reading Parquet or Feather files and ``pyarrow`` is not installed
+    """
+
+    readers = {'csv': _read_csv, 'json': _read_json, 'ndjson': _read_ndjson,
+               'hdf': _read_hdf, 'npy': _read_npy, 'parquet': _read_parquet,
+               'feather': _read_feather}
+    if kind in ['parquet', 'feather'] and pyarrow is None:
+        raise ImportError('reading ' + kind + ' requires pyarrow')
+    return readers[kind](filename, nrows)
+
+
+def read_shards(manifest, nrows=100000):
+    """
+    Iterates over the rows of trajectories exported in shards, reading the files
+    listed in ``manifest`` in order with :py:func:`~betrack.utils.readers.read_tracks`.
+    Rows read from formats without an index are numbered from zero across files.
+
+    :param str manifest: the name of the manifest of the shards
+    :param int nrows: the maximum number of rows of each chunk
+    :returns: an iterator of ``pandas.DataFrame``
+    :rtype: iterator
+    """
+
+    with open(manifest, 'r') as f: shards = json.load(f)
+    kind   = shards['exportas']
+    chunks = (df for s in shards['shards']
+              for df in read_tracks(join(dirname(manifest), s['file']), kind, nrows))
+    if kind in ['csv', 'json', 'hdf']: return chunks
+    return _numbered(chunks)
+
+
+def _numbered(chunks):
+    """
+    Numbers the rows of consecutive chunks from zero.
+    """
+
+    offset = 0
+    for df in chunks:
+        df.index = pandas.RangeIndex(offset, offset + len(df))
+        offset  += len(df)
+        yield df
+
+
+def _read_csv(filename, nrows):
+    with open_input(filename) as f:
+        header = f.readline().rstrip('\r\n').split(',')
+        if header == ['']: return
+        # The index can have the name of a column, as for trajectories indexed by frame..
+        names  = ['__index__'] + header[1:]
+        for df in pandas.read_csv(f, header=None, names=names, index_col=0,
+                                  chunksize=nrows, float_precision='round_trip'):
+            df.index.name = header[0] if header[0] != '' else None
+            yield df
+
+
+def _read_json(filename, nrows):
+    with open_input(filename) as f: df = pandas.read_json(f, precise_float=True)
+    df = df.sort_index()
+    for i in range(0, max(len(df), 1), nrows): yield df.iloc[i:i + nrows]
+
+
+def _read_ndjson(filename, nrows):
+    with open_input(filename) as f:
+        chunks = pandas.read_json(f, lines=True, chunksize=nrows, precise_float=True)
+        for df in _numbered(chunks): yield df
+
+
+def _read_hdf(filename, nrows):
+    with pandas.HDFStore(filename, mode='r') as hdf:
+        keys = [k for k in hdf.keys() if k.startswith('/dflink/f')]
+        keys = sorted(keys, key=lambda k: int(k[len('/dflink/f'):]))
+        if '/dflink' in hdf.keys(): keys = ['/dflink']
+        for key in keys:
+            for df in hdf.select(key, chunksize=nrows): yield df
+
+
+def _read_npy(filename, nrows):
+    tracks = load(filename, mmap_mode='r')
+    chunks = (pandas.DataFrame(tracks[i:i + nrows]) for i in range(0, len(tracks), nrows))
+    for df in _numbered(chunks): yield df
+
+
+def _read_parquet(filename, nrows):
+    f      = pyarrow.parquet.ParquetFile(filename)
+    chunks = (b.to_pandas() for b in f.iter_batches(batch_size=nrows))
+    for df in _numbered(chunks): yield df
+
+
+def _read_feather(filename, nrows):
+    f      = pyarrow.ipc.open_file(filename)
+    chunks = (f.get_batch(i).slice(j, nrows).to_pandas()
+              for i in range(0, f.num_record_batches)
+              for j in range(0, f.get_batch(i).num_rows, nrows))
+    for df in _numbered(chunks): yield df
@@ -0,0 +1,140 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+The module :py:mod:`~betrack.utils.sprites` draws the annotations of particles
+on video frames from cached sprites. The class
+:py:class:`~betrack.utils.sprites.ParticleSprites` rasterizes the identity and
+the position of a particle once, with anti-aliasing, as the coverage of each
+pixel, and then blends the color of the particles with the frame according to
+the coverage wherever the particle appears. Drawing a particle therefore takes
+a multiplication and an addition of a small region of the frame instead of
+rasterizing its text and its position on every frame.
+"""
+
+
+from collections import OrderedDict
+from threading   import Lock
+from numpy       import zeros, array, uint8, float32, nonzero, rint
+from cv2         import (putText, circle, getTextSize, multiply, add, merge,
+                         FONT_HERSHEY_SIMPLEX, LINE_AA)
+
+
+class ParticleSprites(object):
+    """
+    The class :py:class:`~betrack.utils.sprites.ParticleSprites` caches the
+    sprite of each particle, that is, its identity written at an offset of
+    ``(3, 3)`` pixels from its position and a filled circle centered on its
+    position, drawn as by ``cv2.putText`` and ``cv2.circle``. At most
+    ``maxsize`` sprites are kept, discarding the least recently drawn ones. The
+    cache can be shared by threads drawing different frames.
+    """
+
+    def __init__(self, font=FONT_HERSHEY_SIMPLEX, fontscale=0.7, color=(25, 100, 255),
+                 thickness=2, radius=3, maxsize=4096):
+        """
+        Constructor for the class :py:class:`~betrack.utils.sprites.ParticleSprites`.
+
+        :param int font: the font of the identities
+        :param float fontscale: the scale of the font
+        :param tuple color: the color of the particles
+        :param int thickness: the thickness of the lines of the text
+        :param int radius: the radius of the circles
+        :param int maxsize: the maximum number of cached sprites
+        """
+
+        self.font      = font
+        self.fontscale = fontscale
+        self.color     = tuple(color)
+        self.thickness = thickness
+        self.radius    = radius
+        self.maxsize   = maxsize
+        self.sprites   = OrderedDict()
+        self.lock      = Lock()
+
+
+    def style(self):
+        """
+        Returns the attributes that determine the appearance of the sprites.
+
+        :rtype: tuple
+        """
+
+        return (self.font, self.fontscale, self.color, self.thickness, self.radius)
+
+
+    def sprite(self, p):
+        """
+        Returns the sprite of particle ``p``, rasterizing it if not cached.
+
+        :param int p: the identity of the particle
+        :returns: the offset of the top-left corner of the sprite from the position
+                  of the particle, the complement of the coverage of each pixel,
+                  and the color of the particles multiplied by the coverage
+        :rtype: tuple
+        """
+
+        with self.lock: sprite = self.sprites.pop(p, None)
+        if sprite is None: sprite = self.rasterize(p)
+        with self.lock:
+            if not p in self.sprites and len(self.sprites) >= self.maxsize:
+                self.sprites.popitem(last=False)
+            self.sprites[p] = sprite
+        return sprite
+
+
+    def rasterize(self, p):
+        """
+        Rasterizes the sprite of particle ``p`` as returned by
+        :py:func:`~betrack.utils.sprites.ParticleSprites.sprite`.
+        """
+
+        # Draw the sprite on a canvas large enough for the text and the circle..
+        text     = str(p)
+        (w, h), baseline = getTextSize(text, self.font, self.fontscale, self.thickness)
+        pad      = self.radius + self.thickness + 3
+        height   = 2 * (h + baseline + pad)
+        width    = w + 2 * pad + 3
+        cx, cy   = pad, height // 2
+        canvas   = zeros((height, width), dtype=uint8)
+        putText(canvas, text, (cx + 3, cy + 3), self.font, self.fontscale, 255,
+                self.thickness, lineType=LINE_AA, bottomLeftOrigin=True)
+        circle(canvas, (cx, cy), self.radius, 255, thickness=-1, lineType=LINE_AA)
+
+        # Crop the drawn pixels..
+        rows, cols = nonzero(canvas)
+        y0, y1     = rows.min(), rows.max() + 1
+        x0, x1     = cols.min(), cols.max() + 1
+        alpha      = merge([canvas[y0:y1, x0:x1]] * 3)
+        color      = rint(alpha.astype(float32) * array(self.color, dtype=float32) / 255)
+        return (x0 - cx, y0 - cy), 255 - alpha, color.astype(uint8)
+
+
+    def draw(self, frame, ids, positions):
+        """
+        Draws the particles ``ids`` at ``positions`` on ``frame``, clipping the
+        sprites that exceed its borders.
+
+        :param frame: the color frame
+        :type frame: ``numpy.ndarray``
+        :param list ids: the identity of each particle
+        :param list positions: the position ``(x, y)`` of each particle
+        """
+
+        fh, fw = frame.shape[0:2]
+        for p, (x, y) in zip(ids, positions):
+            (ox, oy), back, fore = self.sprite(p)
+            sh, sw = back.shape[0:2]
+            x0, y0 = x + ox, y + oy
+            if x0 < 0 or y0 < 0 or x0 + sw > fw or y0 + sh > fh:
+                # Clip the sprite..
+                l, t = max(0, -x0), max(0, -y0)
+                r, b = min(sw, fw - x0), min(sh, fh - y0)
+                if l >= r or t >= b: continue
+                back, fore = back[t:b, l:r], fore[t:b, l:r]
+                x0, y0, sw, sh = x0 + l, y0 + t, r - l, b - t
+            roi = frame[y0:y0 + sh, x0:x0 + sw]
+            multiply(roi, back, dst=roi, scale=1 / 255.0)
+            add(roi, fore, dst=roi)
@@ -0,0 +1,164 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+The module :py:mod:`~betrack.utils.stages` models the processing of a job as a
+directed acyclic graph of stages by means of the class
+:py:class:`~betrack.utils.stages.Stage`. Each stage produces an artifact and
+depends on a set of configuration attributes and on the artifacts of its input
+stages.
+
+The function :py:func:`~betrack.utils.stages.plan_stages` computes a digest of
+each stage from a signature of the video, obtained with
+:py:func:`~betrack.utils.stages.video_signature`, the attributes of the job and of
+the stage, and the digests of its input stages. Comparing these digests with those
+stored in a manifest by a previous execution, it determines which stages are
+invalidated and need to be executed again. Manifests are read and written with
+:py:func:`~betrack.utils.stages.load_manifest` and
+:py:func:`~betrack.utils.stages.save_manifest`.
+"""
+
+
+from os      import stat
+from hashlib import sha1
+import json
+
+from betrack.utils.featurestore import store_exists
+
+
+class Stage(object):
+    """
+    The class :py:class:`~betrack.utils.stages.Stage` defines a stage of the
+    processing of a job.
+    """
+
+    def __init__(self, name, prefixes, inputs, artifact):
+        """
+        Constructor for the class :py:class:`~betrack.utils.stages.Stage`.
+
+        :param str name: the name of the stage
+        :param list prefixes: prefixes of the configuration attributes the stage depends on
+        :param list inputs: names of the stages whose artifacts are read by the stage
+        :param artifact: function returning the file name of the artifact of a job
+        :type artifact: callable
+        """
+
+        self.name     = name
+        self.prefixes = prefixes
+        self.inputs   = inputs
+        self.artifact = artifact
+
+
+    def attributes(self, config):
+        """
+        Returns the configuration attributes the stage depends on.
+
+        :param dict config: the dictionary of configuration attributes
+        :returns: the attributes of ``config`` starting with one of the prefixes of the stage
+        :rtype: dict
+        """
+
+        return dict((k, v) for k, v in config.items()
+                    if any(k.startswith(p) for p in self.prefixes))
+
+
+def video_signature(filename, digest=False):
+    """
+    Returns a signature of the content of a video file. By default, the signature
+    is based on the size and the modification time of the file. If ``digest`` is
+    ``True``, the signature is the SHA-1 digest of the content of the file.
+
+    :param str filename: the name of the video file
+    :param bool digest: whether to compute a digest of the content of the file or not
+    :returns: the signature of the video
+    :rtype: str
+    """
+
+    if digest:
+        h = sha1()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        return h.hexdigest()
+    else:
+        st = stat(filename)
+        return str(st.st_size) + '-' + repr(st.st_mtime)
+
+
+def plan_stages(stages, signature, job, config, manifest, force=False):
+    """
+    Determines which stages of ``job`` need to be executed. A stage is executed if
+    ``force`` is ``True``, if its digest differs from the one stored in
+    ``manifest``, if its artifact is missing, or if any of its input stages is
+    executed. Artifacts are looked up with
+    :py:func:`~betrack.utils.featurestore.store_exists`, so that feature stores
+    kept in memory are not found on disk.
+
+    :param list stages: the stages of the job in topological order
+    :param str signature: the signature of the video of the job
+    :param job: the job to be processed
+    :type job: :py:class:`~betrack.utils.job.Job`
+    :param dict config: the dictionary of configuration attributes
+    :param dict manifest: the digests of the stages of the previous execution
+    :param bool force: whether to execute all stages or not
+    :returns: a list of tuples giving for each stage its digest and the reason why
+              it needs to be executed, ``None`` if the stage is up to date
+    :rtype: list
+    """
+
+    digests = {}
+    reasons = {}
+    plan    = []
+    for stage in stages:
+        key = dict(video=signature, margins=job.margins, period=job.period,
+                   periodtype=job.periodtype, config=stage.attributes(config),
+                   inputs=[digests[i] for i in stage.inputs])
+        digest = sha1(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+        changed = [i for i in stage.inputs if reasons[i] is not None]
+        if force:                                   reason = 'forced'
+        elif len(changed) > 0:                      reason = 'input ' + changed[0] + ' changed'
+        elif stage.name not in manifest:            reason = 'not cached'
+        elif manifest[stage.name] != digest:        reason = 'configuration changed'
+        elif not store_exists(stage.artifact(job)): reason = 'artifact missing'
+        else:                                       reason = None
+
+        digests[stage.name] = digest
+        reasons[stage.name] = reason
+        plan.append((stage, digest, reason))
+
+    return plan
+
+
+def load_manifest(filename):
+    """
+    Loads the digests of the stages of a job from a manifest file. If the file
+    does not exist or is not valid, an empty manifest is returned.
+
+    :param str filename: the name of the manifest file
+    :returns: a dictionary mapping the name of each stage to its digest
+    :rtype: dict
+    """
+
+    try:
+        with open(filename, 'r') as f:
+            manifest = json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+    if type(manifest) != dict: return {}
+    return manifest.get('stages', {})
+
+
+def save_manifest(filename, manifest):
+    """
+    Saves the digests of the stages of a job to a manifest file.
+
+    :param str filename: the name of the manifest file
+    :param dict manifest: a dictionary mapping the name of each stage to its digest
+    """
+
+    with open(filename, 'w') as f:
+        json.dump({'stages': manifest}, f, indent=2, sort_keys=True)
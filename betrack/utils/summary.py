@@ -0,0 +1,108 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+The module :py:mod:`~betrack.utils.summary` summarizes each trajectory of a job
+in a single row by means of the class
+:py:class:`~betrack.utils.summary.TrackSummary`. Trajectories are summarized one
+chunk of frames at a time with grouped operations, so that the summary can be
+computed while trajectories are exported, also out of core.
+"""
+
+
+from numpy  import zeros, hypot, diff, where, lexsort, float64, nan
+import pandas
+
+
+# Aggregation of the partial summaries of two chunks..
+_MERGE = {'start': 'min', 'end': 'max', 'length': 'sum', 'path': 'sum',
+          'xmin': 'min', 'xmax': 'max', 'ymin': 'min', 'ymax': 'max',
+          'x0': 'first', 'y0': 'first', 'x1': 'last', 'y1': 'last',
+          'mass': 'sum', 'size': 'sum'}
+
+
+class TrackSummary(object):
+    """
+    The class :py:class:`~betrack.utils.summary.TrackSummary` computes for each
+    particle the first and last frame, the number of frames, the mean mass and
+    size, the length of the path, the mean speed in pixels per frame, and the
+    bounding box of its trajectory. Chunks must be given in order of frame.
+    """
+
+    def __init__(self):
+        """
+        Constructor for the class :py:class:`~betrack.utils.summary.TrackSummary`.
+        """
+
+        self.partial = None       # Partial summary of the chunks seen so far
+
+
+    def update(self, df):
+        """
+        Adds a chunk of trajectories to the summary.
+
+        :param df: the trajectories of consecutive frames
+        :type df: ``pandas.DataFrame``
+        """
+
+        if len(df) == 0: return
+        df = df.iloc[lexsort((df['frame'].values, df['particle'].values))]
+        p  = df['particle'].values
+        x  = df['x'].values.astype(float64)
+        y  = df['y'].values.astype(float64)
+
+        # Distance from the previous position of the same particle..
+        steps     = zeros(len(df))
+        steps[1:] = where(p[1:] == p[:-1], hypot(diff(x), diff(y)), 0)
+
+        values = pandas.DataFrame({'frame': df['frame'].values, 'x': x, 'y': y,
+                                   'step': steps}, index=pandas.Index(p, name='particle'))
+        for c in ['mass', 'size']:
+            if c in df.columns: values[c] = df[c].values.astype(float64)
+        g     = values.groupby(level=0, sort=True)
+        chunk = pandas.DataFrame({'start': g['frame'].min(), 'end': g['frame'].max(),
+                                  'length': g.size(), 'path': g['step'].sum(),
+                                  'xmin': g['x'].min(), 'xmax': g['x'].max(),
+                                  'ymin': g['y'].min(), 'ymax': g['y'].max(),
+                                  'x0': g['x'].first(), 'y0': g['y'].first(),
+                                  'x1': g['x'].last(), 'y1': g['y'].last()})
+        for c in ['mass', 'size']:
+            if c in values.columns: chunk[c] = g[c].sum()
+
+        if self.partial is None:
+            self.partial = chunk
+            return
+
+        # Join trajectories continuing from the previous chunks..
+        common = chunk.index.intersection(self.partial.index)
+        joins  = hypot(chunk.loc[common, 'x0'] - self.partial.loc[common, 'x1'],
+                       chunk.loc[common, 'y0'] - self.partial.loc[common, 'y1'])
+        merged = pandas.concat([self.partial, chunk]).groupby(level=0, sort=True)
+        self.partial = merged.agg(dict((c, _MERGE[c]) for c in chunk.columns))
+        self.partial.loc[common, 'path'] += joins
+
+
+    def table(self):
+        """
+        Returns the summary of the trajectories added so far.
+
+        :returns: a table indexed by particle with columns ``start``, ``end``,
+                  ``length``, ``mass`` and ``size`` (mean values, if located),
+                  ``path``, ``speed``, ``xmin``, ``xmax``, ``ymin``, and ``ymax``
+        :rtype: ``pandas.DataFrame``
+        """
+
+        columns = ['start', 'end', 'length', 'mass', 'size', 'path', 'speed',
+                   'xmin', 'xmax', 'ymin', 'ymax']
+        if self.partial is None:
+            return pandas.DataFrame(columns=columns, index=pandas.Index([], name='particle'))
+
+        s        = self.partial.copy()
+        duration = (s['end'] - s['start']).astype(float64)
+        s['speed'] = (s['path'] / duration).where(duration > 0, nan)
+        for c in ['mass', 'size']:
+            if c in s.columns: s[c] = s[c] / s['length']
+        s.index.name = 'particle'
+        return s[[c for c in columns if c in s.columns]]
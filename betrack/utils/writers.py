@@ -0,0 +1,627 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+The module :py:mod:`~betrack.utils.writers` writes trajectories to files one
+chunk of rows at a time. The function :py:func:`~betrack.utils.writers.write_csv`
+formats chunks of rows as CSV in parallel worker processes, as formatting holds the
+interpreter lock, and writes them in order. Only a few chunks are formatted at any
+time, so that memory does not grow with the number of rows. Chunks can be taken
+from any iterable of ``DataFrame``, such as
+:py:func:`~betrack.utils.job.Job.iter_trajectories` or a
+:py:class:`~betrack.utils.featurestore.FeatureStore`.
+
+The function :py:func:`~betrack.utils.writers.write_ndjson` writes one JSON record
+per line in the same way, so that readers can parse the file line by line. Both
+functions also write to files opened by
+:py:func:`~betrack.utils.compression.open_output`, which can compress text while
+it is written.
+
+The function :py:func:`~betrack.utils.writers.write_hdf` writes rows to compressed
+HDF5 tables indexed by frame and by particle, so that ranges of frames or the
+trajectory of a particle can be queried without reading the whole file.
+
+The function :py:func:`~betrack.utils.writers.write_npy` writes rows sorted by frame
+to a NumPy ``.npy`` file holding a structured array, together with index files
+giving the rows of each frame and of each particle. The class
+:py:class:`~betrack.utils.writers.NpyTracks` maps these files in memory and returns
+the rows of a frame or of a particle as slices, without parsing.
+
+The class :py:class:`~betrack.utils.writers.ProgressiveWriter` appends frames to
+a CSV or NDJSON file while they are linked, as soon as they are final.
+
+The function :py:func:`~betrack.utils.writers.write_arrow` writes rows sorted by
+frame to a Parquet file with one row group for each range of frames, or to a
+Feather file with one record batch for each range of frames. Both formats require
+the optional dependency ``pyarrow``.
+"""
+
+
+from collections     import deque
+from itertools       import chain
+from multiprocessing import Pool
+from os.path         import splitext
+from struct          import pack
+from numpy           import (flatnonzero, diff, empty, dtype, load, save, arange,
+                             argsort, searchsorted, int64)
+from numpy.lib.format import dtype_to_descr
+import pandas
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+# Formats written with pyarrow..
+ARROW_FORMATS = ['parquet', 'feather']
+
+# Formats of exported trajectories..
+FORMATS = ['hdf', 'csv', 'json', 'ndjson', 'npy'] + ARROW_FORMATS
+
+# Text formats, compressed as a whole..
+TEXT_FORMATS = ['csv', 'json', 'ndjson']
+
+# Columns indexed in HDF5 files..
+HDF_INDEXES = ['frame', 'particle']
+
+# Compression libraries of HDF5 files..
+HDF_COMPLIBS = {'gzip': 'zlib', 'zstd': 'blosc:zstd', 'lz4': 'blosc:lz4'}
+
+# Compressions supported by pyarrow for each format..
+ARROW_COMPRESSIONS = {'parquet': ['gzip', 'zstd', 'lz4'], 'feather': ['zstd', 'lz4']}
+
+# Formats that can be appended while linking..
+PROGRESSIVE_FORMATS = ['csv', 'ndjson']
+
+
+def float_format(precision):
+    """
+    Returns the format of floating point values with ``precision`` decimal digits.
+
+    :param int precision: the number of decimal digits, ``None`` for full precision
+    :returns: the format or ``None`` for full precision
+    :rtype: str
+    """
+
+    return None if precision is None else '%.' + str(precision) + 'f'
+
+
+def _format_csv(args):
+    """
+    Formats a chunk of rows as CSV.
+
+    :param tuple args: the rows, whether to include the header, and the format of floats
+    :returns: the formatted rows
+    :rtype: str
+    """
+
+    df, header, fformat = args
+    return df.to_csv(None, header=header, float_format=fformat)
+
+
+def _format_ndjson(args):
+    """
+    Formats a chunk of rows as JSON records, one per line.
+
+    :param tuple args: the rows and the number of decimal digits of floats
+    :returns: the formatted rows
+    :rtype: str
+    """
+
+    df, precision = args
+    if len(df) == 0: return ''
+    lines = df.to_json(None, orient='records', lines=True, double_precision=precision)
+    return lines if lines.endswith('\n') else lines + '\n'
+
+
+def _split(chunks, nrows):
+    """
+    Splits each chunk of an iterable of ``DataFrame`` in chunks of at most ``nrows``
+    rows.
+    """
+
+    for chunk in chunks:
+        if len(chunk) <= nrows: yield chunk
+        else:
+            for i in range(0, len(chunk), nrows): yield chunk.iloc[i:i + nrows]
+
+
+def _open(output):
+    """
+    Returns the file ``output`` if already opened, otherwise opens it for writing.
+    """
+
+    if hasattr(output, 'write'): return _Unclosed(output)
+    return open(output, 'w')
+
+
+class _Unclosed(object):
+    """
+    Wraps an opened file that must not be closed when leaving a ``with`` block.
+    """
+
+    def __init__(self, f):
+        self.f = f
+
+    def __enter__(self):
+        return self.f
+
+    def __exit__(self, type, value, traceback):
+        pass
+
+
+def write_csv(filename, chunks, precision=None, nprocesses=1, nrows=100000):
+    """
+    Writes an iterable of ``DataFrame`` with the same columns to a CSV file, with
+    the header of the first one. The output is the same of writing all rows at
+    once with ``pandas.DataFrame.to_csv``. Worker processes are started only if
+    there is more than one chunk of rows.
+
+    :param str filename: the name of the CSV file, or a file opened for writing text
+    :param chunks: the rows to write
+    :type chunks: iterable
+    :param int precision: the number of decimal digits of floats, ``None`` for full precision
+    :param int nprocesses: the number of worker processes, ``1`` to format rows in
+                           the current process
+    :param int nrows: the maximum number of rows formatted at once by a worker
+    :returns: the number of rows written
+    :rtype: int
+    """
+
+    fformat = float_format(precision)
+    chunks  = _split(chunks, nrows)
+    first   = next(chunks, None)
+    if first is None: first = pandas.DataFrame()
+    second  = next(chunks, None)
+    total   = len(first)
+
+    with _open(filename) as f:
+        f.write(_format_csv((first, True, fformat)))
+        if second is None: return total
+        total += _write_ordered(f, _format_csv, ((df, False, fformat) for df
+                                                 in chain([second], chunks)), nprocesses)
+    return total
+
+
+def write_ndjson(filename, chunks, precision=None, nprocesses=1, nrows=100000):
+    """
+    Writes an iterable of ``DataFrame`` to a file with one JSON record per line,
+    mapping each column to its value. The index of the rows is not written and
+    missing values are written as ``null``. Worker processes are started only if
+    there is more than one chunk of rows.
+
+    :param str filename: the name of the file, or a file opened for writing text
+    :param chunks: the rows to write
+    :type chunks: iterable
+    :param int precision: the number of decimal digits of floats, ``None`` for the
+                          maximum of 15 digits
+    :param int nprocesses: the number of worker processes, ``1`` to format rows in
+                           the current process
+    :param int nrows: the maximum number of rows formatted at once by a worker
+    :returns: the number of rows written
+    :rtype: int
+    """
+
+    precision = 15 if precision is None else precision
+    chunks    = _split(chunks, nrows)
+    first     = next(chunks, None)
+    if first is None: first = pandas.DataFrame()
+    second    = next(chunks, None)
+    total     = len(first)
+
+    with _open(filename) as f:
+        f.write(_format_ndjson((first, precision)))
+        if second is None: return total
+        total += _write_ordered(f, _format_ndjson, ((df, precision) for df
+                                                    in chain([second], chunks)), nprocesses)
+    return total
+
+
+def _write_ordered(f, formatter, tasks, nprocesses):
+    """
+    Formats each chunk of rows in ``tasks`` with ``formatter``, in parallel if
+    ``nprocesses`` is greater than one, and writes them in order to the file ``f``.
+    Only a bounded number of chunks are formatted at any time.
+
+    :returns: the number of rows written
+    :rtype: int
+    """
+
+    total = 0
+    if nprocesses <= 1:
+        for args in tasks:
+            f.write(formatter(args))
+            total += len(args[0])
+        return total
+
+    pool    = Pool(nprocesses)
+    pending = deque()
+    try:
+        for args in tasks:
+            pending.append(pool.apply_async(formatter, (args,)))
+            total += len(args[0])
+            if len(pending) >= 2 * nprocesses: f.write(pending.popleft().get())
+        while len(pending) > 0: f.write(pending.popleft().get())
+    finally:
+        pool.close()
+        pool.join()
+    return total
+
+
+def frame_ranges(chunks, nframes, start):
+    """
+    Regroups chunks of rows sorted by frame in chunks holding the rows of the
+    frames in ``[start + k * nframes, start + (k + 1) * nframes)``, for each ``k``.
+    """
+
+    pending = []
+    current = None
+    for chunk in chunks:
+        if len(chunk) == 0: continue
+        keys   = (chunk['frame'].values - start) // nframes
+        bounds = [0] + list(flatnonzero(diff(keys)) + 1) + [len(chunk)]
+        for i, j in zip(bounds[:-1], bounds[1:]):
+            if current is not None and keys[i] != current:
+                yield pandas.concat(pending)
+                pending = []
+            current = keys[i]
+            pending.append(chunk.iloc[i:j])
+    if len(pending) > 0: yield pandas.concat(pending)
+
+
+def write_hdf(filename, chunks, key='dflink', complevel=5, complib='blosc:zstd',
+              nframes=None, start=0, expectedrows=None):
+    """
+    Writes an iterable of ``DataFrame`` with the same columns to compressed HDF5
+    tables of the file ``filename``, with every column available for queries.
+    Rows are appended without indexing and, once all rows are written, a
+    completely sorted index is created for columns ``frame`` and ``particle``,
+    if present. If ``nframes`` is given, rows sorted by frame are grouped by
+    ranges of ``nframes`` frames starting from frame ``start`` and each range is
+    written to a separate table ``<key>/f<first frame>``. Otherwise, all rows are
+    written to table ``key``, whose chunk shape is chosen by PyTables for
+    ``expectedrows`` rows, if given.
+
+    :param str filename: the name of the HDF5 file
+    :param chunks: the rows to write
+    :type chunks: iterable
+    :param str key: the name of the table
+    :param int complevel: the compression level, from ``0`` (no compression) to ``9``
+    :param str complib: the compression library
+    :param int nframes: the number of frames of each table, ``None`` for a single table
+    :param int start: the first frame of the first table
+    :param int expectedrows: the expected number of rows of each table, if known
+    :returns: the number of rows written
+    :rtype: int
+    """
+
+    total  = 0
+    tables = []
+    hdf    = pandas.HDFStore(filename, mode='w', complevel=complevel, complib=complib)
+    try:
+        if nframes is None:
+            for df in chunks:
+                hdf.append(key, df, format='table', data_columns=True, index=False,
+                           expectedrows=expectedrows)
+                total += len(df)
+            if key in hdf: tables.append(key)
+        else:
+            for df in frame_ranges(chunks, nframes, start):
+                first = start + (int(df['frame'].values[0]) - start) // nframes * nframes
+                name  = key + '/f' + str(first)
+                hdf.append(name, df, format='table', data_columns=True, index=False,
+                           expectedrows=len(df))
+                total += len(df)
+                tables.append(name)
+
+        # Index the written tables..
+        for name in tables:
+            columns = [c for c in HDF_INDEXES if c in hdf.get_storer(name).data_columns]
+            if len(columns) > 0:
+                hdf.create_table_index(name, columns=columns, optlevel=9, kind='full')
+    finally:
+        hdf.close()
+    return total
+
+
+def npy_indexes(filename):
+    """
+    Returns the names of the index files of the ``.npy`` file ``filename``: the
+    offsets of the rows of each frame, the offsets of the rows of each particle,
+    and the order of the rows by particle.
+
+    :param str filename: the name of the ``.npy`` file
+    :returns: the names of the three index files
+    :rtype: tuple
+    """
+
+    name = splitext(filename)[0]
+    return name + '-frames.npy', name + '-particles.npy', name + '-order.npy'
+
+
+def _npy_header(descr, nrows, size=None):
+    """
+    Returns the header of a ``.npy`` file (version 1.0) of ``nrows`` rows of type
+    ``descr``, padded with spaces to ``size`` bytes or to a multiple of 64 bytes.
+    """
+
+    header = repr({'descr': descr, 'fortran_order': False, 'shape': (nrows,)})
+    if size is None: size = (10 + len(header) + 1 + 63) // 64 * 64
+    header = header + ' ' * (size - 10 - len(header) - 1) + '\n'
+    return b'\x93NUMPY\x01\x00' + pack('<H', len(header)) + header.encode('latin1')
+
+
+def write_npy(filename, chunks):
+    """
+    Writes an iterable of ``DataFrame`` with the same columns and sorted by frame
+    to a ``.npy`` file holding a structured array with a field for each column,
+    which can be mapped in memory with ``numpy.load(filename, mmap_mode='r')``.
+    The index of the rows is not written. As the number of rows is not known in
+    advance, the header of the file is written with room for any number of rows
+    and completed at the end. The index files returned by
+    :py:func:`~betrack.utils.writers.npy_indexes` are then computed from the
+    mapped file, if columns ``frame`` and ``particle`` are present: the rows of
+    frame ``f`` are ``[frames[f], frames[f + 1])``, those of particle ``p`` are
+    ``order[particles[p]:particles[p + 1]]``, sorted by frame. Computing the
+    order of the rows by particle holds one integer for each row in memory.
+
+    :param str filename: the name of the ``.npy`` file
+    :param chunks: the rows to write
+    :type chunks: iterable
+    :returns: the number of rows written
+    :rtype: int
+    """
+
+    total = 0
+    types = None
+    with open(filename, 'wb') as f:
+        for df in chunks:
+            if types is None:
+                types  = dtype([(str(c), df[c].values.dtype) for c in df.columns])
+                header = len(_npy_header(dtype_to_descr(types), 10 ** 19))
+                f.write(b'\0' * header)
+            rows = empty(len(df), dtype=types)
+            for c in types.names: rows[c] = df[c].values
+            f.write(rows.tobytes())
+            total += len(df)
+
+        # Complete the header..
+        if types is None:
+            types  = dtype([])
+            header = None
+        f.seek(0)
+        f.write(_npy_header(dtype_to_descr(types), total, header))
+
+    # Index by frame and by particle..
+    if 'frame' in types.names and 'particle' in types.names:
+        tracks = load(filename, mmap_mode='r')
+        frames, particles, order = npy_indexes(filename)
+        ids    = tracks['particle']
+        last   = int(tracks['frame'][-1]) + 2 if total > 0 else 1
+        save(frames, searchsorted(tracks['frame'], arange(0, last)).astype(int64))
+        sort   = argsort(ids, kind='mergesort').astype(int64)
+        last   = int(ids[sort[-1]]) + 2 if total > 0 else 1
+        save(particles, searchsorted(ids[sort], arange(0, last)).astype(int64))
+        save(order, sort)
+        del tracks
+    return total
+
+
+class NpyTracks(object):
+    """
+    The class :py:class:`~betrack.utils.writers.NpyTracks` maps in memory the
+    trajectories written by :py:func:`~betrack.utils.writers.write_npy` and
+    their index files, and returns the rows of a frame or of a particle.
+    """
+
+    def __init__(self, filename):
+        """
+        Constructor for the class :py:class:`~betrack.utils.writers.NpyTracks`.
+
+        :param str filename: the name of the ``.npy`` file
+        """
+
+        frames, particles, order = npy_indexes(filename)
+        self.tracks    = load(filename, mmap_mode='r')
+        self.frames    = load(frames, mmap_mode='r')
+        self.particles = load(particles, mmap_mode='r')
+        self.order     = load(order, mmap_mode='r')
+
+
+    def frame(self, f):
+        """
+        Returns the rows of frame ``f`` as a view of the mapped file.
+
+        :param int f: the frame
+        :returns: the rows of the frame
+        :rtype: ``numpy.ndarray``
+        """
+
+        if f < 0 or f + 1 >= len(self.frames): return self.tracks[0:0]
+        return self.tracks[self.frames[f]:self.frames[f + 1]]
+
+
+    def particle(self, p):
+        """
+        Returns the rows of particle ``p`` sorted by frame.
+
+        :param int p: the particle
+        :returns: the rows of the particle
+        :rtype: ``numpy.ndarray``
+        """
+
+        if p < 0 or p + 1 >= len(self.particles): return self.tracks[0:0]
+        return self.tracks[self.order[self.particles[p]:self.particles[p + 1]]]
+
+
+class ProgressiveWriter(object):
+    """
+    The class :py:class:`~betrack.utils.writers.ProgressiveWriter` appends linked
+    frames to a CSV or NDJSON file while features are still being linked, so
+    that the file can be followed by other programs. A frame is final once it is
+    older than ``memory`` frames, as it can no longer be linked to a new
+    feature. Final frames are written, and the file flushed, every ``nframes``
+    linked frames. Rows are written as by
+    :py:func:`~betrack.utils.writers.write_csv` and
+    :py:func:`~betrack.utils.writers.write_ndjson`, with coordinates shifted by
+    ``offset`` to the frames of the original video.
+    """
+
+    def __init__(self, f, kind, memory=0, nframes=100, precision=None, offset=None):
+        """
+        Constructor for the class :py:class:`~betrack.utils.writers.ProgressiveWriter`.
+
+        :param f: a file opened for writing text
+        :param str kind: either ``'csv'`` or ``'ndjson'``
+        :param int memory: the maximum number of frames a feature can vanish
+        :param int nframes: the number of linked frames between two writes
+        :param int precision: the number of decimal digits of floats, if any
+        :param list offset: the offset ``[x, y]`` added to coordinates, if any
+        """
+
+        self.f         = f
+        self.kind      = kind
+        self.memory    = memory
+        self.nframes   = nframes
+        self.precision = precision
+        self.offset    = offset
+        self.header    = kind == 'csv'    # Whether the CSV header is still to write
+        self.nlinked   = 0                # Number of linked frames
+        self.nrows     = 0                # Number of written rows
+        self.pending   = deque()          # Frames not yet final
+        self.ready     = []               # Final frames not yet written
+
+
+    def push(self, frames, current):
+        """
+        Adds the ``frames`` returned after linking frame ``current``, and writes the
+        final frames every ``nframes`` linked frames.
+
+        :param list frames: the linked frames, as ``DataFrame`` sorted by frame
+        :param int current: the last linked frame
+        """
+
+        self.pending.extend(df for df in frames if len(df) > 0)
+        while (len(self.pending) > 0 and
+               self.pending[0]['frame'].values[0] < current - self.memory):
+            self.ready.append(self.pending.popleft())
+        self.nlinked += 1
+        if self.nlinked % self.nframes == 0: self.write()
+
+
+    def write(self, frames=()):
+        """
+        Writes the final frames, followed by ``frames``, and flushes the file.
+
+        :param frames: frames already final, as ``DataFrame`` sorted by frame
+        :type frames: iterable
+        """
+
+        self.ready.extend(df for df in frames if len(df) > 0)
+        if len(self.ready) > 0:
+            df = pandas.concat(self.ready)
+            self.ready = []
+            if self.offset is not None:
+                df   = df.copy()
+                df.x = df.x + self.offset[0]
+                df.y = df.y + self.offset[1]
+            if self.kind == 'csv':
+                self.f.write(_format_csv((df, self.header, float_format(self.precision))))
+                self.header = False
+            else:
+                self.f.write(_format_ndjson((df, 15 if self.precision is None
+                                             else self.precision)))
+            self.nrows += len(df)
+        self.f.flush()
+
+
+    def close(self, frames=()):
+        """
+        Writes all the remaining frames, followed by ``frames``, as linking is
+        completed, and closes the file.
+
+        :param frames: the last linked frames, as ``DataFrame`` sorted by frame
+        :type frames: iterable
+        """
+
+        self.ready.extend(self.pending)
+        self.pending.clear()
+        self.write(frames)
+        self.f.close()
+
+
+def write_arrow(filename, chunks, kind='parquet', nframes=1000, start=0,
+                compression=None):
+    """
+    Writes an iterable of ``DataFrame`` with the same columns and sorted by frame
+    to a Parquet or a Feather file. Rows are grouped by ranges of ``nframes``
+    frames starting from frame ``start`` and each range is written as a row
+    group of the Parquet file, with the minimum and maximum of each column, or as
+    a record batch of the Feather file. Readers can therefore skip ranges of
+    frames or particles without reading them. The index of the rows is not
+    written.
+
+    :param str filename: the name of the file
+    :param chunks: the rows to write
+    :type chunks: iterable
+    :param str kind: either ``'parquet'`` or ``'feather'``
+    :param int nframes: the number of frames of each row group
+    :param int start: the first frame of the first row group
+    :param str compression: the compression of the file, one of
+                            ``ARROW_COMPRESSIONS[kind]``, if not the default one
+    :returns: the number of rows written
+    :rtype: int
+    :raises ImportError: if ``pyarrow`` is not installed
+    """
+
+    if pyarrow is None: raise ImportError('exporting as ' + kind + ' requires pyarrow')
+
+    writer = None
+    total  = 0
+    try:
+        for df in frame_ranges(chunks, nframes, start):
+            table = pyarrow.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                schema = table.schema
+                writer = _arrow_writer(filename, schema, kind, compression)
+            writer.write_table(table.cast(schema), row_group_size=len(table))
+            total += len(df)
+
+        # Write an empty file if there are no rows..
+        if writer is None:
+            writer = _arrow_writer(filename, pyarrow.schema([]), kind, compression)
+    finally:
+        if writer is not None: writer.close()
+    return total
+
+
+def _arrow_writer(filename, schema, kind, compression=None):
+    """
+    Opens a Parquet or Feather file with the given schema for writing.
+    """
+
+    if kind == 'parquet':
+        if compression is None: return pyarrow.parquet.ParquetWriter(filename, schema)
+        return pyarrow.parquet.ParquetWriter(filename, schema, compression=compression)
+    options = pyarrow.ipc.IpcWriteOptions(compression=compression)
+    return _FeatherWriter(pyarrow.ipc.new_file(filename, schema, options=options))
+
+
+class _FeatherWriter(object):
+    """
+    Writes each table as a single record batch of a Feather file.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write_table(self, table, row_group_size=None):
+        self.writer.write_table(table, max_chunksize=row_group_size)
+
+    def close(self):
+        self.writer.close()
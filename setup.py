@@ -70,6 +70,8 @@ setup(
         'tqdm', 'tables', 'opencv-python', 'imageio'],
     extras_require = {
         'test': ['coverage', 'pytest', 'pytest-cov', 'codecov'],
+        'arrow': ['pyarrow'],
+        'compression': ['zstandard', 'lz4'],
     },
     entry_points = {
         'console_scripts': [
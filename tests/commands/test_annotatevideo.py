@@ -10,6 +10,10 @@ Tests for our `betrack annotate-video` subcommand.
 
 from subprocess import PIPE, Popen as popen
 from unittest import TestCase
+from numpy    import arange, zeros, uint8
+from pandas   import DataFrame
+
+from betrack.commands.annotatevideo import AnnotateVideo, _iter_frames
 
 
 class TestAnnotateVideo(TestCase):
@@ -17,3 +21,28 @@ class TestAnnotateVideo(TestCase):
         output = popen(['betrack', 'annotate-video'], stdout=PIPE).communicate()[0]
         lines = output.split(b'\n')
         self.assertTrue(len(lines) != 1)
+
+
+    def test_iter_frames(self):
+        df     = DataFrame({'y': arange(0, 12.0), 'x': arange(0, 12.0),
+                            'frame': [5, 5, 1, 1, 1, 2, 7, 7, 8, 9, 9, 9],
+                            'particle': [1, 0, 0, 1, 2, 0, 0, 1, 0, 0, 1, 2]})
+        frames = list(_iter_frames(iter([df.iloc[0:8], df.iloc[8:]]), 1, 9))
+        self.assertEqual(len(frames), 8)
+        self.assertEqual([len(f) for f in frames], [3, 1, 0, 0, 2, 0, 2, 1])
+        self.assertEqual(list(frames[0]['particle']), [0, 1, 2])
+        self.assertEqual(list(frames[4]['particle']), [1, 0])
+        self.assertEqual(list(frames[2].columns), list(df.columns))
+
+
+    def test_draw_particles(self):
+        av = AnnotateVideo({})
+        df = DataFrame({'y': [20.0, 60.0], 'x': [30.0, 80.0], 'frame': [0, 0],
+                        'particle': [4, 7]})
+        frame = zeros((100, 120, 3), dtype=uint8)
+        av.draw_particles(frame, df, [7])
+        self.assertEqual(frame[20, 30].sum(), 0)
+        self.assertTrue(frame[60, 80].sum() > 0)
+        av.draw_particles(frame, df, [])
+        self.assertTrue(frame[20, 30].sum() > 0)
+        av.draw_particles(frame, df.iloc[0:0], [])
@@ -0,0 +1,125 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+Tests for module `betrack.commands.calibrateparticles`.
+"""
+
+try:
+    from os import EX_OK, EX_CONFIG
+except ImportError:
+    EX_OK     = 0
+    EX_CONFIG = 78
+
+from unittest import TestCase
+from tempfile import NamedTemporaryFile
+from os       import remove, name
+from os.path  import isfile
+from cv2      import VideoWriter, VideoWriter_fourcc
+from numpy    import arange, array, zeros, uint8
+from pandas   import read_csv
+
+from betrack.commands.calibrateparticles import *
+from betrack.utils.parser                import open_configuration
+
+class TestCalibrateParticles(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Create temporary video file..
+        cls._vf         = NamedTemporaryFile(mode='w', suffix='.avi', delete=False)
+        cls._vf.close()
+        cls._nframes    = 10
+        cls._pdiameter  = 11      # Must be odd!
+        cls._nparticles = 5
+        cls._voffset    = 100
+        cls._hoffset    = 10
+        codec           = VideoWriter_fourcc('M', 'J', 'P', 'G')
+        cls._framerate  = cls._nframes
+        cls._frameshape = (1000, 1000, 3)
+        oshape          = cls._frameshape[0:2][::-1]
+        writer          = VideoWriter(cls._vf.name, codec, cls._framerate, oshape)
+
+        for i in arange(0, cls._nframes):
+            f = zeros(cls._frameshape, dtype=uint8)
+            for p in arange(0, cls._nparticles):
+                pr         = int(cls._pdiameter/2)
+                y          = cls._voffset * (p + 1)
+                y          = arange(y - pr, y + pr + 1)
+                x          = cls._voffset + cls._hoffset * (i + 1)
+                x          = arange(x - pr, x + pr + 1)
+                f[y, x, 1] = 255
+            f = array(f)
+            writer.write(f)
+        writer.release()
+
+
+    @classmethod
+    def tearDownClass(cls):
+        # Remove temporary file..
+        if name != 'nt': remove(cls._vf.name)
+
+
+    def test_configure_calibrator(self):
+        for attr in ['cp-nframes: 1', 'cp-cache: disk', 'cp-nprocesses: 0',
+                     'tp-locate-diameter: []', 'tp-locate-diameter: [11, 12]']:
+            cf  = NamedTemporaryFile(mode='w', suffix='.yml', delete=False)
+            cf.write('tp-link-searchrange: 10\n')
+            cf.write(attr + '\n')
+            cf.close()
+            opt = {'--configuration': cf.name}
+            cp  = CalibrateParticles(opt)
+            with self.assertRaises(SystemExit) as cm:
+                cp.configure_calibrator(opt['--configuration'])
+            self.assertEqual(cm.exception.code, EX_CONFIG)
+            remove(cf.name)
+
+        cf  = NamedTemporaryFile(mode='w', suffix='.yml', delete=False)
+        cf.write('tp-locate-diameter: [9, 11, 13]\n')
+        cf.write('tp-link-searchrange: [10, 20]\n')
+        cf.write('tp-link-memory: 2\n')
+        cf.write('cp-cache: memmap\n')
+        cf.write('jobs:\n')
+        cf.write('  - video: ' + self._vf.name + '\n')
+        cf.close()
+        opt = {'--configuration': cf.name}
+        cp  = CalibrateParticles(opt)
+        cp.configure_calibrator(opt['--configuration'])
+        self.assertEqual(cp.cache, 'memmap')
+        self.assertEqual(len(cp.variants), 6)
+        self.assertEqual(len(cp.trackers), 6)
+        self.assertEqual(cp.trackers[5].locate_diameter, 13)
+        self.assertEqual(cp.trackers[5].link_searchrange, 20)
+        self.assertEqual(cp.trackers[5].link_memory, 2)
+        remove(cf.name)
+
+
+    def test_run(self):
+        for cache in ['memory', 'memmap']:
+            cf  = NamedTemporaryFile(mode='w', suffix='.yml', delete=False)
+            cf.write('tp-locate-diameter: [' + str(self._pdiameter - 4) + ', ' +
+                     str(self._pdiameter) + ']\n')
+            cf.write('tp-link-searchrange: [2, ' + str(self._hoffset * 2) + ']\n')
+            cf.write('cp-cache: ' + cache + '\n')
+            cf.write('cp-nprocesses: 2\n')
+            cf.write('jobs:\n')
+            cf.write('  - video: ' + self._vf.name + '\n')
+            cf.close()
+            opt  = {'--configuration': cf.name}
+            cp   = CalibrateParticles(opt)
+            rval = cp.run()
+            self.assertEqual(rval, EX_OK)
+
+            job   = cp.jobs[0]
+            table = read_csv(job.csvcalibration, index_col=0)
+            self.assertEqual(table.shape[0], 4)
+            self.assertFalse(isfile(job.npycache))
+
+            best = open_configuration(job.ymlcalibration)
+            self.assertEqual(best['tp-locate-diameter'], self._pdiameter)
+            self.assertEqual(best['tp-link-searchrange'], self._hoffset * 2)
+            remove(job.csvcalibration)
+            remove(job.ymlcalibration)
+            remove(cf.name)
@@ -0,0 +1,154 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+Tests for module `betrack.commands.exporttracks`.
+"""
+
+try:
+    from os import EX_OK, EX_CONFIG
+except ImportError:
+    EX_OK     = 0
+    EX_CONFIG = 78
+
+from unittest import TestCase
+from tempfile import NamedTemporaryFile
+from os       import remove, name
+from os.path  import isfile
+from cv2      import VideoWriter, VideoWriter_fourcc
+from numpy    import arange, zeros, uint8
+from numpy.random import RandomState
+from pandas   import DataFrame, concat
+from pandas.testing import assert_frame_equal
+from copy     import copy
+import json
+
+from betrack.commands.exporttracks import *
+from betrack.utils.readers         import read_tracks
+from betrack.utils.writers         import pyarrow, npy_indexes
+
+
+class TestExportTracks(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Create temporary video file..
+        cls._vf         = NamedTemporaryFile(mode='w', suffix='.avi', delete=False)
+        cls._vf.close()
+        codec           = VideoWriter_fourcc('M', 'J', 'P', 'G')
+        cls._frameshape = (200, 300, 3)
+        writer          = VideoWriter(cls._vf.name, codec, 10, cls._frameshape[0:2][::-1])
+        for i in arange(0, 10): writer.write(zeros(cls._frameshape, dtype=uint8))
+        writer.release()
+
+
+    @classmethod
+    def tearDownClass(cls):
+        # Remove temporary file..
+        if name != 'nt': remove(cls._vf.name)
+
+
+    def write_configuration(self, filename, attributes):
+        cf = open(filename, 'w')
+        for a in attributes: cf.write(a + '\n')
+        cf.write('jobs:\n')
+        cf.write('  - video: ' + self._vf.name + '\n')
+        cf.write('    crop-margins: [10, 250, 20, 180]\n')
+        cf.close()
+
+
+    def test_run(self):
+        cf  = NamedTemporaryFile(mode='w', suffix='.yml', delete=False)
+        cf.close()
+        opt = {'--configuration': cf.name}
+
+        # Nothing to convert..
+        self.write_configuration(cf.name, ['tp-exportas: json'])
+        self.assertEqual(ExportTracks(opt).run(), EX_CONFIG)
+
+        # Export trajectories as CSV..
+        self.write_configuration(cf.name, ['tp-exportas: csv'])
+        et  = ExportTracks(opt)
+        et.configure_tracker(cf.name)
+        job = et.jobs[0]
+        job.load_frames()
+        rs  = RandomState(0)
+        job.dflink = DataFrame({'y': rs.uniform(0, 100, 200), 'x': rs.uniform(0, 100, 200),
+                                'mass': rs.uniform(0, 10, 200),
+                                'frame': [i // 20 for i in range(0, 200)],
+                                'particle': [i % 20 for i in range(0, 200)]})
+        job.dflink = job.dflink.set_index('frame', drop=False)
+        et.export_trajectories(job)
+        expected = job.dflink.reset_index(drop=True)
+        with open(job.jsonmeta, 'r') as f: metadata = json.load(f)
+        self.assertEqual(metadata['exportas'], 'csv')
+        self.assertEqual(metadata['offset'], [10, 20])
+        self.assertEqual(metadata['frameshape'], [200, 300, 3])
+        job.release_memory()
+
+        # Convert them from one format to the next one..
+        formats = ['ndjson', 'json', 'hdf', 'npy', 'csv']
+        if pyarrow is not None: formats = ['parquet', 'feather'] + formats
+        previous = 'csv'
+        for exportas in formats:
+            attributes = ['tp-exportas: ' + exportas, 'tp-export-summary: True',
+                          'tp-export-compression: gzip' if exportas == 'ndjson' else '']
+            self.write_configuration(cf.name, attributes)
+            et = ExportTracks(opt)
+            self.assertEqual(et.run(), EX_OK)
+            job = et.jobs[0]
+            self.assertEqual(job.margins, [10, 250, 20, 180])
+            tracks = concat(read_tracks(job.tracks_file(exportas), exportas))
+            # JSON documents round floats to 10 decimal digits..
+            assert_frame_equal(tracks.reset_index(drop=True), expected,
+                               check_exact=False, rtol=0, atol=1e-9)
+            with open(job.jsonmeta, 'r') as f: metadata = json.load(f)
+            self.assertEqual(metadata['exportas'], exportas)
+            self.assertEqual(metadata['offset'], [10, 20])
+            self.assertEqual(metadata['nrows'], 200)
+            self.assertTrue(isfile(job.summary_file(exportas)))
+
+            # The source is removed, so that the metadata select the next source..
+            source = copy(job)
+            source.compression = 'gzip' if previous == 'ndjson' else None
+            remove(source.tracks_file(previous))
+            if isfile(source.summary_file(previous)): remove(source.summary_file(previous))
+            if previous == 'npy':
+                for f in npy_indexes(source.tracks_file(previous)): remove(f)
+            previous = exportas
+
+        # Convert trajectories exported in shards..
+        self.write_configuration(cf.name, ['tp-exportas: ndjson', 'tp-export-shards: 3'])
+        et  = ExportTracks(opt)
+        self.assertEqual(et.run(), EX_OK)
+        job = et.jobs[0]
+        with open(job.shards_file('ndjson'), 'r') as f: manifest = json.load(f)
+        self.assertEqual([s['nrows'] for s in manifest['shards']], [60, 60, 60, 20])
+        remove(job.tracks_file('csv'))
+        remove(job.summary_file('csv'))
+        self.write_configuration(cf.name, ['tp-exportas: csv'])
+        self.assertEqual(ExportTracks(opt).run(), EX_OK)
+        tracks = concat(read_tracks(job.tracks_file('csv'), 'csv'))
+        assert_frame_equal(tracks.reset_index(drop=True), expected,
+                           check_exact=False, rtol=0, atol=1e-9)
+        job.remove_tracks('ndjson')
+        remove(job.summary_file('ndjson'))
+
+        self.write_configuration(cf.name, ['et-importas: avi'])
+        with self.assertRaises(SystemExit) as ctx:
+            ExportTracks(opt).configure_tracker(cf.name)
+        self.assertEqual(ctx.exception.code, EX_CONFIG)
+
+        # Locate and link attributes are neither required nor parsed..
+        self.write_configuration(cf.name, ['tp-exportas: ndjson', 'tp-locate-diameter: 10'])
+        et = ExportTracks(opt)
+        et.configure_tracker(cf.name)
+        self.assertEqual(et.exportas, 'ndjson')
+        self.assertEqual(et.locate_diameter, None)
+
+        remove(job.tracks_file('csv'))
+        remove(job.summary_file('csv'))
+        remove(job.jsonmeta)
+        remove(cf.name)
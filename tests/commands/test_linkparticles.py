@@ -0,0 +1,125 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+Tests for module `betrack.commands.linkparticles`.
+"""
+
+try:
+    from os import EX_OK, EX_CONFIG
+except ImportError:
+    EX_OK     = 0
+    EX_CONFIG = 78
+
+from unittest import TestCase
+from tempfile import NamedTemporaryFile
+from os       import remove, name
+from os.path  import isfile
+from cv2      import VideoWriter, VideoWriter_fourcc
+from numpy    import arange, array, zeros, uint8
+from pandas   import read_csv
+
+from betrack.commands.trackparticles import TrackParticles
+from betrack.commands.linkparticles  import *
+
+class TestLinkParticles(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Create temporary video file..
+        cls._vf         = NamedTemporaryFile(mode='w', suffix='.avi', delete=False)
+        cls._vf.close()
+        cls._nframes    = 10
+        cls._pdiameter  = 11      # Must be odd!
+        cls._nparticles = 5
+        cls._voffset    = 100
+        cls._hoffset    = 10
+        codec           = VideoWriter_fourcc('M', 'J', 'P', 'G')
+        cls._framerate  = cls._nframes
+        cls._frameshape = (1000, 1000, 3)
+        oshape          = cls._frameshape[0:2][::-1]
+        writer          = VideoWriter(cls._vf.name, codec, cls._framerate, oshape)
+
+        for i in arange(0, cls._nframes):
+            f = zeros(cls._frameshape, dtype=uint8)
+            for p in arange(0, cls._nparticles):
+                pr         = int(cls._pdiameter/2)
+                y          = cls._voffset * (p + 1)
+                y          = arange(y - pr, y + pr + 1)
+                x          = cls._voffset + cls._hoffset * (i + 1)
+                x          = arange(x - pr, x + pr + 1)
+                f[y, x, 1] = 255
+            f = array(f)
+            writer.write(f)
+        writer.release()
+
+
+    @classmethod
+    def tearDownClass(cls):
+        # Remove temporary file..
+        if name != 'nt': remove(cls._vf.name)
+
+
+    def write_configuration(self, filename, attributes, margins=None):
+        cf = open(filename, 'w')
+        cf.write('tp-locate-diameter: '  + str(self._pdiameter) + '\n')
+        cf.write('tp-link-searchrange: ' + str(self._hoffset * 2) + '\n')
+        for a in attributes: cf.write(a + '\n')
+        cf.write('jobs:\n')
+        cf.write('  - video: ' + self._vf.name + '\n')
+        cf.write('    period-frame: [2, 8]\n')
+        if margins is not None: cf.write('    crop-margins: ' + margins + '\n')
+        cf.close()
+
+
+    def test_run(self):
+        cf   = NamedTemporaryFile(mode='w', suffix='.yml', delete=False)
+        cf.close()
+        self.write_configuration(cf.name, [])
+        opt  = {'--configuration': cf.name}
+        lp   = LinkParticles(opt)
+        rval = lp.run()
+        self.assertEqual(rval, EX_CONFIG)
+
+        self.write_configuration(cf.name, ['tp-keep-features: True'])
+        tp   = TrackParticles(opt)
+        tp.configure_tracker(opt['--configuration'])
+        job  = tp.jobs[0]
+        job.load_frames()
+        job.preprocess_video()
+        tp.locate_features(job)
+        job.release_memory()
+        self.assertTrue(isfile(job.h5storage))
+
+        self.write_configuration(cf.name, ['tp-link-memory: 2',
+                                           'tp-filter-st-threshold: 3'])
+        lp   = LinkParticles(opt)
+        rval = lp.run()
+        self.assertEqual(rval, EX_OK)
+        job  = lp.jobs[0]
+        self.assertEqual(job.period, [2, 8])
+        self.assertTrue(isfile(job.h5storage))
+        self.assertFalse(isfile(job.h5linked))
+        self.assertEqual(len(read_csv(job.csvtracks)), 6 * self._nparticles)
+        remove(job.csvtracks)
+        remove(job.csvsummary)
+        remove(job.jsonmeta)
+
+        self.write_configuration(cf.name, [], margins='[0, 900, 0, 900]')
+        lp   = LinkParticles(opt)
+        rval = lp.run()
+        self.assertEqual(rval, EX_CONFIG)
+
+        # Features kept in memory cannot be linked again..
+        self.write_configuration(cf.name, ['tp-feature-store: memory'])
+        with self.assertRaises(SystemExit) as cm:
+            LinkParticles(opt).configure_tracker(cf.name)
+        self.assertEqual(cm.exception.code, EX_CONFIG)
+        lp   = LinkParticles(opt)
+        lp.featurestore = 'memory'
+        with self.assertRaises(ValueError):
+            lp.load_features(job)
+        remove(job.h5storage)
+        remove(cf.name)
@@ -19,8 +19,26 @@ from os       import remove, name
 from os.path  import isfile, dirname, realpath
 from cv2      import VideoWriter, VideoWriter_fourcc
 from numpy    import arange, array, zeros, uint8
+from pandas   import read_csv
 
 from betrack.commands.trackparticles import *
+import betrack.commands.trackparticles as trackparticles
+from betrack.utils.checkpoint         import ResumableLinker
+from betrack.utils.featurestore       import store_exists
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptedLinker(ResumableLinker):
+    # Raises an exception when asked to link frame `interrupt`..
+    interrupt = None
+
+    def link(self, df):
+        if df['frame'].iloc[0] == self.interrupt: raise Interrupted()
+        return super(InterruptedLinker, self).link(df)
+
 
 class TestTrackParticles(TestCase):
 
@@ -78,6 +96,27 @@ class TestTrackParticles(TestCase):
         self.assertEqual(cm.exception.code, EX_CONFIG)
         remove(cf.name)
 
+        cf  = NamedTemporaryFile(mode='w', suffix='.yml', delete=False)
+        cf.write('tp-feature-store: excel')
+        cf.close()
+        opt = {'--configuration': cf.name}
+        tp  = TrackParticles(opt)
+        with self.assertRaises(SystemExit) as cm:
+            tp.configure_tracker(opt['--configuration'])
+        self.assertEqual(cm.exception.code, EX_CONFIG)
+        remove(cf.name)
+
+        cf  = NamedTemporaryFile(mode='w', suffix='.yml', delete=False)
+        cf.write('tp-feature-store: memory\n')
+        cf.write('tp-keep-features: True')
+        cf.close()
+        opt = {'--configuration': cf.name}
+        tp  = TrackParticles(opt)
+        with self.assertRaises(SystemExit) as cm:
+            tp.configure_tracker(opt['--configuration'])
+        self.assertEqual(cm.exception.code, EX_CONFIG)
+        remove(cf.name)
+
         cf  = NamedTemporaryFile(mode='w', suffix='.yml', delete=False)
         cf.write('tp-locate-diameter: 12')
         cf.close()
@@ -331,6 +370,7 @@ class TestTrackParticles(TestCase):
         cf  = NamedTemporaryFile(mode='w', suffix='.yml', delete=False)
         cf.write('tp-locate-diameter: '  + str(self._pdiameter) + '\n')
         cf.write('tp-link-searchrange: ' + str(self._hoffset) * 2 + '\n')
+        cf.write('tp-cache: False\n')
         cf.write('jobs:\n')
         cf.write('  - video: ' + self._vf.name + '\n')
         cf.close()
@@ -348,8 +388,12 @@ class TestTrackParticles(TestCase):
 
         with trackpy.PandasHDFStoreBig(tp.jobs[0].h5storage) as sf:
             res = sf.dump()
+            md  = sf.store.root._v_attrs.betrack
         self.assertEqual(res.shape, (self._nframes * self._nparticles, 9))            
+        self.assertEqual(md['period'], [0, self._nframes])
+        self.assertEqual(md['locate']['tp-locate-diameter'], self._pdiameter)
         tp.jobs[0].release_memory()          
+        self.assertFalse(isfile(tp.jobs[0].h5storage))
         remove(cf.name)
 
         
@@ -368,17 +412,247 @@ class TestTrackParticles(TestCase):
         tp.locate_features(tp.jobs[0])
         tp.link_trajectories(tp.jobs[0])
         
-        self.assertTrue(isfile(tp.jobs[0].h5storage))
-        self.assertEqual(dirname(realpath(tp.jobs[0].h5storage)),
+        self.assertTrue(isfile(tp.jobs[0].h5linked))
+        self.assertEqual(dirname(realpath(tp.jobs[0].h5linked)),
                          dirname(realpath(self._vf.name)))
 
         with trackpy.PandasHDFStoreBig(tp.jobs[0].h5storage) as sf:
             res = sf.dump()
+        self.assertEqual(res.shape, (self._nframes * self._nparticles, 9))            
+        with trackpy.PandasHDFStoreBig(tp.jobs[0].h5linked) as sf:
+            res = sf.dump()
         self.assertEqual(res.shape, (self._nframes * self._nparticles, 10))            
         self.assertEqual(tp.jobs[0].dflink.shape, (self._nframes * self._nparticles, 10))
-        tp.jobs[0].release_memory()          
+
+        # Stubs are dropped while linking..
+        tp.filter_stubs_threshold = self._nframes
+        tp.link_trajectories(tp.jobs[0])
+        self.assertEqual(tp.jobs[0].dflink.shape, (self._nframes * self._nparticles, 10))
+        tp.filter_stubs_threshold = self._nframes + 1
+        tp.link_trajectories(tp.jobs[0])
+        self.assertEqual(len(tp.jobs[0].dflink), 0)
+
+        # Final frames are exported while linking..
+        job                       = tp.jobs[0]
+        job.margins               = [5, 900, 10, 900]
+        tp.filter_stubs_threshold = 2
+        tp.link_memory            = 1
+        tp.exportprogressive      = 2
+        for exportas in ['csv', 'ndjson']:
+            tp.exportas = exportas
+            tp.link_trajectories(job)
+            with open(job.tracks_file(exportas), 'r') as f: progressive = f.read()
+            tp.export_trajectories(job)
+            with open(job.tracks_file(exportas), 'r') as f: self.assertEqual(f.read(), progressive)
+            self.assertEqual(len(job.dflink), self._nframes * self._nparticles)
+            remove(job.tracks_file(exportas))
+            remove(job.summary_file(exportas))
+        remove(job.jsonmeta)
+        job.release_memory()
+        remove(cf.name)
+
+
+    def test_resume(self):
+        cf  = NamedTemporaryFile(mode='w', suffix='.yml', delete=False)
+        cf.write('tp-locate-diameter: '  + str(self._pdiameter) + '\n')
+        cf.write('tp-link-searchrange: ' + str(self._hoffset * 2) + '\n')
+        cf.write('tp-link-memory: 1\n')
+        cf.write('tp-checkpoint: 3\n')
+        cf.write('jobs:\n')
+        cf.write('  - video: ' + self._vf.name + '\n')
+        cf.close()
+
+        # Reference run..
+        tp  = TrackParticles({'--configuration': cf.name})
+        tp.configure_tracker(cf.name)
+        job = tp.jobs[0]
+        job.load_frames()
+        job.preprocess_video()
+        tp.locate_features(job)
+        tp.link_trajectories(job)
+        reference = job.dflink
+        
+        # Interrupt locating at frame 7 and resume from frame 6..
+        locate    = tp.locate
+        located   = []
+        def interrupted(frame):
+            if len(located) == 7: raise Interrupted()
+            located.append(frame)
+            return locate(frame)
+        tp.locate = interrupted
+        with self.assertRaises(Interrupted):
+            tp.locate_features(job)
+        tp.resume = True
+        tp.locate = locate
+        self.assertEqual(tp.resume_features(job, tp.features_metadata(job)), 6)
+        tp.locate_features(job)
+        with trackpy.PandasHDFStoreBig(job.h5storage) as sf:
+            self.assertEqual(sf.frames, list(range(0, self._nframes)))
+            self.assertFalse('betrack_checkpoint' in sf.store.root._v_attrs)
+        self.assertEqual(tp.resume_features(job, tp.features_metadata(job)),
+                         self._nframes)
+
+        # Interrupt linking at frame 7 and resume from frame 6..
+        tp.linker = lambda: InterruptedLinker(tp.link_searchrange, memory=tp.link_memory)
+        InterruptedLinker.interrupt = 7
+        tp.exportprogressive        = 2
+        with self.assertRaises(Interrupted):
+            tp.link_trajectories(job)
+        self.assertTrue(isfile(job.ckptlinked))
+
+        # Checkpoints of features located with other attributes are discarded..
+        InterruptedLinker.interrupt = 1
+        tp.locate_compact           = True
+        with self.assertRaises(Interrupted):
+            tp.link_trajectories(job)
+        self.assertFalse(isfile(job.ckptlinked))
+        tp.locate_compact           = False
+        InterruptedLinker.interrupt = 7
+        with self.assertRaises(Interrupted):
+            tp.link_trajectories(job)
+        InterruptedLinker.interrupt = None
+        tp.link_trajectories(job)
+        self.assertFalse(isfile(job.ckptlinked))
+        self.assertTrue(job.dflink.equals(reference))
+
+        # Frames linked before resuming are exported again..
+        with open(job.csvtracks, 'r') as f: progressive = f.read()
+        tp.export_trajectories(job)
+        with open(job.csvtracks, 'r') as f: self.assertEqual(f.read(), progressive)
+        remove(job.csvtracks)
+        remove(job.csvsummary)
+        remove(job.jsonmeta)
+        job.release_memory()
+
+        # Features kept in memory are never checkpointed..
+        tp.featurestore = 'memory'
+        job.set_feature_store('memory')
+        tp.resume       = False
+        job.load_frames()
+        job.preprocess_video()
+        tp.locate_features(job)
+        InterruptedLinker.interrupt = 7
+        with self.assertRaises(Interrupted):
+            tp.link_trajectories(job)
+        InterruptedLinker.interrupt = None
+        self.assertFalse(isfile(job.ckptlinked))
+        job.release_memory()
+        remove(cf.name)
+
+
+    def test_compact(self):
+        cf  = NamedTemporaryFile(mode='w', suffix='.yml', delete=False)
+        cf.write('tp-locate-diameter: '  + str(self._pdiameter) + '\n')
+        cf.write('tp-locate-compact: True\n')
+        cf.write('tp-locate-columns: [size]\n')
+        cf.write('tp-link-searchrange: ' + str(self._hoffset * 2) + '\n')
+        cf.write('tp-filter-cl-threshold: 200\n')
+        cf.write('tp-cache: False\n')
+        cf.write('jobs:\n')
+        cf.write('  - video: ' + self._vf.name + '\n')
+        cf.close()
+        tp  = TrackParticles({'--configuration': cf.name})
+        tp.configure_tracker(cf.name)
+        self.assertEqual(tp.locate_columns, ['size'])
+        job = tp.jobs[0]
+        job.load_frames()
+        job.preprocess_video()
+        tp.locate_features(job)
+        tp.link_trajectories(job)
+        tp.filter_trajectories(job)
+        self.assertEqual(list(job.dflink.columns), ['y', 'x', 'size', 'frame', 'particle'])
+        self.assertEqual([str(d) for d in job.dflink.dtypes],
+                         ['float32'] * 3 + ['int32'] * 2)
+        self.assertEqual(len(job.dflink), self._nframes * self._nparticles)
+        self.assertEqual(job.dflink['particle'].nunique(), self._nparticles)
+        job.release_memory()
         remove(cf.name)
 
+        for attrs in [['tp-locate-columns: [size, area]'],
+                      ['tp-locate-columns: [mass]', 'tp-filter-cl-quantile: 0.5']]:
+            cf  = NamedTemporaryFile(mode='w', suffix='.yml', delete=False)
+            cf.write('tp-locate-diameter: '  + str(self._pdiameter) + '\n')
+            for attr in attrs: cf.write(attr + '\n')
+            cf.close()
+            tp  = TrackParticles({'--configuration': cf.name})
+            with self.assertRaises(SystemExit) as cm:
+                tp.configure_tracker(cf.name)
+            self.assertEqual(cm.exception.code, EX_CONFIG)
+            remove(cf.name)
+
+    
+    def test_feature_store(self):
+        linked = {}
+        for store in ['hdf', 'memory', 'columnar']:
+            cf  = NamedTemporaryFile(mode='w', suffix='.yml', delete=False)
+            cf.write('tp-locate-diameter: '  + str(self._pdiameter) + '\n')
+            cf.write('tp-link-searchrange: ' + str(self._hoffset * 2) + '\n')
+            cf.write('tp-feature-store: '    + store + '\n')
+            cf.write('tp-cache: False\n')
+            cf.write('jobs:\n')
+            cf.write('  - video: ' + self._vf.name + '\n')
+            cf.close()
+            tp  = TrackParticles({'--configuration': cf.name})
+            tp.configure_tracker(cf.name)
+            job = tp.jobs[0]
+            self.assertEqual(tp.featurestore, store)
+            self.assertEqual(job.tempfiles[0:2], [job.h5storage, job.h5linked])
+            job.load_frames()
+            job.preprocess_video()
+            tp.locate_features(job)
+            tp.link_trajectories(job)
+            self.assertTrue(store_exists(job.h5linked))
+            linked[store] = job.dflink.reset_index(drop=True)
+            job.release_memory()
+            self.assertFalse(store_exists(job.h5storage))
+            self.assertFalse(store_exists(job.h5linked))
+            remove(cf.name)
+
+        for store in ['memory', 'columnar']:
+            self.assertTrue(linked[store].equals(linked['hdf']))
+
+
+    def test_out_of_core(self):
+        for exportas in ['csv', 'hdf', 'json', 'ndjson']:
+            outputs = []
+            # Out of core, the video is also rendered in segments..
+            for attrs in [[], ['tp-out-of-core: True', 'tp-chunk-size: 3',
+                               'av-nsegments: 3']]:
+                cf  = NamedTemporaryFile(mode='w', suffix='.yml', delete=False)
+                cf.write('tp-locate-diameter: '     + str(self._pdiameter) + '\n')
+                cf.write('tp-link-searchrange: '    + str(self._hoffset * 2) + '\n')
+                cf.write('tp-filter-st-threshold: ' + str(int(self._nframes / 2)) + '\n')
+                cf.write('tp-exportas: '            + exportas + '\n')
+                cf.write('tp-cache: False\n')
+                for attr in attrs: cf.write(attr + '\n')
+                cf.write('jobs:\n')
+                cf.write('  - video: ' + self._vf.name + '\n')
+                cf.write('    crop-margins: [50, 900, 50, 900]\n')
+                cf.close()
+                tp  = TrackParticles({'--configuration': cf.name})
+                tp.configure_tracker(cf.name)
+                self.assertEqual(tp.jobs[0].chunksize, 3 if len(attrs) > 0 else None)
+                self.assertEqual(tp.run(), EX_OK)
+                job = tp.jobs[0]
+                if exportas == 'hdf': tracks = pandas.read_hdf(job.h5tracks, 'dflink')
+                else:
+                    with open(job.tracks_file(exportas), 'rb') as f: tracks = f.read()
+                with open(job.avitracked, 'rb') as f: video = f.read()
+                outputs.append((tracks, video, read_csv(job.csvsummary)
+                                if exportas == 'csv' else None))
+                remove(job.tracks_file(exportas))
+                remove(job.summary_file(exportas))
+                remove(job.jsonmeta)
+                remove(job.avitracked)
+                remove(cf.name)
+
+            self.assertEqual(outputs[0][1], outputs[1][1])
+            if exportas == 'hdf': self.assertTrue(outputs[0][0].equals(outputs[1][0]))
+            else:                 self.assertEqual(outputs[0][0], outputs[1][0])
+            if exportas == 'csv':
+                self.assertEqual(len(outputs[0][2]), self._nparticles)
+                pandas.testing.assert_frame_equal(outputs[0][2], outputs[1][2])
+
         
     def test_filter_trajectories(self):
         cf  = NamedTemporaryFile(mode='w', suffix='.yml', delete=False)
@@ -402,6 +676,150 @@ class TestTrackParticles(TestCase):
         tp.jobs[0].release_memory()          
         remove(cf.name)
         
+    def test_sweep_trajectories(self):
+        cf  = NamedTemporaryFile(mode='w', suffix='.yml', delete=False)
+        cf.write('tp-locate-diameter: '     + str(self._pdiameter) + '\n')
+        cf.write('tp-link-searchrange: [2, ' + str(self._hoffset * 2) + ']\n')
+        cf.write('tp-filter-st-threshold: [1, ' + str(self._nframes + 1) + ']\n')
+        cf.write('tp-locate-columns: [mass, size]\n')
+        cf.write('tp-nprocesses: 2\n')
+        cf.write('tp-cache: False\n')
+        cf.write('jobs:\n')
+        cf.write('  - video: ' + self._vf.name + '\n')
+        cf.close()
+        opt = {'--configuration': cf.name}
+        tp  = TrackParticles(opt)
+        tp.configure_tracker(opt['--configuration'])
+        self.assertEqual(len(tp.sweep), 4)
+        self.assertEqual(tp.sweep[3].link_searchrange, self._hoffset * 2)
+        self.assertEqual(tp.sweep[3].filter_stubs_threshold, self._nframes + 1)
+        self.assertEqual(tp.sweep[3].locate_columns, ['mass', 'size'])
+
+        job = tp.jobs[0]
+        job.load_frames()
+        job.preprocess_video()
+        tp.locate_features(job)
+        tp.sweep_trajectories(job)
+
+        self.assertTrue(isfile(job.h5storage))
+        self.assertTrue(isfile(job.csvsweep))
+        nrows = [self._nframes * self._nparticles, 0] * 2
+        ntracks = [self._nframes * self._nparticles, 0, self._nparticles, 0]
+        for i in range(0, 4):
+            variant = job.variant('-v' + str(i + 1))
+            self.assertFalse(isfile(variant.h5linked))
+            self.assertEqual(len(pandas.read_csv(variant.csvtracks)), nrows[i])
+            self.assertEqual(len(pandas.read_csv(variant.csvsummary)), ntracks[i])
+            remove(variant.csvtracks)
+            remove(variant.csvsummary)
+            remove(variant.jsonmeta)
+        job.release_memory()
+        self.assertFalse(isfile(job.h5storage))
+        remove(job.csvsweep)
+        remove(cf.name)
+
+        # Variants of features kept in memory are not sent to worker processes..
+        cf  = NamedTemporaryFile(mode='w', suffix='.yml', delete=False)
+        cf.write('tp-locate-diameter: '     + str(self._pdiameter) + '\n')
+        cf.write('tp-link-searchrange: [2, ' + str(self._hoffset * 2) + ']\n')
+        cf.write('tp-feature-store: memory\n')
+        cf.write('tp-nprocesses: 2\n')
+        cf.write('jobs:\n')
+        cf.write('  - video: ' + self._vf.name + '\n')
+        cf.close()
+        tp  = TrackParticles({'--configuration': cf.name})
+        tp.configure_tracker(cf.name)
+        job = tp.jobs[0]
+        job.load_frames()
+        job.preprocess_video()
+        tp.locate_features(job)
+        pool = trackparticles.Pool
+        trackparticles.Pool = None
+        try:
+            tp.sweep_trajectories(job)
+        finally:
+            trackparticles.Pool = pool
+        for i in range(0, 2):
+            variant = job.variant('-v' + str(i + 1))
+            self.assertEqual(len(pandas.read_csv(variant.csvtracks)),
+                             self._nframes * self._nparticles)
+            remove(variant.csvtracks)
+            remove(variant.csvsummary)
+            remove(variant.jsonmeta)
+        job.release_memory()
+        self.assertFalse(store_exists(job.h5storage))
+        remove(job.csvsweep)
+        remove(cf.name)
+
+
+    def test_run_uncached(self):
+        cf = NamedTemporaryFile(mode='w', suffix='.yml', delete=False)
+        cf.write('tp-locate-diameter: '  + str(self._pdiameter) + '\n')
+        cf.write('tp-link-searchrange: ' + str(self._hoffset * 2) + '\n')
+        cf.write('jobs:\n')
+        cf.write('  - video: ' + self._vf.name + '\n')
+        cf.close()
+
+        # Without filters, trajectories are exported from the linked store..
+        tp = TrackParticles({'--configuration': cf.name})
+        tp.configure_tracker(cf.name)
+        self.assertEqual([s.name for s, d, r in tp.plan(tp.jobs[0])],
+                         ['locate', 'link', 'export', 'annotate'])
+        self.assertEqual(tp.run(), EX_OK)
+        job = tp.jobs[0]
+        self.assertEqual(len(read_csv(job.csvtracks)), self._nframes * self._nparticles)
+
+        # Intermediate artifacts are removed by default..
+        for f in [job.h5storage, job.h5linked, job.h5filtered, job.jsonmanifest]:
+            self.assertFalse(isfile(f))
+        for f in [job.csvtracks, job.csvsummary, job.avitracked, job.jsonmeta]: remove(f)
+        remove(cf.name)
+
+
+    def test_sweep_cached(self):
+        def write_configuration(searchrange):
+            cf = NamedTemporaryFile(mode='w', suffix='.yml', delete=False)
+            cf.write('tp-locate-diameter: '     + str(self._pdiameter) + '\n')
+            cf.write('tp-link-searchrange: [2, ' + str(searchrange) + ']\n')
+            cf.write('tp-nprocesses: 1\n')
+            cf.write('tp-cache: True\n')
+            cf.write('jobs:\n')
+            cf.write('  - video: ' + self._vf.name + '\n')
+            cf.close()
+            return cf.name
+
+        def stages(tp):
+            return [s.name for s, d, r in tp.plan(tp.jobs[0]) if r is not None]
+
+        # First run locates and sweeps..
+        cf = write_configuration(self._hoffset * 2)
+        tp = TrackParticles({'--configuration': cf})
+        tp.configure_tracker(cf)
+        self.assertEqual(stages(tp), ['locate', 'sweep'])
+        self.assertEqual(tp.run(), EX_OK)
+        job = tp.jobs[0]
+        self.assertEqual(list(pandas.read_csv(job.csvsweep)['tp-link-searchrange']),
+                         [2, self._hoffset * 2])
+        tp = TrackParticles({'--configuration': cf})
+        tp.configure_tracker(cf)
+        self.assertEqual(stages(tp), [])
+        remove(cf)
+
+        # Changing a swept value sweeps again..
+        cf = write_configuration(self._hoffset * 3)
+        tp = TrackParticles({'--configuration': cf})
+        tp.configure_tracker(cf)
+        self.assertEqual(stages(tp), ['sweep'])
+        self.assertEqual(tp.run(), EX_OK)
+        self.assertEqual(list(pandas.read_csv(job.csvsweep)['tp-link-searchrange']),
+                         [2, self._hoffset * 3])
+        for i in range(0, 2):
+            variant = job.variant('-v' + str(i + 1))
+            for f in [variant.csvtracks, variant.csvsummary, variant.jsonmeta]: remove(f)
+        for f in [job.h5storage, job.csvsweep, job.jsonmanifest]: remove(f)
+        remove(cf)
+
+        
     def test_export_video(self):
         cf  = NamedTemporaryFile(mode='w', suffix='.yml', delete=False)
         cf.write('tp-locate-diameter: '     + str(self._pdiameter) + '\n')
@@ -421,6 +839,17 @@ class TestTrackParticles(TestCase):
         self.assertTrue(isfile(tp.jobs[0].avitracked))
         self.assertEqual(dirname(realpath(tp.jobs[0].avitracked)),
                          dirname(realpath(self._vf.name)))
+
+        # Frames drawn by one thread or more are written identically..
+        with open(tp.jobs[0].avitracked, 'rb') as f: video = f.read()
+        with open(cf.name, 'a') as f: f.write('av-nthreads: 1\n')
+        tp.export_video(tp.jobs[0])
+        with open(tp.jobs[0].avitracked, 'rb') as f: self.assertEqual(f.read(), video)
+
+        # Frames rendered in segments are concatenated identically..
+        with open(cf.name, 'a') as f: f.write('av-nsegments: 3\n')
+        tp.export_video(tp.jobs[0])
+        with open(tp.jobs[0].avitracked, 'rb') as f: self.assertEqual(f.read(), video)
         tp.jobs[0].release_memory()
         remove(tp.jobs[0].avitracked)
         remove(cf.name)
@@ -445,6 +874,9 @@ class TestTrackParticles(TestCase):
         self.assertEqual(rval, EX_OK)
         remove(cf.name)
         remove(tp.jobs[0].avitracked)
+        for f in [tp.jobs[0].h5storage, tp.jobs[0].h5linked, tp.jobs[0].h5filtered,
+                  tp.jobs[0].jsonmanifest, tp.jobs[0].csvsummary]:
+            if isfile(f): remove(f)
 
         cf  = NamedTemporaryFile(mode='w', suffix='.yml', delete=False)
         cf.write('tp-locate-diameter: '     + str(self._pdiameter) + '\n')
@@ -461,3 +893,92 @@ class TestTrackParticles(TestCase):
         self.assertEqual(rval, EX_CONFIG)
         remove(cf.name)
         
+
+
+    def test_run_cached(self):
+        def write_configuration(searchrange, store='hdf', shards=None):
+            cf = NamedTemporaryFile(mode='w', suffix='.yml', delete=False)
+            cf.write('tp-locate-diameter: '     + str(self._pdiameter) + '\n')
+            cf.write('tp-link-searchrange: '    + str(searchrange) + '\n')
+            cf.write('tp-filter-st-threshold: ' + str(int(self._nframes / 2)) + '\n')
+            cf.write('tp-feature-store: '       + store + '\n')
+            cf.write('tp-exportas: csv\n')
+            if shards is not None: cf.write('tp-export-shards: ' + str(shards) + '\n')
+            cf.write('tp-cache: True\n')
+            cf.write('jobs:\n')
+            cf.write('  - video: ' + self._vf.name + '\n')
+            cf.close()
+            return cf.name
+
+        def stages(tp):
+            return [s.name for s, d, r in tp.plan(tp.jobs[0]) if r is not None]
+
+        # First run executes all stages..
+        cf = write_configuration(self._hoffset * 2)
+        tp = TrackParticles({'--configuration': cf})
+        tp.configure_tracker(cf)
+        self.assertEqual(stages(tp), ['locate', 'link', 'filter', 'export', 'annotate'])
+        self.assertEqual(tp.run(), EX_OK)
+        job = tp.jobs[0]
+        for f in [job.h5storage, job.h5linked, job.h5filtered, job.csvtracks,
+                  job.csvsummary, job.avitracked, job.jsonmanifest]:
+            self.assertTrue(isfile(f))
+        tracks = read_csv(job.csvtracks)
+
+        # Second run is up to date..
+        tp = TrackParticles({'--configuration': cf})
+        tp.configure_tracker(cf)
+        self.assertEqual(stages(tp), [])
+        self.assertEqual(tp.run(), EX_OK)
+
+        # Missing artifacts are rebuilt..
+        remove(job.csvtracks)
+        self.assertEqual(stages(tp), ['export'])
+        self.assertEqual(tp.run(), EX_OK)
+        self.assertTrue(read_csv(job.csvtracks).equals(tracks))
+
+        # Trajectories exported in shards are up to date as well..
+        remove(job.csvtracks)
+        cf = write_configuration(self._hoffset * 2, shards=5)
+        tp = TrackParticles({'--configuration': cf})
+        tp.configure_tracker(cf)
+        self.assertEqual(stages(tp), ['export'])
+        self.assertEqual(tp.run(), EX_OK)
+        self.assertTrue(isfile(job.shards_file('csv')))
+        self.assertFalse(isfile(job.csvtracks))
+        tp = TrackParticles({'--configuration': cf})
+        tp.configure_tracker(cf)
+        self.assertEqual(stages(tp), [])
+        remove(cf)
+        cf = write_configuration(self._hoffset * 2)
+
+        # Forced and dry runs..
+        tp = TrackParticles({'--configuration': cf, '--force': True})
+        tp.configure_tracker(cf)
+        self.assertEqual(len(stages(tp)), 5)
+        tp = TrackParticles({'--configuration': cf, '--dry-run': True})
+        tp.configure_tracker(cf)
+        remove(job.avitracked)
+        self.assertEqual(tp.run(), EX_OK)
+        self.assertFalse(isfile(job.avitracked))
+        remove(cf)
+
+        # Changing a link attribute invalidates the following stages..
+        cf = write_configuration(self._hoffset * 2 + 1)
+        tp = TrackParticles({'--configuration': cf})
+        tp.configure_tracker(cf)
+        self.assertEqual(stages(tp), ['link', 'filter', 'export', 'annotate'])
+        self.assertEqual(tp.run(), EX_OK)
+        self.assertEqual(len(read_csv(job.csvtracks)), len(tracks))
+        remove(cf)
+
+        # Changing the feature store invalidates all stages..
+        cf = write_configuration(self._hoffset * 2 + 1, 'memory')
+        tp = TrackParticles({'--configuration': cf})
+        tp.configure_tracker(cf)
+        self.assertEqual(stages(tp), ['locate', 'link', 'filter', 'export', 'annotate'])
+        self.assertEqual(tp.plan(tp.jobs[0])[0][2], 'configuration changed')
+        for f in [job.h5storage, job.h5linked, job.h5filtered, job.csvtracks,
+                  job.csvsummary, job.avitracked, job.jsonmanifest]:
+            remove(f)
+        remove(cf)
@@ -0,0 +1,52 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+Tests for module `betrack.utils.avi`.
+"""
+
+from unittest import TestCase
+from tempfile import NamedTemporaryFile
+from os       import remove
+from cv2      import (VideoWriter, VideoWriter_fourcc, VideoCapture, CAP_PROP_FRAME_COUNT,
+                      CAP_OPENCV_MJPEG)
+from numpy    import uint8
+from numpy.random import RandomState
+
+from betrack.utils.avi import *
+
+
+class TestAvi(TestCase):
+
+    def write_video(self, frames):
+        vf     = NamedTemporaryFile(suffix='.avi', delete=False)
+        vf.close()
+        writer = VideoWriter(vf.name, CAP_OPENCV_MJPEG, VideoWriter_fourcc('M', 'J', 'P', 'G'), 25,
+                             (83, 61))
+        for f in frames: writer.write(f)
+        writer.release()
+        return vf.name
+
+
+    def test_concat_avi(self):
+        rs     = RandomState(0)
+        frames = [(rs.randint(0, 256, (61, 83, 3)) * (i % 3 > 0)).astype(uint8)
+                  for i in range(0, 20)]
+        video  = self.write_video(frames)
+        with open(video, 'rb') as f: expected = f.read()
+
+        # Segments are concatenated as the video written at once..
+        bounds   = [0, 1, 8, 15, 20]
+        segments = [self.write_video(frames[a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
+        for parts in [segments, [video]]:
+            self.assertEqual(concat_avi(parts, video), 20)
+            with open(video, 'rb') as f: self.assertEqual(f.read(), expected)
+        self.assertEqual(VideoCapture(video).get(CAP_PROP_FRAME_COUNT), 20)
+
+        # Other files are rejected..
+        with open(segments[0], 'wb') as f: f.write(b'RIFF\x04\x00\x00\x00WAVE')
+        with self.assertRaises(ValueError): concat_avi(segments, video)
+
+        for f in segments + [video]: remove(f)
@@ -0,0 +1,66 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+Tests for module `betrack.utils.checkpoint`.
+"""
+
+from unittest import TestCase
+from tempfile import NamedTemporaryFile
+from os       import remove
+from os.path  import isfile
+from numpy    import arange
+from numpy.random import RandomState
+import pandas
+import trackpy
+
+from betrack.utils.checkpoint import *
+
+
+class TestCheckpoint(TestCase):
+
+    def setUp(self):
+        rs  = RandomState(0)
+        pos = rs.uniform(0, 100, (20, 2))
+        self._frames = []
+        for t in arange(0, 30):
+            pos  = pos + rs.normal(0.5, 1, pos.shape)
+            keep = rs.uniform(size=20) > 0.1
+            self._frames.append(pandas.DataFrame({'y': pos[keep, 0], 'x': pos[keep, 1],
+                                                  'frame': t}))
+
+
+    def test_resumable_linker(self):
+        trackpy.quiet()
+        for predict in [False, True]:
+            if predict: tp = trackpy.predict.NearestVelocityPredict()
+            else:       tp = trackpy
+            reference = pandas.concat(tp.link_df_iter(iter(self._frames), search_range=5,
+                                                      memory=2))
+
+            f = NamedTemporaryFile(mode='w', suffix='.ckpt', delete=False)
+            f.close()
+            linker = ResumableLinker(5, memory=2, predict=predict)
+            linked = [linker.link(df) for df in self._frames[0:15]]
+            save_checkpoint(f.name, linker)
+            del linker
+            trackpy.linking.linking.TrackUnstored.reset_counter()
+            linker  = load_checkpoint(f.name)
+            linked += [linker.link(df) for df in self._frames[15:]]
+            linked  = pandas.concat(linked)
+            self.assertTrue((linked.particle.values == reference.particle.values).all())
+            remove(f.name)
+
+
+    def test_checkpoint(self):
+        f = NamedTemporaryFile(mode='w', suffix='.ckpt', delete=False)
+        f.write('invalid')
+        f.close()
+        self.assertIsNone(load_checkpoint(f.name))
+        save_checkpoint(f.name, dict(frame=10))
+        self.assertEqual(load_checkpoint(f.name), dict(frame=10))
+        self.assertFalse(isfile(f.name + '.tmp'))
+        remove(f.name)
+        self.assertIsNone(load_checkpoint(f.name))
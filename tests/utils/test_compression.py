@@ -0,0 +1,60 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+Tests for module `betrack.utils.compression`.
+"""
+
+from unittest import TestCase
+from tempfile import mkdtemp
+from os.path  import join, getsize
+from shutil   import rmtree
+from numpy.random import RandomState
+import gzip
+import pandas
+
+from betrack.utils.compression import *
+from betrack.utils.writers     import write_csv
+
+
+class TestCompression(TestCase):
+
+    def setUp(self):
+        self._dir = mkdtemp()
+        rs        = RandomState(0)
+        self._df  = pandas.DataFrame(rs.uniform(0, 100, (5000, 2)), columns=['y', 'x'])
+        self._df['frame'] = [i // 10 for i in range(0, 5000)]
+
+    def tearDown(self):
+        rmtree(self._dir)
+
+
+    def test_compressed_file(self):
+        text = self._df.to_csv(None)
+        for compression in COMPRESSIONS:
+            if not compression_available(compression): continue
+            name = join(self._dir, 'tracks.csv' + COMPRESSIONS[compression])
+            for nthreads in [1, 3]:
+                # Several blocks, each compressed on its own..
+                with CompressedFile(name, compression, nthreads=nthreads,
+                                    blocksize=10000) as f:
+                    for i in range(0, len(text), 3000): f.write(text[i:i + 3000])
+                self.assertEqual(f.rawbytes, len(text))
+                self.assertEqual(f.bytes, getsize(name))
+                self.assertTrue(f.bytes < f.rawbytes)
+                if compression == 'lz4':
+                    with lz4.frame.open(name, 'rt') as r: self.assertEqual(r.read(), text)
+                    continue
+                self.assertTrue(pandas.read_csv(name, index_col=0,
+                                                float_precision='round_trip').equals(self._df))
+
+        name = join(self._dir, 'tracks.csv.gz')
+        with open_output(name, 'gzip', nthreads=2) as f:
+            self.assertEqual(write_csv(f, [self._df.iloc[:2000], self._df.iloc[2000:]]), 5000)
+        with gzip.open(name, 'rt') as f: self.assertEqual(f.read(), text)
+
+        with CompressedFile(name, 'gzip') as f: pass
+        with gzip.open(name, 'rt') as f: self.assertEqual(f.read(), '')
+        self.assertTrue(compression_available('gzip'))
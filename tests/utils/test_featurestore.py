@@ -0,0 +1,94 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+Tests for module `betrack.utils.featurestore`.
+"""
+
+from unittest import TestCase
+from tempfile import mkdtemp
+from os.path  import join
+from shutil   import rmtree
+from numpy    import arange
+import pandas
+
+from betrack.utils.featurestore import *
+
+
+class TestFeatureStore(TestCase):
+
+    def setUp(self):
+        self._dir    = mkdtemp()
+        self._frames = [pandas.DataFrame({'y': arange(0, n) + 0.5, 'x': arange(0, n) * 2.0,
+                                          'frame': t})
+                        for t, n in [(0, 3), (2, 1), (5, 4)]]
+
+    def tearDown(self):
+        rmtree(self._dir)
+
+
+    def test_stores(self):
+        for kind in STORES:
+            name = join(self._dir, 'features' + EXTENSIONS[kind])
+            with self.assertRaises(IOError):
+                open_store(name, kind, mode='r')
+            self.assertFalse(store_exists(name))
+
+            with open_store(name, kind, mode='w') as fs:
+                for df in self._frames: fs.put(df)
+                fs.set_attr('betrack', dict(period=(0, 6)))
+                fs.set_attr('other', 1)
+                fs.del_attr('other')
+            self.assertTrue(store_exists(name))
+            self.assertTrue(store_exists(name, kind))
+
+            with open_store(name, kind, mode='r') as fs:
+                self.assertEqual(fs.frames, [0, 2, 5])
+                self.assertEqual(fs.get_attr('betrack'), dict(period=(0, 6)))
+                self.assertIsNone(fs.get_attr('other'))
+                df = fs.get(5)
+                self.assertEqual(list(df.x), [0.0, 2.0, 4.0, 6.0])
+                self.assertEqual(len(list(fs)), 3)
+                self.assertEqual(fs.dump().shape, (8, 3))
+
+            with open_store(name, kind, mode='w') as fs:
+                self.assertEqual(fs.frames, [])
+                self.assertEqual(fs.dump().shape, (0, 0))
+            remove_store(name)
+            self.assertFalse(store_exists(name))
+
+        with self.assertRaises(ValueError):
+            open_store(name, 'excel')
+
+        # Files on disk do not answer for stores kept in memory..
+        name = join(self._dir, 'features' + EXTENSIONS['memory'])
+        with open(name, 'w'): pass
+        self.assertFalse(store_exists(name))
+        self.assertFalse(store_exists(join(self._dir, 'features.h5'), 'memory'))
+        with open_store(name, 'memory', mode='w') as fs: fs.put(self._frames[0])
+        self.assertTrue(store_exists(name))
+        remove_store(name)
+
+
+    def test_columnar_store(self):
+        name = join(self._dir, 'features.cols')
+        with open_store(name, 'columnar', mode='w') as fs:
+            fs.put(self._frames[0])
+            fs.put(self._frames[1])
+            fs.flush()
+            fs.put(self._frames[2])
+            with self.assertRaises(ValueError):
+                fs.put(self._frames[0])
+            fs.files[0].flush()
+            fs.mode = 'r'   # Simulate an interruption before closing
+
+        # Rows written after the last flush are discarded..
+        with open_store(name, 'columnar', mode='a') as fs:
+            self.assertEqual(fs.frames, [0, 2])
+            fs.put(self._frames[2])
+        with open_store(name, 'columnar', mode='r') as fs:
+            self.assertEqual(fs.frames, [0, 2, 5])
+            self.assertTrue(fs.dump().equals(pandas.concat(self._frames)))
+        remove_store(name)
@@ -0,0 +1,109 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+Tests for module `betrack.utils.filtering`.
+"""
+
+from unittest import TestCase
+from tempfile import mkdtemp
+from os.path  import join
+from shutil   import rmtree
+from numpy.random import RandomState
+import pickle
+import pandas
+import trackpy
+
+from betrack.utils.featurestore import STORES, EXTENSIONS, open_store
+from betrack.utils.filtering    import *
+
+
+class TestFiltering(TestCase):
+
+    def setUp(self):
+        self._dir = mkdtemp()
+
+        # Trajectories of random length and size..
+        rs   = RandomState(0)
+        rows = []
+        for p in range(0, 40):
+            start = rs.randint(0, 20)
+            size  = rs.uniform(1, 5)
+            for t in range(start, start + rs.randint(1, 10)):
+                rows.append(dict(y=rs.uniform(0, 100), x=rs.uniform(0, 100),
+                                 size=size + rs.uniform(-0.5, 0.5), frame=t, particle=p))
+        self._tracks = pandas.DataFrame(rows, columns=['y', 'x', 'size', 'frame', 'particle'])
+        self._tracks = self._tracks.sort_values(['frame', 'particle'])
+
+    def tearDown(self):
+        rmtree(self._dir)
+
+
+    def test_track_statistics(self):
+        name = join(self._dir, 'linked.h5')
+        with open_store(name, 'hdf', mode='w') as s:
+            for fn, df in self._tracks.groupby('frame'): s.put(df)
+        with open_store(name, 'hdf', mode='r') as s:
+            lengths, sizes = track_statistics(s)
+        grouped = self._tracks.groupby('particle')
+        self.assertEqual(list(lengths[0:40]), list(grouped.size()))
+        self.assertEqual(sum(lengths[40:]), 0)
+        self.assertEqual(len(sizes), len(lengths))
+        self.assertAlmostEqual(sizes[3], grouped['size'].sum()[3])
+
+
+    def test_filter_store(self):
+        for kwargs in [dict(stubs_threshold=5),
+                       dict(clusters_threshold=3),
+                       dict(clusters_quantile=0.5),
+                       dict(stubs_threshold=4, clusters_quantile=0.8),
+                       dict(stubs_threshold=100)]:
+            expected = self._tracks
+            if 'stubs_threshold' in kwargs:
+                expected = trackpy.filter_stubs(expected, threshold=kwargs['stubs_threshold'])
+            if len(expected) > 0 and ('clusters_threshold' in kwargs or
+                                      'clusters_quantile' in kwargs):
+                expected = trackpy.filter_clusters(expected,
+                                                   quantile=kwargs.get('clusters_quantile'),
+                                                   threshold=kwargs.get('clusters_threshold'))
+            for kind in STORES:
+                source      = join(self._dir, 'linked' + EXTENSIONS[kind])
+                destination = join(self._dir, 'filter' + EXTENSIONS[kind])
+                with open_store(source, kind, mode='w') as s:
+                    for fn, df in self._tracks.groupby('frame'): s.put(df)
+                nrows = filter_store(source, destination, kind=kind, **kwargs)
+                self.assertEqual(nrows, len(expected))
+                with open_store(destination, kind, mode='r') as d:
+                    filtered = d.dump()
+                if nrows == 0: continue
+                if kind == 'hdf': self.assertTrue(filtered.equals(expected))
+                self.assertTrue(filtered.reset_index(drop=True).equals(
+                                expected.reset_index(drop=True)))
+
+        with open_store(source, kind, mode='w') as s:
+            for fn, df in self._tracks.groupby('frame'): s.put(df.drop('size', axis=1))
+        with self.assertRaises(ValueError):
+            filter_store(source, destination, kind=kind, clusters_quantile=0.5)
+
+
+    def test_stub_filter(self):
+        for memory in [0, 2]:
+            for threshold in [1, 4, 100]:
+                expected = trackpy.filter_stubs(self._tracks, threshold=threshold)
+                stubs    = StubFilter(threshold, memory=memory)
+                frames   = []
+                for fn, df in self._tracks.groupby('frame'):
+                    frames.extend(stubs.push(df))
+                    # State can be saved at any frame..
+                    stubs = pickle.loads(pickle.dumps(stubs))
+                frames.extend(stubs.flush())
+                self.assertEqual(len(stubs.pending), 0)
+                self.assertEqual(len(stubs.decided), 0)
+                if len(expected) == 0:
+                    self.assertEqual(frames, [])
+                    continue
+                filtered = pandas.concat(frames)
+                self.assertTrue(filtered.reset_index(drop=True).equals(
+                                expected.reset_index(drop=True)))
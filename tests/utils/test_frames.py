@@ -9,7 +9,9 @@ Tests for module `betrack.utils.frames`.
 
 
 from unittest             import TestCase
-from numpy                import zeros, uint8
+from tempfile             import NamedTemporaryFile
+from os                   import remove
+from numpy                import zeros, uint8, arange, load
 from betrack.utils.frames import *
 
 class TestFrames(TestCase):
@@ -49,3 +51,25 @@ class TestFrames(TestCase):
         self.assertEqual(fg[0, 0, 2], f[0, 0, 0])
         self.assertEqual(fg[0, 0, 1], f[0, 0, 1])
         self.assertEqual(fg[0, 0, 0], f[0, 0, 2])
+
+
+    def test_cache_frames(self):
+        frames = [zeros((10, 10), dtype=uint8) + uint8(i) for i in arange(0, 5)]
+        fc     = cache_frames(frames, 1, 4)
+        self.assertEqual(fc.shape, (3, 10, 10))
+        self.assertEqual(fc.dtype, uint8)
+        self.assertEqual(fc[0, 0, 0], 1)
+        self.assertEqual(fc[2, 0, 0], 3)
+
+        cf = NamedTemporaryFile(suffix='.npy', delete=False)
+        cf.close()
+        fc = cache_frames(frames, 0, 5, filename=cf.name)
+        del fc
+        fc = load(cf.name, mmap_mode='r')
+        self.assertEqual(fc.shape, (5, 10, 10))
+        self.assertEqual(fc[4, 0, 0], 4)
+        del fc
+        remove(cf.name)
+
+        with self.assertRaises(ValueError):
+            fc = cache_frames(frames, 3, 3)
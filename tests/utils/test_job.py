@@ -11,13 +11,17 @@ Tests for our module `betrack.utils.job`.
 from unittest             import TestCase, skipIf
 from tempfile             import NamedTemporaryFile
 from numpy                import arange, array, zeros, uint8
-from pandas               import DataFrame
+from pandas               import DataFrame, concat
 from cv2                  import VideoWriter, VideoWriter_fourcc
 from os                   import remove, name
-from os.path              import isfile
+from os.path              import isfile, getsize, basename
 from sys                  import version, platform
 from betrack.utils.job    import *
 from betrack.utils.parser import open_configuration
+from betrack.utils.writers import pyarrow
+import pandas
+import numpy
+import json
 
 class TestJob(TestCase):
 
@@ -146,9 +150,129 @@ class TestJob(TestCase):
         job.export_trajectories('json')
         self.assertTrue(isfile(job.jsontracks))
         remove(job.jsontracks)
+
+        job.export_trajectories('ndjson')
+        self.assertTrue(isfile(job.ndjsontracks))
+        remove(job.ndjsontracks)
+
+        job.export_trajectories('npy')
+        self.assertEqual(len(numpy.load(job.npytracks)), 10)
+        remove(job.npytracks)
+
+        job.compression = 'gzip'
+        job.export_trajectories('csv')
+        self.assertEqual(job.tracks_file('csv'), job.csvtracks + '.gz')
+        self.assertEqual(len(pandas.read_csv(job.tracks_file('csv'))), 10)
+        self.assertEqual(job.exportstats[1], getsize(job.tracks_file('csv')))
+        remove(job.tracks_file('csv'))
+        remove(job.jsonmeta)
+
+        job.release_memory()
+
+
+    @skipIf(pyarrow is None, 'Skip if pyarrow is not installed')
+    def test_job_export_arrow(self):
+        job         = Job(self._vf.name)
+        job.margins = [10, 100, 10, 100]
+        job.load_frames()
+        dflink      = DataFrame(data={'x': [1.0, 2, 3, 4, 5, 6, 7, 8, 9, 10],
+                                      'y': [3.0, 4, 3, 4, 3, 4, 3, 4, 3,  4],
+                                      'frame': [0, 0, 1, 1, 2, 2, 3, 3, 4, 4],
+                                      'particle': [0, 1] * 5})
+
+        job.dflink = dflink.copy()
+        self.assertEqual(job.export_trajectories('parquet', summary=True, rowgroup=2), 10)
+        f = pyarrow.parquet.ParquetFile(job.parquettracks)
+        self.assertEqual([f.metadata.row_group(i).num_rows for i in range(0, 3)], [4, 4, 2])
+        tracks = pandas.read_parquet(job.parquettracks)
+        self.assertEqual(list(tracks.x), list(dflink.x + 10))
+        self.assertEqual(len(pandas.read_parquet(job.parquetsummary)), 2)
+        remove(job.parquettracks)
+        remove(job.parquetsummary)
+
+        job.dflink = dflink.copy()
+        self.assertEqual(job.export_trajectories('feather', summary=True), 10)
+        self.assertTrue(pandas.read_feather(job.feathertracks).equals(tracks))
+        self.assertEqual(len(pandas.read_feather(job.feathersummary)), 2)
+        remove(job.feathertracks)
+        remove(job.feathersummary)
+        remove(job.jsonmeta)
         job.release_memory()
 
 
+    def test_job_export_shards(self):
+        job         = Job(self._vf.name)
+        job.margins = [10, 100, 10, 100]
+        job.load_frames()
+        dflink      = DataFrame(data={'x': [1.0, 2, 3, 4, 5, 6, 7, 8, 9, 10],
+                                      'y': [3.0, 4, 3, 4, 3, 4, 3, 4, 3,  4],
+                                      'frame': [0, 0, 1, 1, 2, 2, 3, 3, 4, 4],
+                                      'particle': [0, 1] * 5})
+
+        job.dflink      = dflink.copy()
+        job.compression = 'gzip'
+        self.assertEqual(job.export_trajectories('csv', summary=True, shards=2), 10)
+        self.assertFalse(isfile(job.tracks_file('csv')))
+        with open(job.shards_file('csv'), 'r') as f: manifest = json.load(f)
+        self.assertEqual(manifest['exportas'], 'csv')
+        self.assertEqual(manifest['nframes'], 2)
+        self.assertEqual([(s['start'], s['stop'], s['nrows']) for s in manifest['shards']],
+                         [(0, 2, 4), (2, 4, 4), (4, 6, 2)])
+        self.assertEqual(manifest['shards'][0]['file'], basename(job.shard_file('csv', 0)))
+        self.assertTrue(job.shard_file('csv', 2).endswith('-tracks-002.csv.gz'))
+        tracks = concat([pandas.read_csv(job.shard_file('csv', k), index_col=0)
+                         for k in range(0, 3)])
+        self.assertEqual(list(tracks.x), list(dflink.x + 10))
+        self.assertEqual(len(pandas.read_csv(job.summary_file('csv'))), 2)
+        with open(job.jsonmeta, 'r') as f: self.assertEqual(json.load(f)['shards'], 2)
+
+        # Exporting again removes the previous shards..
+        job.dflink = dflink[dflink.frame < 2].copy()
+        self.assertEqual(job.export_trajectories('csv', shards=2), 4)
+        self.assertTrue(isfile(job.shard_file('csv', 0)))
+        self.assertFalse(isfile(job.shard_file('csv', 1)))
+        job.remove_tracks('csv')
+        self.assertFalse(isfile(job.shard_file('csv', 0)))
+        self.assertFalse(isfile(job.shards_file('csv')))
+        remove(job.summary_file('csv'))
+        remove(job.jsonmeta)
+        job.release_memory()
+
+
+    def test_job_iter_trajectories(self):
+        job = Job(self._vf.name)
+        job.margins = [10, 100, 20, 100]
+        job.load_frames()
+        df  = DataFrame({'y': arange(0, 8.0), 'x': arange(0, 8.0),
+                         'frame': [0, 0, 2, 3, 3, 5, 7, 9], 'particle': [0, 1] * 4})
+        job.dflink = df
+        job.store_trajectories(job.h5linked)
+        job.load_trajectories(job.h5linked)
+        job.chunksize = 2
+        job.load_trajectories(job.h5linked)
+
+        # Out of core, only the frames of the range are read..
+        chunks = list(job.iter_trajectories(2, 7))
+        self.assertEqual([list(c['frame']) for c in chunks], [[2, 3, 3], [5]])
+        self.assertEqual(list(concat(chunks)['y']), [22.0, 23.0, 24.0, 25.0])
+        self.assertEqual(len(concat(job.iter_trajectories())), 8)
+        self.assertEqual(list(job.iter_trajectories(10, 12)), [])
+        job.release_memory()
+
+
+    def test_job_variant(self):
+        job         = Job(self._vf.name)
+        job.load_frames()
+        variant     = job.variant('-v1')
+        self.assertEqual(variant.frames, None)
+        self.assertEqual(variant.h5storage, job.h5storage)
+        self.assertNotEqual(variant.h5linked, job.h5linked)
+        self.assertTrue(variant.csvtracks.endswith('-v1-tracks.csv'))
+        self.assertEqual(variant.tempfiles, [variant.h5linked, variant.h5filtered])
+        self.assertFalse(variant.valid_margins())
+        job.release_memory()
+
+        
     def test_job_valid_margins(self):
         job = Job(self._vf.name)
         job.load_frames()
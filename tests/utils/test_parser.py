@@ -343,3 +343,17 @@ class TestParser(TestCase):
         config = {'test-parse-str-KeyError': 0}
         with self.assertRaises(KeyError):        
             fname = parse_str(config, 'missing-attribute')
+
+
+    def test_expand_sweep(self):
+        keys     = ['test-a', 'test-b', 'test-c']
+        variants = expand_sweep({'test-a': 1, 'test-d': [1, 2]}, keys)
+        self.assertEqual(variants, [{}])
+
+        variants = expand_sweep({'test-a': [1, 2], 'test-b': 3, 'test-c': [4, 5, 6]}, keys)
+        self.assertEqual(len(variants), 6)
+        self.assertEqual(variants[0], {'test-a': 1, 'test-c': 4})
+        self.assertEqual(variants[5], {'test-a': 2, 'test-c': 6})
+
+        with self.assertRaises(ValueError):
+            variants = expand_sweep({'test-a': []}, keys)
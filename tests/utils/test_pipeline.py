@@ -0,0 +1,67 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+Tests for module `betrack.utils.pipeline`.
+"""
+
+from unittest  import TestCase
+from threading import Lock
+from time      import sleep
+from numpy.random import RandomState
+
+from betrack.utils.pipeline import *
+
+
+class Counter(object):
+    def __init__(self):
+        self.n = 0
+
+    def update(self, n):
+        self.n += n
+
+
+class TestPipeline(TestCase):
+
+    def test_run_pipeline(self):
+        rs      = RandomState(0)
+        delays  = rs.uniform(0, 0.005, 50)
+        lock    = Lock()
+        flight  = [0, 0]
+        encoded = []
+
+        def decode(i):
+            with lock:
+                flight[0] += 1
+                flight[1]  = max(flight)
+            return i
+
+        def process(i):
+            sleep(delays[i])
+            return i * 2
+
+        def encode(i):
+            with lock: flight[0] -= 1
+            encoded.append(i)
+
+        # Items are encoded in order, with a bounded number in flight..
+        progress = [Counter(), Counter(), Counter()]
+        n = run_pipeline(range(0, 50), decode, process, encode, nworkers=4, maxsize=6,
+                         progress=progress)
+        self.assertEqual(n, 50)
+        self.assertEqual(encoded, [i * 2 for i in range(0, 50)])
+        self.assertTrue(flight[1] <= 6)
+        self.assertEqual([p.n for p in progress], [50, 50, 50])
+        self.assertEqual(run_pipeline([], decode, process, encode), 0)
+
+        # Errors raised by any stage are raised again..
+        def fail(i):
+            if i == 20: raise RuntimeError(str(i))
+            return i
+
+        for stages in [(fail, process, encode), (decode, fail, encode),
+                       (decode, process, lambda i: fail(i // 2))]:
+            with self.assertRaises(RuntimeError):
+                run_pipeline(range(0, 50), *stages, nworkers=3)
@@ -0,0 +1,47 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+Tests for module `betrack.utils.sprites`.
+"""
+
+from unittest import TestCase
+from numpy    import uint8, abs
+from numpy.random import RandomState
+from cv2      import putText, circle, FONT_HERSHEY_DUPLEX, LINE_AA
+
+from betrack.utils.sprites import *
+
+
+class TestSprites(TestCase):
+
+    def test_draw(self):
+        rs        = RandomState(0)
+        frame     = rs.randint(0, 256, (200, 300, 3)).astype(uint8)
+        ids       = [0, 7, 42, 123, 9999]
+        positions = [(50, 50), (100, 150), (290, 190), (2, 2), (-8, 120)]
+        for style in [(), (FONT_HERSHEY_DUPLEX, 1.2, (200, 10, 30), 1, 5)]:
+            sprites  = ParticleSprites(*style)
+            expected = frame.copy()
+            for p, (x, y) in zip(ids, positions):
+                putText(expected, str(p), (x + 3, y + 3), sprites.font, sprites.fontscale,
+                        sprites.color, sprites.thickness, lineType=LINE_AA,
+                        bottomLeftOrigin=True)
+                circle(expected, (x, y), sprites.radius, sprites.color, thickness=-1,
+                       lineType=LINE_AA)
+            drawn = frame.copy()
+            sprites.draw(drawn, ids, positions)
+
+            # Pixels differ by rounding, except where the text covers the circle..
+            diff = abs(drawn.astype(int) - expected.astype(int)).max(axis=2)
+            self.assertTrue((drawn != frame).any())
+            self.assertTrue((diff > 2).sum() <= 10)
+            self.assertEqual(len(sprites.sprites), len(ids))
+
+        # The least recently drawn sprites are discarded..
+        sprites = ParticleSprites(maxsize=2)
+        sprites.draw(frame.copy(), [1, 2, 1, 3], [(10, 10)] * 4)
+        self.assertEqual(list(sprites.sprites.keys()), [1, 3])
+        self.assertEqual(sprites.style(), (sprites.font, 0.7, (25, 100, 255), 2, 3))
@@ -0,0 +1,82 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+Tests for module `betrack.utils.stages`.
+"""
+
+from unittest import TestCase
+from tempfile import NamedTemporaryFile
+from os       import remove
+
+from betrack.utils.stages import *
+from betrack.utils.job    import Job
+from betrack.utils.featurestore import open_store, remove_store
+
+
+class TestStages(TestCase):
+
+    def setUp(self):
+        self._f = NamedTemporaryFile(mode='w', suffix='.avi', delete=False)
+        self._f.write('video')
+        self._f.close()
+
+    def tearDown(self):
+        remove(self._f.name)
+
+
+    def test_video_signature(self):
+        s = video_signature(self._f.name)
+        self.assertEqual(s, video_signature(self._f.name))
+        self.assertEqual(len(video_signature(self._f.name, digest=True)), 40)
+        with open(self._f.name, 'a') as f: f.write('more')
+        self.assertNotEqual(s, video_signature(self._f.name))
+
+
+    def test_plan_stages(self):
+        job    = Job(self._f.name)
+        stages = [Stage('a', ['x-'], [], lambda j: j.video),
+                  Stage('b', ['y-'], ['a'], lambda j: j.video),
+                  Stage('c', ['z-'], ['a'], lambda j: j.video + '.missing')]
+        config = {'x-1': 1, 'y-1': 2, 'z-1': 3}
+        plan   = plan_stages(stages, 'sig', job, config, {})
+        self.assertEqual([r for s, d, r in plan], ['not cached', 'input a changed',
+                                                   'input a changed'])
+
+        manifest = dict((s.name, d) for s, d, r in plan)
+        plan     = plan_stages(stages, 'sig', job, config, manifest)
+        self.assertEqual([r for s, d, r in plan], [None, None, 'artifact missing'])
+        plan     = plan_stages(stages, 'sig', job, config, manifest, force=True)
+        self.assertEqual([r for s, d, r in plan], ['forced'] * 3)
+
+        config['y-1'] = 4
+        plan     = plan_stages(stages, 'sig', job, config, manifest)
+        self.assertEqual([r for s, d, r in plan], [None, 'configuration changed',
+                                                   'artifact missing'])
+        plan     = plan_stages(stages, 'new', job, config, manifest)
+        self.assertEqual([r for s, d, r in plan], ['configuration changed',
+                                                   'input a changed', 'input a changed'])
+
+        # Feature stores kept in memory are not answered for by files on disk..
+        stages   = [Stage('d', ['x-'], [], lambda j: j.video + '.mem')]
+        manifest = dict((s.name, d) for s, d, r in plan_stages(stages, 'sig', job, config, {}))
+        with open(self._f.name + '.mem', 'w') as f: f.write('stale')
+        plan     = plan_stages(stages, 'sig', job, config, manifest)
+        self.assertEqual([r for s, d, r in plan], ['artifact missing'])
+        open_store(self._f.name + '.mem', 'memory', 'w').close()
+        plan     = plan_stages(stages, 'sig', job, config, manifest)
+        self.assertEqual([r for s, d, r in plan], [None])
+        remove_store(self._f.name + '.mem')
+
+
+    def test_manifest(self):
+        f = NamedTemporaryFile(mode='w', suffix='.json', delete=False)
+        f.write('not json')
+        f.close()
+        self.assertEqual(load_manifest(f.name), {})
+        save_manifest(f.name, {'a': '123'})
+        self.assertEqual(load_manifest(f.name), {'a': '123'})
+        remove(f.name)
+        self.assertEqual(load_manifest(f.name), {})
@@ -0,0 +1,60 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+Tests for module `betrack.utils.summary`.
+"""
+
+from unittest import TestCase
+from numpy    import hypot, isnan
+import pandas
+
+from betrack.utils.summary import *
+
+
+class TestSummary(TestCase):
+
+    def setUp(self):
+        # Particle 0 moves along x, particle 1 along a diagonal with a gap..
+        rows = [dict(y=0.0, x=float(t), mass=10.0 + t, size=2.0, frame=t, particle=0)
+                for t in range(0, 6)]
+        rows += [dict(y=float(t), x=float(t), mass=5.0, size=3.0, frame=t, particle=1)
+                 for t in [1, 2, 4, 5]]
+        rows += [dict(y=7.0, x=7.0, mass=1.0, size=1.0, frame=3, particle=2)]
+        self._tracks = pandas.DataFrame(rows).sort_values('frame', kind='mergesort')
+
+
+    def test_summary(self):
+        tables = []
+        for frames in [6, 1, 4]:
+            ts = TrackSummary()
+            for t in range(0, 6, frames):
+                ts.update(self._tracks[(self._tracks.frame >= t) &
+                                       (self._tracks.frame < t + frames)])
+            tables.append(ts.table())
+
+        table = tables[0]
+        self.assertEqual(list(table.index), [0, 1, 2])
+        self.assertEqual(list(table.columns), ['start', 'end', 'length', 'mass', 'size',
+                                               'path', 'speed', 'xmin', 'xmax',
+                                               'ymin', 'ymax'])
+        self.assertEqual(list(table['start']), [0, 1, 3])
+        self.assertEqual(list(table['end']), [5, 5, 3])
+        self.assertEqual(list(table['length']), [6, 4, 1])
+        self.assertEqual(table.loc[0, 'mass'], 12.5)
+        self.assertEqual(table.loc[1, 'size'], 3.0)
+        self.assertEqual(table.loc[0, 'path'], 5.0)
+        self.assertAlmostEqual(table.loc[1, 'path'], 4 * hypot(1, 1))
+        self.assertAlmostEqual(table.loc[1, 'speed'], hypot(1, 1))
+        self.assertTrue(isnan(table.loc[2, 'speed']))
+        self.assertEqual(list(table.loc[1, ['xmin', 'xmax', 'ymin', 'ymax']]),
+                         [1.0, 5.0, 1.0, 5.0])
+        for t in tables[1:]:
+            pandas.testing.assert_frame_equal(t, table)
+
+        self.assertEqual(len(TrackSummary().table()), 0)
+        ts = TrackSummary()
+        ts.update(self._tracks.drop(['mass', 'size'], axis=1))
+        self.assertFalse('mass' in ts.table().columns)
@@ -0,0 +1,157 @@
+#------------------------------------------------------------------------------#
+# Copyright 2018 Gabriele Valentini. All rights reserved. Use of this source   #
+# code is governed by a MIT license that can be found in the LICENSE file.     #
+#------------------------------------------------------------------------------#
+
+"""
+Tests for module `betrack.utils.writers`.
+"""
+
+from unittest import TestCase
+from tempfile import mkdtemp
+from os.path  import join
+from shutil   import rmtree
+from numpy.random import RandomState
+import pandas
+import json
+import numpy
+import tables
+
+from betrack.utils.featurestore import open_store
+from betrack.utils.writers      import *
+
+
+class TestWriters(TestCase):
+
+    def setUp(self):
+        self._dir = mkdtemp()
+        rs        = RandomState(0)
+        self._df  = pandas.DataFrame(rs.uniform(0, 100, (1000, 2)), columns=['y', 'x'])
+        self._df['frame']    = [i // 10 for i in range(0, 1000)]
+        self._df['particle'] = [i % 10 for i in range(0, 1000)]
+
+    def tearDown(self):
+        rmtree(self._dir)
+
+
+    def test_write_csv(self):
+        name   = join(self._dir, 'tracks.csv')
+        chunks = [self._df.iloc[i:i + 300] for i in range(0, 1000, 300)]
+        for precision in [None, 2]:
+            expected = self._df.to_csv(None, float_format=float_format(precision))
+            for nprocesses in [1, 2]:
+                for nrows in [50, 1000]:
+                    n = write_csv(name, iter(chunks), precision=precision,
+                                  nprocesses=nprocesses, nrows=nrows)
+                    self.assertEqual(n, 1000)
+                    with open(name, 'r') as f: self.assertEqual(f.read(), expected)
+
+        # Rows read framewise from a feature store..
+        store = join(self._dir, 'linked.h5')
+        with open_store(store, 'hdf', mode='w') as s:
+            for fn, df in self._df.groupby('frame'): s.put(df)
+        with open_store(store, 'hdf', mode='r') as s:
+            self.assertEqual(write_csv(name, s, nprocesses=2), 1000)
+        self.assertTrue(pandas.read_csv(name, index_col=0,
+                                        float_precision='round_trip').equals(self._df))
+
+        self.assertEqual(write_csv(name, []), 0)
+        self.assertEqual(float_format(3), '%.3f')
+
+
+    def test_progressive_writer(self):
+        name   = join(self._dir, 'tracks.csv')
+        frames = [df for fn, df in self._df.groupby('frame')]
+        with open(name, 'w') as f:
+            writer = ProgressiveWriter(f, 'csv', memory=2, nframes=5, offset=[1, 2])
+            for fn in range(0, 9): writer.push([frames[fn]], fn)
+            # Frames older than 2 frames are written every 5 frames..
+            with open(name, 'r') as r: self.assertEqual(len(r.readlines()), 1 + 2 * 10)
+            writer.push([frames[9]], 9)
+            with open(name, 'r') as r: self.assertEqual(len(r.readlines()), 1 + 7 * 10)
+            writer.close(frames[10:])
+        self.assertEqual(writer.nrows, 1000)
+        translated   = self._df.copy()
+        translated.x = translated.x + 1
+        translated.y = translated.y + 2
+        with open(name, 'r') as f: self.assertEqual(f.read(), translated.to_csv(None))
+
+        name = join(self._dir, 'tracks.ndjson')
+        with open(name, 'w') as f:
+            writer = ProgressiveWriter(f, 'ndjson', nframes=3)
+            writer.write(frames[0:50])
+            for fn in range(50, 100): writer.push([frames[fn]], fn)
+            writer.close()
+        expected = join(self._dir, 'expected.ndjson')
+        write_ndjson(expected, [self._df])
+        with open(name, 'r') as f, open(expected, 'r') as e: self.assertEqual(f.read(), e.read())
+
+
+    def test_write_hdf(self):
+        name   = join(self._dir, 'tracks.h5')
+        chunks = [self._df.iloc[i:i + 300] for i in range(0, 1000, 300)]
+        self.assertEqual(write_hdf(name, iter(chunks), expectedrows=1000), 1000)
+        self.assertTrue(pandas.read_hdf(name, 'dflink').equals(self._df))
+        self.assertTrue(pandas.read_hdf(name, 'dflink', where='particle == 3').equals(
+                        self._df[self._df.particle == 3]))
+        with tables.open_file(name) as f:
+            table = f.root.dflink.table
+            self.assertEqual(table.filters.complib, 'blosc:zstd')
+            self.assertTrue(table.colindexes['frame'].is_csi)
+            self.assertTrue(table.colindexes['particle'].is_csi)
+
+        # One table for each range of frames..
+        self.assertEqual(write_hdf(name, iter(chunks), nframes=30), 1000)
+        with pandas.HDFStore(name, mode='r') as hdf:
+            self.assertEqual(sorted(hdf.keys()), ['/dflink/f0', '/dflink/f30',
+                                                  '/dflink/f60', '/dflink/f90'])
+            self.assertTrue(hdf['dflink/f30'].equals(self._df[(self._df.frame >= 30) &
+                                                              (self._df.frame < 60)]))
+
+        self.assertEqual(write_hdf(name, [self._df[['y', 'x']]]), 1000)
+        self.assertEqual(write_hdf(name, []), 0)
+
+
+    def test_write_npy(self):
+        name   = join(self._dir, 'tracks.npy')
+        chunks = [self._df.iloc[i:i + 300] for i in range(0, 1000, 300)]
+        self.assertEqual(write_npy(name, iter(chunks)), 1000)
+        tracks = numpy.load(name, mmap_mode='r')
+        self.assertEqual(tracks.dtype.names, ('y', 'x', 'frame', 'particle'))
+        for c in self._df.columns:
+            self.assertTrue((tracks[c] == self._df[c].values).all())
+
+        rows = NpyTracks(name)
+        self.assertTrue((rows.frame(42)['particle'] == range(0, 10)).all())
+        self.assertTrue((rows.particle(3)['frame'] == range(0, 100)).all())
+        self.assertTrue((rows.particle(3)['x'] == self._df.x[self._df.particle == 3]).all())
+        self.assertEqual(len(rows.frame(100)), 0)
+        self.assertEqual(len(rows.particle(10)), 0)
+        del tracks, rows
+
+        self.assertEqual(write_npy(name, [self._df[['y', 'x']]]), 1000)
+        self.assertEqual(numpy.load(name).dtype.names, ('y', 'x'))
+        self.assertEqual(write_npy(name, []), 0)
+        self.assertEqual(len(numpy.load(name)), 0)
+
+
+    def test_write_ndjson(self):
+        name   = join(self._dir, 'tracks.ndjson')
+        chunks = [self._df.iloc[i:i + 300] for i in range(0, 1000, 300)]
+        for nprocesses in [1, 2]:
+            for nrows in [50, 1000]:
+                n = write_ndjson(name, iter(chunks), nprocesses=nprocesses, nrows=nrows)
+                self.assertEqual(n, 1000)
+                with open(name, 'r') as f: lines = f.readlines()
+                self.assertEqual(len(lines), 1000)
+                self.assertEqual(json.loads(lines[12]),
+                                 dict((k, v) for k, v in self._df.iloc[12].items()))
+                tracks = pandas.read_json(name, lines=True)
+                self.assertEqual(list(tracks.columns), list(self._df.columns))
+                self.assertTrue((abs(tracks - self._df) < 1e-12).all().all())
+
+        write_ndjson(name, chunks, precision=2)
+        with open(name, 'r') as f: record = json.loads(f.readline())
+        self.assertEqual(record['x'], round(self._df.x[0], 2))
+        self.assertEqual(write_ndjson(name, []), 0)
+        with open(name, 'r') as f: self.assertEqual(f.read(), '')